@@ -1,4 +1,5 @@
 # app.py
+import os
 import random
 
 import streamlit as st
@@ -7,7 +8,7 @@ import altair as alt
 import numpy as np
 import time
 
-from app.data_loader import load_raw_data
+from app.data_loader import load_raw_data, append_draws, history_version
 from app.ui_theme import inject_neobrutalist_theme
 from app.metrics import (
     compute_main_number_freq,
@@ -17,12 +18,19 @@ from app.metrics import (
     compute_hot_cold_stars,
 )
 
-from app.updater import update_historico_from_api
+from app.codec import encode_numbers, encode_stars, masks_to_strings
+from app.exact_odds import block_exact_odds
+from app.feature_store import lookup_features, decade_counts
+from app.updater import on_history_change
+from app.history_refresher import start_refresher, request_refresh
 from app.generator import generate_block
-from app.combinations_store import save_block
 from app.generator import generate_block, SUM_RANGE_BY_SERIE
-from app.combinations_store import save_block, load_last_n
-from app.simulator import simulate_strategy
+from app.store_backend import get_store, store_path
+from app.hit_report import lifetime_hit_report
+from app.hit_ledger import sync_ledger, ledger_last_draw, ledger_report, ledger_entries
+from app.simulator import simulate_strategy, compare_strategies
+from app.backtest import backtest_strategy
+from app.synthetic import simulate_synthetic
 
 st.set_page_config(page_title="El dado de Schrödinger", layout="wide")
 inject_neobrutalist_theme()
@@ -34,9 +42,59 @@ if "last_block" not in st.session_state:
 if "last_manual" not in st.session_state:
     st.session_state["last_manual"] = None
 
-@st.cache_data
-def get_data() -> pd.DataFrame:
-    return load_raw_data()
+# Store de combinaciones guardadas: CSV o SQLite según EUROMILLONES_STORE
+store = get_store()
+
+
+@st.cache_resource
+def get_history() -> dict:
+    """
+    Histórico en memoria para todas las sesiones. Se lee el CSV una sola vez;
+    después lo amplía el evento de app.updater con los sorteos añadidos.
+    """
+    df_hist = load_raw_data()
+    # (versión, df) en una sola clave: se sustituye de golpe desde el hilo
+    # de actualización y nadie ve un df con la versión de otro
+    history = {"current": (history_version(df_hist), df_hist)}
+
+    def _extend(event: dict) -> None:
+        df_new = append_draws(history["current"][1], event["added"])
+        history["current"] = (history_version(df_new), df_new)
+
+    on_history_change(_extend)
+    return history
+
+
+@st.cache_resource
+def get_refresher() -> dict:
+    """Hilo de actualización del histórico (app.history_refresher), uno por proceso."""
+    get_history()  # suscrito a on_history_change antes de la primera consulta
+    return start_refresher()
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def get_repeated_combinations(hist_version: str, _df_hist: pd.DataFrame) -> pd.DataFrame:
+    # Solo depende del histórico: se recalcula cuando cambia su versión
+    return compute_repeated_combinations(_df_hist)
+
+
+def add_matches(rows: pd.DataFrame, draw_num_mask, draw_star_mask) -> pd.DataFrame:
+    """Columnas nums_coinciden / estrellas_coinciden para unas pocas filas del store."""
+    rows = rows.copy()
+    rows["nums_coinciden"] = masks_to_strings(
+        rows["num_mask"].to_numpy(dtype=np.uint64) & draw_num_mask
+    )
+    rows["estrellas_coinciden"] = masks_to_strings(
+        rows["star_mask"].to_numpy(dtype=np.uint16) & draw_star_mask
+    )
+    return rows
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def get_lifetime_report(store_stat: tuple, hist_version: str, _df_hist: pd.DataFrame, start, end):
+    # store_stat = firma del store (store_signature): cambia en cuanto se guarda algo;
+    # hist_version cambia en cuanto entra un sorteo nuevo
+    return lifetime_hit_report(store.load_all(), _df_hist, start, end)
 
 
 # --- SIDEBAR ---
@@ -45,44 +103,41 @@ st.sidebar.image(CAT_IMAGE_PATH, use_container_width=True)
 
 st.sidebar.title("El dado de Schrödinger")
 
-cooldown_seconds = 60  # por ejemplo, 1 minuto
-
-last_update = st.session_state.get("last_update_attempt")
-if last_update is not None:
-    elapsed = time.time() - last_update
-else:
-    elapsed = cooldown_seconds + 1  # para permitir la primera vez
-
-disabled = elapsed < cooldown_seconds
+# La consulta a la API la hace un hilo en segundo plano (periódicamente y al
+# pulsar el botón): el script nunca espera a la red. Los sorteos nuevos
+# entran en get_history() y solo se recalculan las cachés con su versión.
+refresher = get_refresher()
+blocked_for = refresher["blocked_until"] - time.time()
 
 update_clicked = st.sidebar.button(
     " ",
     key="btn_update_api",
-    disabled=disabled,
+    disabled=blocked_for > 0,
 )
 
 if update_clicked:
-    try:
-        added = update_historico_from_api()
-        st.session_state["last_update_attempt"] = time.time()
-        get_data.clear()
-        if added == 0:
-            st.sidebar.info("Histórico ya estaba actualizado.")
-        else:
-            st.sidebar.success(f"Actualizado: {added} sorteos nuevos.")
-    except Exception as e:
-        msg = str(e)
-        if "429" in msg:
-            st.sidebar.warning(
-                "La API externa ha devuelto 429 (Too Many Requests).\n\n"
-                "Espera unos minutos antes de volver a actualizar."
-            )
-        else:
-            st.sidebar.error(f"Error al actualizar: {e}")
+    request_refresh(refresher)
+    st.sidebar.info("Buscando sorteos nuevos en segundo plano...")
+elif refresher["running"]:
+    st.sidebar.info("Buscando sorteos nuevos en segundo plano...")
+elif blocked_for > 0:
+    st.sidebar.warning(
+        "La API externa ha devuelto 429 (Too Many Requests).\n\n"
+        f"Vuelve a intentarlo en unos {blocked_for:.0f} s."
+    )
+elif refresher["last_error"]:
+    st.sidebar.error(f"Error al actualizar: {refresher['last_error']}")
+elif refresher["last_check"] is not None:
+    added = refresher["last_added"]
+    when = refresher["last_check"].strftime("%H:%M")
+    if added:
+        st.sidebar.success(f"Actualizado ({when}): {added} sorteos nuevos.")
+    else:
+        st.sidebar.info(f"Histórico ya estaba actualizado ({when}).")
 
 st.sidebar.caption("Actualizar histórico (API)")
 
-df = get_data()
+hist_version, df = get_history()["current"]
 
 st.title("El dado de Schrödinger 🎲")
 
@@ -477,7 +532,7 @@ with tab_hist:
             )
 
             # Para el resumen usamos el histórico completo df
-            rep_df = compute_repeated_combinations(df)
+            rep_df = get_repeated_combinations(hist_version, df)
 
             # (opcional) mostrar cuántas detecta para depurar
             st.caption(f"Combinaciones repetidas detectadas en el histórico: {len(rep_df)}")
@@ -583,42 +638,15 @@ with tab_hist:
             if nums_df.empty:
                 st.write("No se pudieron calcular los patrones (valores no numéricos o vacíos).")
             else:
-                nums_arr = nums_df.to_numpy(dtype=int)
-
-                distinct_decades_list = []
-                max_same_decade_list = []
-                fechas_count_list = []
-                has_consec_list = []
-                max_run_list = []
-
-                for row in nums_arr:
-                    decades = (row - 1) // 10
-                    distinct_decades_list.append(len(np.unique(decades)))
-                    counts_dec = np.bincount(decades, minlength=5)
-                    max_same_decade_list.append(int(counts_dec.max()))
-
-                    fechas_count_list.append(int((row <= 31).sum()))
-
-                    sorted_row = np.sort(row)
-                    current_run = 1
-                    best_run = 1
-                    has_pair = False
-                    for i in range(1, len(sorted_row)):
-                        if sorted_row[i] - sorted_row[i - 1] == 1:
-                            has_pair = True
-                            current_run += 1
-                            if current_run > best_run:
-                                best_run = current_run
-                        else:
-                            current_run = 1
-                    has_consec_list.append(has_pair)
-                    max_run_list.append(best_run)
-
-                distinct_decades_arr = np.array(distinct_decades_list)
-                max_same_decade_arr = np.array(max_same_decade_list)
-                fechas_arr = np.array(fechas_count_list)
-                has_consec_arr = np.array(has_consec_list)
-                max_run_arr = np.array(max_run_list)
+                # Rasgos precalculados por rango de quinteta (lookup O(1) por sorteo)
+                feats = lookup_features(nums_df.to_numpy(dtype=int))
+                dec_counts = decade_counts(feats["decades"])
+
+                distinct_decades_arr = (dec_counts > 0).sum(axis=1)
+                max_same_decade_arr = dec_counts.max(axis=1)
+                fechas_arr = feats["le31"]
+                max_run_arr = feats["max_run"]
+                has_consec_arr = max_run_arr >= 2
 
                 def pct(mask: np.ndarray) -> float:
                     if mask.size == 0:
@@ -856,14 +884,14 @@ with tab_gen:
                 st.code(line_str)
 
         if st.button("💾 Guardar este bloque"):
-            added = save_block(
+            added = store.save_block(
                 block,
                 mode=meta.get("mode", "Estándar"),
                 note="",
             )
             st.success(
                 f"Se han guardado {added} combinaciones en "
-                "`data/combinaciones_generadas.csv`"
+                f"`data/{store_path().name}`"
             )
     else:
         st.info("Genera un bloque para poder verlo y decidir si lo guardas.")
@@ -939,6 +967,16 @@ with tab_gen:
                     f"caería en **Serie {serie_teorica}** {rango_texto}."
                 )
 
+            # Rasgos estructurales de la quinteta (tabla precalculada)
+            feats = lookup_features(nums)
+            dec_profile = decade_counts(feats["decades"])
+            st.write(
+                f"🧱 Estructura: **{int(feats['le31'])}** números ≤ 31 · "
+                f"racha máx. de consecutivos **{int(feats['max_run'])}** · "
+                f"decenas {'/'.join(str(int(c)) for c in dec_profile)} · "
+                f"score de popularidad **{int(feats['popularity'])}**"
+            )
+
             # Comprobación contra histórico
             mask_nums = (
                 (df["n1"] == nums[0])
@@ -1002,14 +1040,14 @@ with tab_gen:
                     "stars": manual_data["stars"],
                 }
             ]
-            added = save_block(
+            added = store.save_block(
                 block_manual,
                 mode="Manual",
                 note=f"Introducida a mano; suma={manual_data['sum']}",
             )
             st.success(
                 f"Combinación manual guardada en "
-                "`data/combinaciones_generadas.csv` "
+                f"`data/{store_path().name}` "
                 f"(serie={serie_guardada}, suma={manual_data['sum']})."
             )
     else:
@@ -1046,7 +1084,7 @@ with tab_check:
         )
 
         # Cargamos combinaciones generadas y guardadas
-        combos_df = load_last_n(5000)  # puedes subir/bajar este número si quieres
+        combos_df = store.load_last_n(5000)  # puedes subir/bajar este número si quieres
 
         if combos_df.empty:
             st.info(
@@ -1054,176 +1092,174 @@ with tab_check:
                 "`data/combinaciones_generadas.csv`."
             )
         else:
-            # --- Normalizar columnas para trabajar siempre con n1..n5 y s1..s2 ---
-
-            # Caso 1: formato antiguo -> 'numbers' y 'stars' como strings "12-13-25-26-47", "3-12"
-            if "numbers" in combos_df.columns and "stars" in combos_df.columns:
-                # Separar numbers en n1..n5
-                nums_split = combos_df["numbers"].astype(str).str.split("-", expand=True)
-                # Aseguramos 5 columnas
-                if nums_split.shape[1] == 5:
-                    nums_split.columns = [f"n{i}" for i in range(1, 6)]
-                    combos_df = pd.concat([combos_df, nums_split], axis=1)
-                    combos_df[[f"n{i}" for i in range(1, 6)]] = combos_df[
-                        [f"n{i}" for i in range(1, 6)]
-                    ].astype(int)
-
-                # Separar stars en s1..s2
-                stars_split = combos_df["stars"].astype(str).str.split("-", expand=True)
-                if stars_split.shape[1] == 2:
-                    stars_split.columns = ["s1", "s2"]
-                    combos_df = pd.concat([combos_df, stars_split], axis=1)
-                    combos_df[["s1", "s2"]] = combos_df[["s1", "s2"]].astype(int)
-
-            # Caso 2: por si en el futuro ya guardamos directamente n1..n5, s1..s2
-            # (o si vienen en mayúsculas N1..N5, E1/E2)
-            rename_map = {}
-            if "N1" in combos_df.columns and "n1" not in combos_df.columns:
-                rename_map.update(
-                    {
-                        "N1": "n1",
-                        "N2": "n2",
-                        "N3": "n3",
-                        "N4": "n4",
-                        "N5": "n5",
-                    }
+            st.markdown("### Comparación con tus combinaciones guardadas")
+
+            # Aciertos contra el último sorteo, del libro de aciertos (app.hit_ledger):
+            # solo se puntúan las filas guardadas y los sorteos nuevos desde la última vez
+            draw_num_mask = encode_numbers(nums_draw)
+            draw_star_mask = encode_stars(stars_draw)
+
+            ledger = sync_ledger(df)
+            combos_df = combos_df.merge(
+                ledger_last_draw(ledger, combos_df["id"].to_numpy()), on="id", how="inner"
+            )
+
+            # --- Resumen por categoría de aciertos ---
+            resumen = (
+                combos_df.groupby(["aciertos_numeros", "aciertos_estrellas"])
+                .size()
+                .reset_index(name="lineas")
+                .sort_values(
+                    ["aciertos_numeros", "aciertos_estrellas"], ascending=False
                 )
-            if "S1" in combos_df.columns and "s1" not in combos_df.columns:
-                rename_map.update({"S1": "s1", "S2": "s2"})
-            if "E1" in combos_df.columns and "s1" not in combos_df.columns:
-                rename_map.update({"E1": "s1", "E2": "s2"})
+            )
 
-            if rename_map:
-                combos_df = combos_df.rename(columns=rename_map)
+            st.markdown("#### Resumen de aciertos (números + estrellas)")
+            st.dataframe(resumen)
 
-            required_cols = {"n1", "n2", "n3", "n4", "n5", "s1", "s2"}
-            if not required_cols.issubset(combos_df.columns):
-                st.error(
-                    "El archivo `combinaciones_generadas.csv` no tiene las columnas "
-                    "esperadas (n1–n5, s1–s2) ni se ha podido derivarlas de "
-                    "`numbers`/`stars`. Columnas actuales: "
-                    f"{list(combos_df.columns)}"
+            # --- Plenos (5+2) si los hubiera ---
+            exactos = combos_df[
+                (combos_df["aciertos_numeros"] == 5)
+                & (combos_df["aciertos_estrellas"] == 2)
+            ]
+
+            if exactos.empty:
+                st.success(
+                    "✅ No hay pleno **5+2** en tus combinaciones guardadas "
+                    "para el último sorteo."
                 )
             else:
-                st.markdown("### Comparación con tus combinaciones guardadas")
-
-                nums_draw_set = set(nums_draw)
-                stars_draw_set = set(stars_draw)
-
-                def compute_hits(row: pd.Series) -> pd.Series:
-                    nums_combo = {int(row[f"n{i}"]) for i in range(1, 6)}
-                    stars_combo = {int(row[f"s{i}"]) for i in range(1, 3)}
-
-                    matched_nums = sorted(nums_draw_set & nums_combo)
-                    matched_stars = sorted(stars_draw_set & stars_combo)
-
-                    return pd.Series(
-                        {
-                            "aciertos_numeros": len(matched_nums),
-                            "aciertos_estrellas": len(matched_stars),
-                            "nums_coinciden": "-".join(map(str, matched_nums))
-                            if matched_nums
-                            else "",
-                            "estrellas_coinciden": "-".join(map(str, matched_stars))
-                            if matched_stars
-                            else "",
-                        }
-                    )
+                st.error(
+                    "⚠️ ¡Hay al menos un pleno **5+2** en tus combinaciones guardadas!"
+                )
+                exactos = add_matches(exactos, draw_num_mask, draw_star_mask)
+                st.dataframe(
+                    exactos[
+                        [
+                            "timestamp",
+                            "mode",
+                            "serie",
+                            "n1",
+                            "n2",
+                            "n3",
+                            "n4",
+                            "n5",
+                            "s1",
+                            "s2",
+                            "aciertos_numeros",
+                            "aciertos_estrellas",
+                            "nums_coinciden",
+                            "estrellas_coinciden",
+                        ]
+                    ]
+                )
 
-                combos_df = combos_df.copy()
-                hits_df = combos_df.apply(compute_hits, axis=1)
-                combos_df = pd.concat([combos_df, hits_df], axis=1)
+            # --- Top 20 combinaciones que aciertan algo ---
+            st.markdown(
+                "#### Top 20 combinaciones que más se acercan al último sorteo"
+            )
 
-                # --- Resumen por categoría de aciertos ---
-                resumen = (
-                    combos_df.groupby(["aciertos_numeros", "aciertos_estrellas"])
-                    .size()
-                    .reset_index(name="lineas")
-                    .sort_values(
-                        ["aciertos_numeros", "aciertos_estrellas"], ascending=False
-                    )
+            mask_acierto = (combos_df["aciertos_numeros"] > 0) | (
+                combos_df["aciertos_estrellas"] > 0
+            )
+            combos_con_acierto = combos_df[mask_acierto]
+
+            if combos_con_acierto.empty:
+                st.info(
+                    "Ninguna combinación guardada acierta números ni estrellas "
+                    "en este sorteo."
+                )
+            else:
+                top_hits = combos_con_acierto.sort_values(
+                    ["aciertos_numeros", "aciertos_estrellas"],
+                    ascending=False,
+                ).head(20)
+                top_hits = add_matches(top_hits, draw_num_mask, draw_star_mask)
+
+                st.dataframe(
+                    top_hits[
+                        [
+                            "timestamp",
+                            "mode",
+                            "serie",
+                            "n1",
+                            "n2",
+                            "n3",
+                            "n4",
+                            "n5",
+                            "s1",
+                            "s2",
+                            "aciertos_numeros",
+                            "aciertos_estrellas",
+                            "nums_coinciden",
+                            "estrellas_coinciden",
+                        ]
+                    ]
                 )
 
-                st.markdown("#### Resumen de aciertos (números + estrellas)")
-                st.dataframe(resumen)
+            # --- Informe de toda la vida: todas las líneas × todos los sorteos ---
+            st.markdown("### Todas tus combinaciones contra todo el histórico")
+
+            hist_min = df_sorted["date"].min().date()
+            hist_max = df_sorted["date"].max().date()
+            report_range = st.date_input(
+                "Sorteos a comprobar",
+                value=(hist_min, hist_max),
+                min_value=hist_min,
+                max_value=hist_max,
+                key="lifetime_range",
+            )
+            if isinstance(report_range, tuple) and len(report_range) == 2:
+                report_start, report_end = report_range
+            else:
+                report_start, report_end = hist_min, hist_max
 
-                # --- Plenos (5+2) si los hubiera ---
-                exactos = combos_df[
-                    (combos_df["aciertos_numeros"] == 5)
-                    & (combos_df["aciertos_estrellas"] == 2)
-                ]
+            if st.button("Calcular informe histórico", key="lifetime_run"):
+                st.session_state["lifetime_requested"] = True
 
-                if exactos.empty:
-                    st.success(
-                        "✅ No hay pleno **5+2** en tus combinaciones guardadas "
-                        "para el último sorteo."
-                    )
+            if st.session_state.get("lifetime_requested"):
+                full_range = (report_start, report_end) == (hist_min, hist_max)
+                if full_range:
+                    # Todo el histórico: agregados ya calculados en el libro de aciertos
+                    lines_df, tiers_df, modes_df, report = ledger_report(ledger)
                 else:
-                    st.error(
-                        "⚠️ ¡Hay al menos un pleno **5+2** en tus combinaciones guardadas!"
-                    )
-                    st.dataframe(
-                        exactos[
-                            [
-                                "timestamp",
-                                "mode",
-                                "serie",
-                                "n1",
-                                "n2",
-                                "n3",
-                                "n4",
-                                "n5",
-                                "s1",
-                                "s2",
-                                "aciertos_numeros",
-                                "aciertos_estrellas",
-                                "nums_coinciden",
-                                "estrellas_coinciden",
-                            ]
-                        ]
-                    )
+                    with st.spinner("Comparando cada combinación con cada sorteo..."):
+                        lines_df, tiers_df, modes_df, report = get_lifetime_report(
+                            store.store_signature(),
+                            hist_version,
+                            df,
+                            pd.Timestamp(report_start),
+                            pd.Timestamp(report_end),
+                        )
 
-                # --- Top 20 combinaciones que aciertan algo ---
-                st.markdown(
-                    "#### Top 20 combinaciones que más se acercan al último sorteo"
+                st.write(
+                    f"**{report['lines']:,}** combinaciones × **{report['draws']:,}** sorteos "
+                    f"= **{report['comparisons']:,}** comparaciones, "
+                    f"**{report['prize_hits']:,}** con premio."
                 )
 
-                mask_acierto = (combos_df["aciertos_numeros"] > 0) | (
-                    combos_df["aciertos_estrellas"] > 0
-                )
-                combos_con_acierto = combos_df[mask_acierto]
+                st.markdown("#### Veces de cada resultado")
+                st.dataframe(tiers_df[tiers_df["veces"] > 0], hide_index=True)
 
-                if combos_con_acierto.empty:
-                    st.info(
-                        "Ninguna combinación guardada acierta números ni estrellas "
-                        "en este sorteo."
-                    )
-                else:
-                    top_hits = combos_con_acierto.sort_values(
-                        ["aciertos_numeros", "aciertos_estrellas"],
+                st.markdown("#### Totales por modo")
+                st.dataframe(modes_df, hide_index=True)
+
+                st.markdown("#### Mejor resultado de cada combinación")
+                st.dataframe(
+                    lines_df.sort_values(
+                        ["mejor_numeros", "mejor_estrellas", "sorteos_con_premio"],
                         ascending=False,
-                    ).head(20)
+                    ),
+                    hide_index=True,
+                )
 
-                    st.dataframe(
-                        top_hits[
-                            [
-                                "timestamp",
-                                "mode",
-                                "serie",
-                                "n1",
-                                "n2",
-                                "n3",
-                                "n4",
-                                "n5",
-                                "s1",
-                                "s2",
-                                "aciertos_numeros",
-                                "aciertos_estrellas",
-                                "nums_coinciden",
-                                "estrellas_coinciden",
-                            ]
-                        ]
-                    )
+                if full_range:
+                    st.markdown("#### Premios de 4 o más números (libro de aciertos)")
+                    big_hits = ledger_entries(ledger, min_numbers=4)
+                    if big_hits.empty:
+                        st.info("Ninguna combinación guardada ha acertado 4 números o más.")
+                    else:
+                        st.dataframe(big_hits, hide_index=True)
 
 # -------------------------------------------------------------------
 # 🎛 TAB: SIMULADOR MONTE CARLO
@@ -1276,6 +1312,25 @@ with tab_sim:
         )
 
     with col_sim2:
+        sim_kind = st.selectbox(
+            "Tipo de simulación",
+            ["Monte Carlo", "Backtest walk-forward", "Sorteos sintéticos"],
+            index=0,
+            help=(
+                "Backtest walk-forward: para cada sorteo real genera un bloque "
+                "usando solo los sorteos anteriores y lo compara con ese sorteo. "
+                "Sorteos sintéticos: millones de sorteos uniformes al azar en "
+                "lugar de los reales."
+            ),
+        )
+        if sim_kind == "Sorteos sintéticos":
+            sim_synth_draws = st.select_slider(
+                "Sorteos sintéticos",
+                options=[100_000, 1_000_000, 10_000_000],
+                value=10_000_000,
+                format_func=lambda v: f"{v:,}".replace(",", "."),
+            )
+
         sim_n_trials = st.slider(
             "Número de sorteos simulados (trials)",
             100,
@@ -1288,9 +1343,61 @@ with tab_sim:
             "real aleatorio como referencia. Se calcula cuántos aciertos harían tus líneas."
         )
 
+        sim_seed = st.number_input(
+            "Semilla (0 = aleatoria)",
+            min_value=0,
+            value=0,
+            step=1,
+            format="%d",
+        )
+        sim_workers = st.slider(
+            "Procesos en paralelo",
+            1,
+            max(1, os.cpu_count() or 1),
+            1,
+        )
+
+        sampling_labels = {
+            "Aleatorio": "random",
+            "Estratificado (todos los sorteos por igual)": "stratified",
+            "Estratificado por era de estrellas": "era",
+            "Exhaustivo (cada bloque vs todo el histórico)": "exhaustive",
+        }
+        sim_sampling_label = st.selectbox(
+            "Sorteos de referencia (reducción de varianza)",
+            list(sampling_labels),
+            index=0,
+            help=(
+                "Cómo se eligen los sorteos reales contra los que se puntúa cada "
+                "bloque. Exhaustivo compara cada bloque con los ~1900 sorteos: "
+                "mucha más precisión con muchos menos bloques generados."
+            ),
+        )
+        sim_sampling = sampling_labels[sim_sampling_label]
+
+        sim_early_stop = st.checkbox(
+            "⏱️ Parar al converger (IC 95 %)",
+            value=False,
+            help=(
+                "Simula por lotes y se detiene cuando el intervalo de confianza "
+                "de P(≥3 números) y P(premio) es más estrecho que el objetivo. "
+                "Los trials del slider pasan a ser el máximo."
+            ),
+        )
+        sim_target_pp = st.number_input(
+            "Semiancho objetivo del IC (puntos %)",
+            min_value=0.05,
+            max_value=5.0,
+            value=0.2,
+            step=0.05,
+            disabled=not sim_early_stop,
+        )
+
     sim_lines_A = int(sim_lines_A)
     sim_lines_B = int(sim_lines_B)
     sim_lines_C = int(sim_total_lines - sim_lines_A - sim_lines_B)
+    sim_seed = int(sim_seed)
+    sim_workers = int(sim_workers)
 
     st.write(
         f"**Configuración simulada** → A: {sim_lines_A} · "
@@ -1298,9 +1405,68 @@ with tab_sim:
     )
 
     # ---- EJECUTAR SIMULACIÓN Y GUARDAR RESULTADO EN SESSION_STATE ----
-    if st.button("⚙️ Ejecutar simulación Monte Carlo"):
+    if st.button(f"⚙️ Ejecutar simulación ({sim_kind})"):
+        # Semilla 0 = aleatoria: se sortea una concreta al pulsar y se guarda
+        # con el resultado, así la comparación entre modos de los reruns
+        # siguientes sale de la caché (app.simulator / app.result_cache)
+        if sim_seed == 0:
+            sim_seed = int(np.random.SeedSequence().entropy)
         if sim_total_lines <= 0:
             st.error("Debes tener al menos 1 línea en total para simular.")
+        elif sim_kind == "Backtest walk-forward":
+            with st.spinner("Recorriendo el histórico sorteo a sorteo…"):
+                dist_df, summary = backtest_strategy(
+                    mode=sim_mode,
+                    df_hist=df,
+                    lines_A=sim_lines_A,
+                    lines_B=sim_lines_B,
+                    lines_C=sim_lines_C,
+                    seed=sim_seed,
+                )
+        elif sim_kind == "Sorteos sintéticos":
+            progress_bar = st.progress(0.0)
+            dist_df, summary = simulate_synthetic(
+                mode=sim_mode,
+                df_hist=df,
+                n_draws=sim_synth_draws,
+                lines_A=sim_lines_A,
+                lines_B=sim_lines_B,
+                lines_C=sim_lines_C,
+                n_blocks=sim_n_trials,
+                seed=sim_seed,
+                progress=lambda p: progress_bar.progress(p["draws"] / p["max_draws"]),
+            )
+            progress_bar.progress(1.0)
+        elif sim_early_stop:
+            # Estimaciones parciales en vivo mientras se simula por lotes
+            progress_bar = st.progress(0.0)
+            progress_text = st.empty()
+
+            def _show_partial(partial):
+                part = partial["summary"]
+                progress_bar.progress(partial["trials"] / partial["max_trials"])
+                progress_text.write(
+                    f"{partial['trials']} / {partial['max_trials']} trials · "
+                    f"P(≥3 números) = {part['p_ge3_nums'] * 100:.3f} % "
+                    f"± {part['p_ge3_nums_ci'] * 100:.3f} · "
+                    f"P(premio) = {part['p_any_prize'] * 100:.3f} % "
+                    f"± {part['p_any_prize_ci'] * 100:.3f}"
+                )
+
+            dist_df, summary = simulate_strategy(
+                mode=sim_mode,
+                df_hist=df,
+                n_trials=sim_n_trials,
+                lines_A=sim_lines_A,
+                lines_B=sim_lines_B,
+                lines_C=sim_lines_C,
+                seed=sim_seed,
+                workers=sim_workers,
+                target_half_width=float(sim_target_pp) / 100,
+                progress=_show_partial,
+                sampling=sim_sampling,
+            )
+            progress_bar.progress(1.0)
         else:
             with st.spinner("Simulando… (puede tardar unos segundos)"):
                 dist_df, summary = simulate_strategy(
@@ -1310,9 +1476,14 @@ with tab_sim:
                     lines_A=sim_lines_A,
                     lines_B=sim_lines_B,
                     lines_C=sim_lines_C,
+                    seed=sim_seed,
+                    workers=sim_workers,
+                    sampling=sim_sampling,
                 )
 
+        if sim_total_lines > 0:
             st.session_state["sim_result"] = {
+                "kind": sim_kind,
                 "mode": sim_mode,
                 "dist": dist_df,
                 "summary": summary,
@@ -1320,6 +1491,9 @@ with tab_sim:
                 "lines_B": sim_lines_B,
                 "lines_C": sim_lines_C,
                 "n_trials": sim_n_trials,
+                "seed": sim_seed,
+                "workers": sim_workers,
+                "sampling": sim_sampling,
             }
 
     # ---- MOSTRAR RESULTADOS SI HAY ALGO EN SESSION_STATE ----
@@ -1333,8 +1507,22 @@ with tab_sim:
         sim_lines_B = sim_state["lines_B"]
         sim_lines_C = sim_state["lines_C"]
         sim_n_trials = sim_state["n_trials"]
+        sim_seed = sim_state.get("seed")
+        sim_workers = sim_state.get("workers", 1)
+        sim_sampling = sim_state.get("sampling", "random")
+        sim_kind_used = sim_state.get("kind", "Monte Carlo")
 
         st.markdown(f"### Distribución de aciertos – modo **{mode_used}**")
+        if sim_kind_used == "Backtest walk-forward":
+            st.caption(
+                f"Backtest walk-forward sobre {summary.get('draws_tested', 0)} "
+                "sorteos reales: cada bloque se generó solo con los sorteos anteriores."
+            )
+        elif sim_kind_used == "Sorteos sintéticos":
+            st.caption(
+                f"{summary.get('synthetic_draws', 0):,} sorteos uniformes al azar "
+                f"contra {summary.get('blocks', 0)} bloques generados."
+            )
 
         if dist_df.empty:
             st.warning("La simulación no devolvió resultados (dist vacía).")
@@ -1366,14 +1554,65 @@ with tab_sim:
                     "modo": mode_used,
                     "líneas simuladas": summary.get("total_lines", 0),
                     "P(≥3 números) %": round(summary.get("p_ge3_nums", 0.0) * 100, 3),
+                    "± IC95 (≥3) %": round(summary.get("p_ge3_nums_ci", 0.0) * 100, 3),
                     "P(al menos un premio) %": round(
                         summary.get("p_any_prize", 0.0) * 100, 3
                     ),
+                    "± IC95 (premio) %": round(
+                        summary.get("p_any_prize_ci", 0.0) * 100, 3
+                    ),
+                    "tamaño muestral efectivo (líneas)": int(
+                        summary.get("effective_lines", 0)
+                    ),
                 }
             ]
         )
         st.dataframe(resumen_df, hide_index=True, use_container_width=True)
 
+        # ---- PROBABILIDAD EXACTA DE UN BLOQUE ----
+        st.markdown("#### Probabilidad exacta del bloque (todos los sorteos posibles)")
+        st.caption(
+            "Recorre los 139.838.160 sorteos posibles (5 de 50 × 2 de 12) y calcula, "
+            "para el bloque completo, la probabilidad exacta de su mejor patrón de "
+            "aciertos. Usa el último bloque del generador o, si no hay, uno nuevo "
+            "con el modo y reparto simulados."
+        )
+
+        if st.button("🎯 Calcular probabilidad exacta del bloque"):
+            exact_block = st.session_state.get("last_block") or generate_block(
+                mode=mode_used,
+                df_hist=df,
+                lines_A=sim_lines_A,
+                lines_B=sim_lines_B,
+                lines_C=sim_lines_C,
+            )
+            with st.spinner("Recorriendo los 140 M sorteos posibles…"):
+                exact_dist, exact_summary = block_exact_odds(
+                    [row["nums"] for row in exact_block],
+                    [row["stars"] for row in exact_block],
+                    workers=sim_workers,
+                )
+            st.session_state["exact_result"] = {
+                "lines": len(exact_block),
+                "dist": exact_dist,
+                "summary": exact_summary,
+            }
+
+        exact_state = st.session_state.get("exact_result")
+        if exact_state:
+            col_mc, col_exact = st.columns(2)
+            with col_mc:
+                st.metric(
+                    "Monte Carlo · P(al menos un premio) por línea",
+                    f"{summary.get('p_any_prize', 0.0) * 100:.3f} %",
+                )
+            with col_exact:
+                st.metric(
+                    f"Exacto · P(el bloque de {exact_state['lines']} líneas gana algo)",
+                    f"{exact_state['summary']['p_any_prize'] * 100:.3f} %",
+                )
+            st.dataframe(exact_state["dist"], hide_index=True, use_container_width=True)
+
         # ---- COMPARACIÓN ENTRE MODOS ----
         st.markdown("### Comparación rápida entre modos")
         compare_all = st.checkbox(
@@ -1390,16 +1629,24 @@ with tab_sim:
                 "Game Theory",
             ]
 
+            # Misma configuración, semilla y sorteos de referencia para todos;
+            # el resultado queda cacheado mientras no cambien parámetros/histórico
+            # (la semilla es siempre concreta: la del resultado guardado)
+            comparison = compare_strategies(
+                modes_to_compare,
+                df_hist=df,
+                n_trials=sim_n_trials,
+                lines_A=sim_lines_A,
+                lines_B=sim_lines_B,
+                lines_C=sim_lines_C,
+                seed=sim_seed,
+                workers=sim_workers,
+                sampling=sim_sampling,
+            )
+
             rows = []
             for m in modes_to_compare:
-                dist_m, summary_m = simulate_strategy(
-                    mode=m,
-                    df_hist=df,
-                    n_trials=sim_n_trials,
-                    lines_A=sim_lines_A,
-                    lines_B=sim_lines_B,
-                    lines_C=sim_lines_C,
-                )
+                _, summary_m = comparison[m]
                 rows.append(
                     {
                         "modo": m,
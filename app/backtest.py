@@ -0,0 +1,310 @@
+# app/backtest.py
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.codec import combo_key, encode_numbers, encode_stars, popcount
+from app.data_loader import history_version
+from app.feature_store import lookup_features
+from app.generator import (
+    ERA_12_STARS_START,
+    SUM_RANGE_BY_SERIE,
+    _all_weights_from_freq,
+    _grouped_sum_draws,
+    _plan_from_weights,
+    _sample_lines,
+    _sum_groups,
+    _sum_tables,
+)
+from app.result_cache import cache_key, load_counts, save_counts
+from app.simulator import DIST_COLUMNS, _dist_from_counts, _summary_from_dist
+
+# Nº máximo de vectores de pesos distintos que se muestrean juntos
+# (cada uno lleva una tabla de suma de ~0,6 MB)
+_MAX_GROUPS = 64
+
+
+def _freq_series(counts: np.ndarray) -> pd.Series:
+    """
+    Recuentos (índice 0 sin usar) → Series como la de compute_*_freq:
+    solo los valores que han aparecido, ordenados por índice.
+    """
+    values = np.flatnonzero(counts)
+    if len(values) == 0:
+        return pd.Series([0] * (len(counts) - 1), index=range(1, len(counts)))
+    return pd.Series(counts[values], index=values)
+
+
+def _padded(weights: np.ndarray, n: int) -> np.ndarray:
+    """Pesos con ceros al final hasta n valores (los que faltan no salen nunca)."""
+    out = np.zeros(n, dtype=float)
+    out[: len(weights)] = weights
+    return out
+
+
+def _seen_before(
+    keys: np.ndarray,
+    t_rows: np.ndarray,
+    seen_keys: np.ndarray,
+    seen_first: np.ndarray,
+) -> np.ndarray:
+    """True si keys[r] ya había salido en un sorteo anterior a t_rows[r]."""
+    pos = np.minimum(np.searchsorted(seen_keys, keys), len(seen_keys) - 1)
+    return (seen_keys[pos] == keys) & (seen_first[pos] < t_rows)
+
+
+def _first_per_draw(t_rows: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """True en la primera aparición de cada (sorteo, clave)."""
+    order = np.lexsort((np.arange(len(keys)), keys, t_rows))
+    first = np.ones(len(keys), dtype=bool)
+    first[order[1:]] = (np.diff(t_rows[order]) != 0) | (np.diff(keys[order]) != 0)
+    return first
+
+
+def backtest_strategy(
+    mode: str,
+    df_hist: pd.DataFrame,
+    lines_A: int = 5,
+    lines_B: int = 5,
+    lines_C: int = 5,
+    recent_window: int = 200,
+    min_history: int = 50,
+    seed: int | None = None,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Backtest walk-forward: para cada sorteo histórico t genera un bloque
+    usando SOLO los sorteos anteriores a t y lo puntúa contra el sorteo t.
+
+    - Las frecuencias de la ventana reciente (recent_window) se mantienen
+      de forma incremental: entra el sorteo t-1 y sale el t-1-recent_window.
+    - El anti-clon también es "hasta t": solo cuentan las combinaciones
+      que ya habían salido antes de ese sorteo.
+    - Se empieza en el sorteo `min_history` para que haya algo de historia.
+    - Los bloques de muchos sorteos se muestrean juntos (ver `_sample_chunk`).
+
+    Devuelve (dist_df, summary) con el mismo formato que simulate_strategy;
+    summary incluye además "draws_tested". Con semilla fija el resultado se
+    guarda en la caché de disco (app.result_cache).
+    """
+    df_sorted = df_hist.dropna(
+        subset=["date", "n1", "n2", "n3", "n4", "n5", "s1", "s2"]
+    ).sort_values("date")
+    draws = df_sorted[["n1", "n2", "n3", "n4", "n5", "s1", "s2"]].to_numpy(dtype=int)
+    n_draws = len(draws)
+    start = max(1, int(min_history))
+
+    if n_draws <= start:
+        empty = pd.DataFrame(columns=DIST_COLUMNS)
+        summary = _summary_from_dist(empty)
+        summary["draws_tested"] = 0
+        return empty, summary
+
+    disk_key = None
+    if seed is not None:
+        params = {
+            "mode": mode,
+            "lines_A": int(lines_A),
+            "lines_B": int(lines_B),
+            "lines_C": int(lines_C),
+            "recent_window": int(recent_window),
+            "min_history": start,
+            "seed": seed,
+        }
+        disk_key = cache_key("backtest", params, history_version(df_hist))
+        cached = load_counts(disk_key)
+        if cached is not None and cached.shape == (6, 3):
+            return _backtest_result(cached, n_draws - start)
+
+    rng = np.random.default_rng(seed)
+
+    draw_num_masks = encode_numbers(draws[:, :5])
+    draw_star_masks = encode_stars(draws[:, 5:])
+
+    # Anti-clon "hasta t": cada clave con el índice de su primera aparición
+    num_keys, num_first = np.unique(draw_num_masks, return_index=True)
+    era12 = (df_sorted["date"] >= ERA_12_STARS_START).to_numpy()
+    full_all = combo_key(draw_num_masks, draw_star_masks)
+    full_idx = np.flatnonzero(era12)
+    full_keys, full_first = np.unique(full_all[era12], return_index=True)
+    full_first = full_idx[full_first]
+    history = {
+        "draw_num_masks": draw_num_masks,
+        "draw_star_masks": draw_star_masks,
+        "num_keys": num_keys,
+        "num_first": num_first,
+        "full_keys": full_keys,
+        "full_first": full_first,
+    }
+
+    # Ventana móvil de frecuencias (índice 0 sin usar)
+    counts_main = np.zeros(51, dtype=np.int64)
+    counts_stars = np.zeros(13, dtype=np.int64)
+    for row in draws[max(0, start - recent_window) : start]:
+        counts_main[row[:5]] += 1
+        counts_stars[row[5:]] += 1
+
+    counts = np.zeros((6, 3), dtype=np.int64)
+    pending: List[Tuple[int, List[Dict[str, Any]]]] = []
+    n_groups = 0
+
+    for t in range(start, n_draws):
+        if t > start:
+            # Entra el sorteo t-1 y sale el que queda fuera de la ventana
+            counts_main[draws[t - 1, :5]] += 1
+            counts_stars[draws[t - 1, 5:]] += 1
+            old = t - 1 - recent_window
+            if old >= 0:
+                counts_main[draws[old, :5]] -= 1
+                counts_stars[draws[old, 5:]] -= 1
+
+        freq_main = _freq_series(counts_main)
+        freq_stars = _freq_series(counts_stars)
+        # Mismos pesos que el generador (hot/cold calculados una vez);
+        # un modo desconocido usa pesos uniformes, como _build_weights_for_mode
+        all_weights = _all_weights_from_freq(freq_main, freq_stars)
+        plan = _plan_from_weights(
+            mode,
+            lambda m: all_weights.get(m.split()[0], all_weights["Estándar"]),
+            lines_A,
+            lines_B,
+            lines_C,
+        )
+        pending.append((t, plan))
+        n_groups += len({item["mode_name"] for item in plan})  # cota superior
+
+        if n_groups >= _MAX_GROUPS or t == n_draws - 1:
+            counts += _sample_chunk(pending, history, rng)
+            pending, n_groups = [], 0
+
+    if disk_key:
+        save_counts(disk_key, counts)
+    return _backtest_result(counts, n_draws - start)
+
+
+def _backtest_result(counts: np.ndarray, draws_tested: int) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    dist = _dist_from_counts(counts)
+    summary = _summary_from_dist(dist)
+    summary["draws_tested"] = draws_tested
+    return dist, summary
+
+
+def _sample_chunk(
+    pending: List[Tuple[int, List[Dict[str, Any]]]],
+    history: Dict[str, np.ndarray],
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    Genera y puntúa los bloques de varios sorteos t a la vez.
+
+    Cada (t, estrategia) es un grupo de pesos; para cada (t, entrada del
+    plan) se sacan de golpe varias candidatas por línea pedida y se aplican
+    los mismos filtros que `_sample_lines` (Game, anti-clon hasta t, sin
+    repetidas en el bloque). Si a alguna entrada le faltan líneas, se
+    completa con `_sample_lines` (caso raro). Devuelve la matriz 6×3 de
+    aciertos (números, estrellas).
+    """
+    # Grupos de pesos y entradas del plan
+    # (pesos idénticos, p. ej. Estándar en todos los t, comparten grupo)
+    group_index: Dict[Tuple[bytes, bytes], int] = {}
+    w_main_rows: List[np.ndarray] = []
+    w_stars_rows: List[np.ndarray] = []
+    entries: List[Tuple[int, int, Dict[str, Any]]] = []  # (t, grupo, item)
+    for t, plan in pending:
+        for item in plan:
+            if item["n_lines"] <= 0:
+                continue
+            w_main = _padded(item["w_main"], 50)
+            w_stars = _padded(item["w_stars"], 12)
+            key = (w_main.tobytes(), w_stars.tobytes())
+            if key not in group_index:
+                group_index[key] = len(w_main_rows)
+                w_main_rows.append(w_main)
+                w_stars_rows.append(w_stars)
+            entries.append((t, group_index[key], item))
+
+    counts = np.zeros((6, 3), dtype=np.int64)
+    if not entries:
+        return counts
+
+    w_main = np.stack(w_main_rows)
+    w_stars = np.stack(w_stars_rows)
+    tables = _sum_tables(w_main)
+
+    # Candidatas: varias por línea pedida, contiguas por entrada
+    n_lines = np.array([item["n_lines"] for _, _, item in entries])
+    per_entry = 4 * n_lines + 12
+    entry_of_row = np.repeat(np.arange(len(entries)), per_entry)
+    t_rows = np.array([t for t, _, _ in entries])[entry_of_row]
+    entry_groups = np.array([g for _, g, _ in entries])
+    groups = entry_groups[entry_of_row]
+    ranges = np.array(
+        [SUM_RANGE_BY_SERIE.get(item["serie"], (100, 158)) for _, _, item in entries]
+    )
+
+    # Ternas (grupo, rango de suma) por entrada del plan, no por fila
+    sum_keys, key_of_entry = _sum_groups(entry_groups, ranges[:, 0], ranges[:, 1])
+    nums = _grouped_sum_draws(tables, w_main, sum_keys, key_of_entry[entry_of_row], rng)
+    with np.errstate(divide="ignore"):
+        log_w = np.log(w_stars)
+    star_keys = log_w[groups] + rng.gumbel(size=(len(groups), 12))
+    stars = np.sort(np.argpartition(-star_keys, 1, axis=1)[:, :2] + 1, axis=1)
+
+    # Filtros (como en _sample_lines)
+    valid = np.ones(len(groups), dtype=bool)
+    is_game = np.array([item["mode_name"] == "Game" for _, _, item in entries])[entry_of_row]
+    if is_game.any():
+        valid[is_game] = lookup_features(nums[is_game])["popularity"] < 3
+
+    num_keys = encode_numbers(nums)
+    full_keys = combo_key(num_keys, encode_stars(stars))
+    valid &= ~_seen_before(num_keys, t_rows, history["num_keys"], history["num_first"])
+    if len(history["full_keys"]):
+        valid &= ~_seen_before(full_keys, t_rows, history["full_keys"], history["full_first"])
+    valid &= _first_per_draw(np.where(valid, t_rows, -1), full_keys) | ~valid
+
+    # Las primeras n_lines válidas de cada entrada
+    cum = np.cumsum(valid)
+    entry_start = np.concatenate([[0], np.cumsum(per_entry)[:-1]])
+    before = np.where(entry_start > 0, cum[entry_start - 1], 0)
+    rank = cum - 1 - before[entry_of_row]
+    accept = valid & (rank < n_lines[entry_of_row])
+
+    acc_t = t_rows[accept]
+    acc_num_masks = num_keys[accept]
+    acc_star_masks = encode_stars(stars[accept])
+
+    # Entradas a las que les faltan líneas: se completan una a una
+    got = np.bincount(entry_of_row[accept], minlength=len(entries))
+    extra_t: List[np.ndarray] = []
+    extra_nums: List[np.ndarray] = []
+    extra_stars: List[np.ndarray] = []
+    for e in np.flatnonzero(got < n_lines):
+        t, _, item = entries[e]
+        block_seen = {int(k) for k in full_keys[accept & (t_rows == t)]}
+        more_nums, more_stars = _sample_lines(
+            weights_main=item["w_main"],
+            weights_stars=item["w_stars"],
+            serie=item["serie"],
+            n_lines=int(n_lines[e] - got[e]),
+            seen_number_keys=history["num_keys"][history["num_first"] < t],
+            seen_full_keys=history["full_keys"][history["full_first"] < t],
+            block_seen_full=block_seen,
+            mode_name=item["mode_name"],
+            rng=rng,
+        )
+        extra_t.append(np.full(len(more_nums), t))
+        extra_nums.append(encode_numbers(more_nums))
+        extra_stars.append(encode_stars(more_stars))
+
+    if extra_t:
+        acc_t = np.concatenate([acc_t, *extra_t])
+        acc_num_masks = np.concatenate([acc_num_masks, *extra_nums])
+        acc_star_masks = np.concatenate([acc_star_masks, *extra_stars])
+
+    hits_nums = popcount(acc_num_masks & history["draw_num_masks"][acc_t])
+    hits_stars = popcount(acc_star_masks & history["draw_star_masks"][acc_t])
+    np.add.at(counts, (hits_nums, hits_stars), 1)
+    return counts
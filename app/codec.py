@@ -0,0 +1,96 @@
+# app/codec.py
+from __future__ import annotations
+
+from typing import List, Sequence
+
+import numpy as np
+
+# Codificación compacta de combinaciones como bitmasks:
+#   - 5 números (1..50)  → uint64, bit (n - 1)
+#   - 2 estrellas (1..12) → uint16, bit (s - 1)
+#   - combinación completa → uint64: (mask_números << 12) | mask_estrellas
+# Los aciertos entre dos combinaciones son popcount(a & b).
+
+STAR_BITS = 12
+
+
+def _encode(values: Sequence[int] | np.ndarray, dtype: type) -> np.ndarray:
+    arr = np.asarray(values, dtype=np.int64)
+    bits = np.left_shift(np.uint64(1), (arr - 1).astype(np.uint64))
+    return np.bitwise_or.reduce(bits, axis=-1).astype(dtype)
+
+
+def encode_numbers(nums: Sequence[int] | np.ndarray) -> np.ndarray:
+    """Bitmask uint64 de una fila de números o de un array (n, k)."""
+    return _encode(nums, np.uint64)
+
+
+def encode_stars(stars: Sequence[int] | np.ndarray) -> np.ndarray:
+    """Bitmask uint16 de una fila de estrellas o de un array (n, k)."""
+    return _encode(stars, np.uint16)
+
+
+def combo_key(num_masks: np.ndarray, star_masks: np.ndarray) -> np.ndarray:
+    """Clave uint64 única de la combinación completa (números + estrellas)."""
+    return (np.asarray(num_masks, dtype=np.uint64) << np.uint64(STAR_BITS)) | np.asarray(
+        star_masks, dtype=np.uint64
+    )
+
+
+def encode_combos(nums: np.ndarray, stars: np.ndarray) -> np.ndarray:
+    """Atajo: claves completas de arrays (n, 5) de números y (n, 2) de estrellas."""
+    return combo_key(encode_numbers(nums), encode_stars(stars))
+
+
+# ---------- popcount ----------
+
+_POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    """Nº de bits a 1 de cada elemento (aciertos si masks = a & b)."""
+    masks = np.asarray(masks)
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(masks)
+
+    as_bytes = np.ascontiguousarray(masks).view(np.uint8).reshape(*masks.shape, -1)
+    return _POPCOUNT_8[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+# ---------- conjuntos de claves (arrays ordenados) ----------
+
+def in_sorted_keys(keys: np.ndarray, sorted_keys: np.ndarray) -> np.ndarray:
+    """np.isin(keys, sorted_keys) para sorted_keys ya ordenado (búsqueda binaria)."""
+    keys = np.asarray(keys)
+    if len(sorted_keys) == 0:
+        return np.zeros(keys.shape, dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[pos] == keys
+
+
+def insert_sorted_keys(sorted_keys: np.ndarray, new_keys: np.ndarray) -> np.ndarray:
+    """Inserta en un array ordenado y sin repetidos las claves que no estén ya."""
+    new_keys = np.unique(np.asarray(new_keys, dtype=sorted_keys.dtype))
+    present = in_sorted_keys(new_keys, sorted_keys)
+    pos = np.searchsorted(sorted_keys, new_keys[~present])
+    return np.insert(sorted_keys, pos, new_keys[~present])
+
+
+# ---------- decodificación ----------
+
+def decode_mask(mask: int) -> List[int]:
+    """Bitmask → lista ordenada de valores (1-based)."""
+    mask = int(mask)
+    out = []
+    value = 1
+    while mask:
+        if mask & 1:
+            out.append(value)
+        mask >>= 1
+        value += 1
+    return out
+
+
+def masks_to_strings(masks: np.ndarray) -> List[str]:
+    """Bitmasks → strings "3-12-40" (cadena vacía si no hay bits)."""
+    return ["-".join(map(str, decode_mask(m))) for m in np.asarray(masks).tolist()]
@@ -0,0 +1,320 @@
+# app/combinations_db.py
+from __future__ import annotations
+
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.codec import encode_stars
+from app.combinations_store import (
+    COLUMNS,
+    DATA_DIR,
+    NUM_COLS,
+    STAR_COLS,
+    STORE_PATH,
+    _add_to_saved_index,
+    _block_rows,
+    _normalize_columns,
+    load_saved_index as _load_saved_index,
+)
+from app.feature_store import quintet_rank
+
+# Backend alternativo del store de combinaciones en SQLite (stdlib, WAL).
+# Misma API que app.combinations_store (save_block, load_last_n, load_all,
+# last_id, store_signature, load_saved_index; se elige con app.store_backend)
+# y, además, consultas indexadas por fecha, modo, serie, quinteta, estrellas
+# y números.
+DB_PATH = DATA_DIR / "combinaciones_generadas.sqlite3"
+
+# Índice de exclusión de lo ya guardado (combinations_store.load_saved_index)
+SAVED_INDEX_PATH = DATA_DIR / "combinaciones_generadas.sqlite3.index.npz"
+
+# Filas por lote en executemany (guardado y migración)
+BATCH_SIZE = 10_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS combinations (
+    id           INTEGER PRIMARY KEY,
+    timestamp    TEXT    NOT NULL,
+    mode         TEXT    NOT NULL,
+    serie        TEXT    NOT NULL,
+    line_index   INTEGER NOT NULL,
+    n1 INTEGER NOT NULL, n2 INTEGER NOT NULL, n3 INTEGER NOT NULL,
+    n4 INTEGER NOT NULL, n5 INTEGER NOT NULL,
+    s1 INTEGER NOT NULL, s2 INTEGER NOT NULL,
+    sum_numbers  INTEGER NOT NULL,
+    block_size   INTEGER NOT NULL,
+    quintet_rank INTEGER NOT NULL,   -- rango colex de los 5 números (feature_store)
+    num_mask     INTEGER NOT NULL,   -- bitmasks de números y estrellas (codec)
+    star_mask    INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_combinations_timestamp ON combinations (timestamp);
+CREATE INDEX IF NOT EXISTS idx_combinations_mode ON combinations (mode, timestamp);
+CREATE INDEX IF NOT EXISTS idx_combinations_serie ON combinations (serie, timestamp);
+CREATE INDEX IF NOT EXISTS idx_combinations_rank ON combinations (quintet_rank, star_mask);
+CREATE INDEX IF NOT EXISTS idx_combinations_stars ON combinations (star_mask);
+
+-- Un registro por (línea, número): "líneas que contienen 7 y 23" por índice
+CREATE TABLE IF NOT EXISTS combination_numbers (
+    number     INTEGER NOT NULL,
+    combo_id   INTEGER NOT NULL REFERENCES combinations (id),
+    PRIMARY KEY (number, combo_id)
+) WITHOUT ROWID;
+"""
+
+_INSERT_COMBO = (
+    f"INSERT OR IGNORE INTO combinations ({', '.join(COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(COLUMNS))})"
+)
+_TEXT_COLUMNS = {"timestamp", "mode", "serie"}
+_INSERT_NUMBER = "INSERT OR IGNORE INTO combination_numbers (number, combo_id) VALUES (?, ?)"
+
+
+def _connect(path: Path = DB_PATH) -> sqlite3.Connection:
+    """Conexión en modo WAL (lectores no bloquean al escritor) con el esquema creado."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+# ---------- escritura ----------
+
+def _insert_rows(conn: sqlite3.Connection, df_rows: pd.DataFrame) -> int:
+    """
+    Inserta filas del store (formato tipado o antiguo, ver
+    combinations_store._normalize_columns) con executemany.
+    Devuelve cuántas combinaciones se han insertado.
+    """
+    df_rows = _normalize_columns(df_rows)
+    if df_rows.empty:
+        return 0
+
+    columns = [
+        df_rows[c].astype(str).tolist() if c in _TEXT_COLUMNS else df_rows[c].astype(np.int64).tolist()
+        for c in COLUMNS
+    ]
+    before = conn.total_changes
+    conn.executemany(_INSERT_COMBO, zip(*columns))
+    inserted = conn.total_changes - before
+
+    ids = df_rows["id"].to_numpy(dtype=np.int64)
+    nums = df_rows[NUM_COLS].to_numpy(dtype=np.int64)
+    conn.executemany(_INSERT_NUMBER, zip(nums.ravel().tolist(), np.repeat(ids, 5).tolist()))
+    return inserted
+
+
+def save_block(
+    block: List[Dict[str, Any]],
+    mode: str,
+    block_size: Optional[int] = None,
+    note: str | None = None,  # por compatibilidad aunque no lo usemos
+    path: Path = DB_PATH,
+) -> int:
+    """
+    Igual que combinations_store.save_block, pero en SQLite: una transacción
+    BEGIN IMMEDIATE (serializa a los escritores) y un executemany por tabla.
+    También añade las líneas al índice de exclusión (load_saved_index); el
+    libro de aciertos las recoge en su siguiente sync_ledger (por last_id).
+
+    Devuelve: número de combinaciones añadidas.
+    """
+    if block_size is None:
+        block_size = len(block)
+    now_iso = datetime.now().isoformat(timespec="microseconds")
+
+    with closing(_connect(path)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM combinations").fetchone()[0]
+            df_new = _block_rows(block, mode, int(block_size), next_id, now_iso)
+
+            # Índice de exclusión tal y como estaba antes de escribir
+            saved_index = _saved_index_for(conn, path)
+
+            added = _insert_rows(conn, df_new)
+            signature = _signature(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    _add_to_saved_index(saved_index, df_new, signature, _index_path(path))
+    return added
+
+
+# ---------- lectura y consultas ----------
+
+def _read(conn: sqlite3.Connection, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+    return _normalize_columns(pd.read_sql_query(sql, conn, params=list(params)))
+
+
+def load_last_n(n: int = 50, path: Path = DB_PATH) -> pd.DataFrame:
+    """Devuelve las últimas n combinaciones guardadas (mismas columnas que el CSV)."""
+    cols = ", ".join(COLUMNS)
+    with closing(_connect(path)) as conn:
+        df = _read(
+            conn,
+            f"SELECT {cols} FROM (SELECT {cols} FROM combinations ORDER BY id DESC LIMIT ?) "
+            "ORDER BY id",
+            (max(0, int(n)),),
+        )
+    return df
+
+
+def query_lines(
+    mode: Optional[str] = None,
+    serie: Optional[str] = None,
+    since: Optional[datetime | str] = None,
+    until: Optional[datetime | str] = None,
+    contains: Optional[Iterable[int]] = None,
+    stars: Optional[Iterable[int]] = None,
+    numbers: Optional[Iterable[int]] = None,
+    limit: Optional[int] = None,
+    path: Path = DB_PATH,
+) -> pd.DataFrame:
+    """
+    Combinaciones guardadas que cumplen TODOS los filtros dados, vía índices:
+      - mode / serie: igualdad exacta
+      - since / until: rango de timestamp (ISO, since incluido, until excluido)
+      - contains: números que deben aparecer en la línea (p. ej. [7, 23])
+      - stars: la pareja exacta de estrellas
+      - numbers: la quinteta exacta (en cualquier orden)
+
+    Ejemplo: query_lines(mode="Momentum", since=datetime.now() - timedelta(days=30))
+    """
+    where: List[str] = []
+    params: List[Any] = []
+
+    if mode is not None:
+        where.append("c.mode = ?")
+        params.append(mode)
+    if serie is not None:
+        where.append("c.serie = ?")
+        params.append(serie)
+    if since is not None:
+        where.append("c.timestamp >= ?")
+        params.append(since.isoformat() if isinstance(since, datetime) else str(since))
+    if until is not None:
+        where.append("c.timestamp < ?")
+        params.append(until.isoformat() if isinstance(until, datetime) else str(until))
+    if numbers is not None:
+        where.append("c.quintet_rank = ?")
+        params.append(int(quintet_rank(sorted(int(x) for x in numbers))))
+    if stars is not None:
+        where.append("c.star_mask = ?")
+        params.append(int(encode_stars(sorted(int(x) for x in stars))))
+
+    contains = sorted({int(x) for x in contains}) if contains is not None else []
+    if contains:
+        marks = ", ".join("?" * len(contains))
+        where.append(
+            "c.id IN (SELECT combo_id FROM combination_numbers "
+            f"WHERE number IN ({marks}) GROUP BY combo_id HAVING COUNT(*) = ?)"
+        )
+        params.extend(contains)
+        params.append(len(contains))
+
+    sql = f"SELECT {', '.join('c.' + c for c in COLUMNS)} FROM combinations c"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY c.id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    with closing(_connect(path)) as conn:
+        return _read(conn, sql, params)
+
+
+def load_all(path: Path = DB_PATH) -> pd.DataFrame:
+    """Todas las combinaciones guardadas (mismas columnas que el CSV)."""
+    with closing(_connect(path)) as conn:
+        return _read(conn, f"SELECT {', '.join(COLUMNS)} FROM combinations ORDER BY id")
+
+
+def last_id(path: Path = DB_PATH) -> int:
+    """Id de la última combinación guardada (0 si no hay ninguna)."""
+    with closing(_connect(path)) as conn:
+        return int(conn.execute("SELECT COALESCE(MAX(id), 0) FROM combinations").fetchone()[0])
+
+
+def count_lines(path: Path = DB_PATH) -> int:
+    """Nº de combinaciones guardadas en la base de datos."""
+    with closing(_connect(path)) as conn:
+        return int(conn.execute("SELECT COUNT(*) FROM combinations").fetchone()[0])
+
+
+# ---------- índice de exclusión de combinaciones guardadas ----------
+
+def _signature(conn: sqlite3.Connection) -> Tuple[int, int]:
+    """(último id, nº de filas): cambia en cuanto se guarda o migra algo."""
+    max_id, count = conn.execute(
+        "SELECT COALESCE(MAX(id), 0), COUNT(*) FROM combinations"
+    ).fetchone()
+    return int(max_id), int(count)
+
+
+def _index_path(path: Path) -> Path:
+    return SAVED_INDEX_PATH if path == DB_PATH else path.with_suffix(".index.npz")
+
+
+def _saved_index_for(conn: sqlite3.Connection, path: Path) -> Dict[str, Any]:
+    return _load_saved_index(
+        _signature(conn),
+        _index_path(path),
+        lambda: pd.read_sql_query(
+            f"SELECT {', '.join(NUM_COLS + STAR_COLS)} FROM combinations", conn
+        ),
+    )
+
+
+def store_signature(path: Path = DB_PATH) -> Tuple[int, int]:
+    """Firma de la base de datos, como combinations_store.store_signature."""
+    with closing(_connect(path)) as conn:
+        return _signature(conn)
+
+
+def load_saved_index(path: Path = DB_PATH) -> Dict[str, Any]:
+    """Índice de exclusión de las líneas guardadas en la base de datos."""
+    with closing(_connect(path)) as conn:
+        return _saved_index_for(conn, path)
+
+
+# ---------- migración desde el CSV ----------
+
+def migrate_from_csv(
+    csv_path: Path = STORE_PATH,
+    path: Path = DB_PATH,
+    chunk_size: int = BATCH_SIZE * 10,
+) -> int:
+    """
+    Copia combinaciones_generadas.csv a la base de datos, por trozos y
+    conservando los ids. Es idempotente (INSERT OR IGNORE): relanzarla solo
+    añade las filas que falten. Devuelve cuántas combinaciones se han añadido.
+    """
+    if not Path(csv_path).exists():
+        return 0
+
+    added = 0
+    with closing(_connect(path)) as conn:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+            chunk = chunk[pd.to_numeric(chunk["id"], errors="coerce").notna()]
+            if chunk.empty:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(chunk), BATCH_SIZE):
+                    added += _insert_rows(conn, chunk.iloc[start : start + BATCH_SIZE])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+    return added
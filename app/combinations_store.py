@@ -1,17 +1,54 @@
 # app/combinations_store.py
 from __future__ import annotations
 
+import io
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from app.codec import encode_combos, encode_numbers, encode_stars, in_sorted_keys, insert_sorted_keys
+from app.feature_store import N_QUINTETS, quintet_rank
+from app.file_io import file_lock, tail_lines
+
 # Ruta al CSV de combinaciones generadas
 DATA_DIR = Path(__file__).resolve().parents[1] / "data"
 STORE_PATH = DATA_DIR / "combinaciones_generadas.csv"
 
+# Índice de exclusión de lo ya guardado, junto al CSV
+SAVED_INDEX_PATH = DATA_DIR / "combinaciones_generadas.index.npz"
+
+# Siguiente id libre y cerrojo que serializa las escrituras entre sesiones
+NEXT_ID_PATH = DATA_DIR / "combinaciones_generadas.next_id"
+LOCK_PATH = DATA_DIR / "combinaciones_generadas.lock"
+
+NUM_COLS = [f"n{i}" for i in range(1, 6)]
+STAR_COLS = ["s1", "s2"]
+
+# Números y estrellas como enteros (ordenados) + rango de la quinteta y
+# bitmasks (app.codec), para no parsear strings al comprobar aciertos
 COLUMNS = [
+    "id",
+    "timestamp",
+    "mode",
+    "serie",
+    "line_index",
+    *NUM_COLS,
+    *STAR_COLS,
+    "sum_numbers",
+    "block_size",
+    "quintet_rank",
+    "num_mask",
+    "star_mask",
+]
+
+# Formato antiguo: números y estrellas como strings "12-13-25-26-47" / "3-12"
+LEGACY_COLUMNS = [
     "id",
     "timestamp",
     "mode",
@@ -23,6 +60,14 @@ COLUMNS = [
     "block_size",
 ]
 
+_COLUMN_DTYPES = {
+    **{c: "int8" for c in NUM_COLS + STAR_COLS},
+    "sum_numbers": "int16",
+    "quintet_rank": "int32",
+    "num_mask": "int64",
+    "star_mask": "int16",
+}
+
 
 def _ensure_store_exists() -> None:
     """Crea el CSV vacío si aún no existe."""
@@ -32,6 +77,127 @@ def _ensure_store_exists() -> None:
         df_empty.to_csv(STORE_PATH, index=False)
 
 
+# ---------- esquema (columnas tipadas y formato antiguo) ----------
+
+def _store_columns(path: Path = STORE_PATH) -> List[str]:
+    """Columnas del CSV, leyendo solo la cabecera."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.readline().strip().split(",")
+    except OSError:
+        return []
+
+
+def _is_legacy_store(path: Path = STORE_PATH) -> bool:
+    columns = _store_columns(path)
+    return "numbers" in columns and "n1" not in columns
+
+
+def _typed_columns(nums: np.ndarray, stars: np.ndarray) -> Dict[str, np.ndarray]:
+    """n1..n5, s1, s2 (ordenados), suma, rango y bitmasks de arrays (n, 5) y (n, 2)."""
+    nums = np.sort(np.asarray(nums, dtype=np.int64).reshape(-1, 5), axis=1)
+    stars = np.sort(np.asarray(stars, dtype=np.int64).reshape(-1, 2), axis=1)
+    out: Dict[str, np.ndarray] = {c: nums[:, i] for i, c in enumerate(NUM_COLS)}
+    out.update({c: stars[:, i] for i, c in enumerate(STAR_COLS)})
+    out["sum_numbers"] = nums.sum(axis=1)
+    out["quintet_rank"] = np.asarray(quintet_rank(nums), dtype=np.int64)
+    out["num_mask"] = encode_numbers(nums).astype(np.int64)
+    out["star_mask"] = encode_stars(stars).astype(np.int64)
+    return out
+
+
+def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    DataFrame del store (formato nuevo o antiguo) → columnas de COLUMNS con
+    sus tipos. Del formato antiguo se parsean numbers/stars una sola vez y se
+    descartan las filas que no tengan 5 números y 2 estrellas válidos.
+    """
+    if "n1" not in df.columns and "numbers" in df.columns:
+        nums = _split_values(df["numbers"], 5)
+        stars = _split_values(df["stars"], 2)
+        if len(nums) != len(df) or len(stars) != len(df):
+            df = df.iloc[:0]
+            nums = np.empty((0, 5))
+            stars = np.empty((0, 2))
+        ok = ~np.isnan(nums).any(axis=1) & ~np.isnan(stars).any(axis=1)
+        df = df[ok].drop(columns=["numbers", "stars", "sum_numbers"], errors="ignore")
+        df = df.assign(**_typed_columns(nums[ok], stars[ok]))
+
+    df = df.reindex(columns=COLUMNS).dropna(subset=NUM_COLS + STAR_COLS)
+    return df.astype(_COLUMN_DTYPES).reset_index(drop=True)
+
+
+def _convert_store(chunk_size: int) -> int:
+    """Reescribe (atómicamente) un CSV del formato antiguo al tipado."""
+    tmp_path = STORE_PATH.with_suffix(".tmp.csv")
+    converted = 0
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(COLUMNS) + "\n")
+        for chunk in pd.read_csv(STORE_PATH, chunksize=chunk_size):
+            chunk = _normalize_columns(chunk)
+            chunk.to_csv(f, index=False, header=False)
+            converted += len(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp_path.replace(STORE_PATH)
+    return converted
+
+
+def convert_store(chunk_size: int = 200_000) -> int:
+    """
+    Convierte combinaciones_generadas.csv del formato antiguo (numbers/stars
+    como strings) al tipado (n1..n5, s1, s2, rango y bitmasks), por trozos.
+    Si ya está en el formato nuevo no hace nada.
+
+    Devuelve: número de combinaciones convertidas.
+    """
+    with file_lock(LOCK_PATH):
+        if not _is_legacy_store():
+            return 0
+        return _convert_store(chunk_size)
+
+
+def _read_next_id() -> int:
+    """
+    Siguiente id libre, del fichero auxiliar. Si no existe (store antiguo)
+    se calcula una vez leyendo solo la columna id del CSV.
+    """
+    try:
+        return int(NEXT_ID_PATH.read_text().strip())
+    except (OSError, ValueError):
+        pass
+
+    if STORE_PATH.exists():
+        ids = pd.to_numeric(pd.read_csv(STORE_PATH, usecols=["id"])["id"], errors="coerce")
+        if ids.notna().any():
+            return int(ids.max()) + 1
+    return 1
+
+
+def last_id() -> int:
+    """Id de la última combinación guardada (0 si no hay ninguna)."""
+    return _read_next_id() - 1
+
+
+def _write_next_id(next_id: int) -> None:
+    """Reemplazo atómico (tmp + fsync + rename) del fichero del siguiente id."""
+    tmp_path = NEXT_ID_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(str(int(next_id)))
+        f.flush()
+        os.fsync(f.fileno())
+    tmp_path.replace(NEXT_ID_PATH)
+
+
+def _append_rows(df_new: pd.DataFrame) -> None:
+    """Añade filas al final del CSV con una sola escritura y fsync."""
+    payload = df_new.to_csv(index=False, header=False).encode("utf-8")
+    with open(STORE_PATH, "ab") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+
 def save_block(
     block: List[Dict[str, Any]],
     mode: str,
@@ -47,62 +213,382 @@ def save_block(
     - block_size: tamaño total del bloque (para guardar en la columna).
                   Si es None, se usa len(block).
 
+    Solo se escriben las filas nuevas (append + fsync), el id sale de un
+    fichero auxiliar y todo va bajo un cerrojo de fichero, así que el
+    coste no depende del tamaño del store y dos sesiones (o procesos) que
+    guarden a la vez no se pisan.
+
     Devuelve: número de combinaciones añadidas.
     """
-    _ensure_store_exists()
-
-    # Leemos lo que ya hay
-    df_old = pd.read_csv(STORE_PATH) if STORE_PATH.exists() else pd.DataFrame(columns=COLUMNS)
-
-    # Calculamos el siguiente id
-    if not df_old.empty and "id" in df_old.columns:
-        next_id = int(pd.to_numeric(df_old["id"], errors="coerce").max()) + 1
-    else:
-        next_id = 1
-
     if block_size is None:
         block_size = len(block)
 
     now_iso = datetime.now().isoformat(timespec="microseconds")
 
-    rows = []
-    for idx, row in enumerate(block):
-        nums = row.get("nums", [])
-        stars = row.get("stars", [])
-        serie = row.get("serie", "")
-
-        nums_str = "-".join(str(int(n)) for n in nums)
-        stars_str = "-".join(str(int(s)) for s in stars)
-        sum_numbers = int(sum(nums)) if nums else None
-
-        rows.append(
-            {
-                "id": next_id + idx,
-                "timestamp": now_iso,
-                "mode": mode,
-                "serie": serie,
-                "line_index": idx,
-                "numbers": nums_str,
-                "stars": stars_str,
-                "sum_numbers": sum_numbers,
-                "block_size": int(block_size),
-            }
-        )
+    with file_lock(LOCK_PATH):
+        _ensure_store_exists()
+        if _is_legacy_store():
+            _convert_store(chunk_size=200_000)
+        next_id = _read_next_id()
+        df_new = _block_rows(block, mode, int(block_size), next_id, now_iso)
+
+        # Índice de exclusión tal y como estaba antes de escribir
+        saved_index = load_saved_index()
 
-    df_new = pd.DataFrame(rows, columns=COLUMNS)
-    df_all = pd.concat([df_old, df_new], ignore_index=True)
-    df_all.to_csv(STORE_PATH, index=False)
+        _append_rows(df_new)
+        _write_next_id(next_id + len(df_new))
+
+        _add_to_saved_index(saved_index, df_new)
 
-    # 👈 ESTA línea es la que te faltaba en tu versión
     return len(df_new)
 
 
+def _block_rows(
+    block: List[Dict[str, Any]],
+    mode: str,
+    block_size: int,
+    next_id: int,
+    now_iso: str,
+) -> pd.DataFrame:
+    """Filas del CSV (en el orden de COLUMNS) para un bloque."""
+    n_rows = len(block)
+    df = pd.DataFrame(
+        {
+            "id": np.arange(next_id, next_id + n_rows, dtype=np.int64),
+            "timestamp": now_iso,
+            "mode": mode,
+            "serie": [row.get("serie", "") for row in block],
+            "line_index": np.arange(n_rows, dtype=np.int64),
+            "block_size": int(block_size),
+            **_typed_columns(
+                [row.get("nums", []) for row in block],
+                [row.get("stars", []) for row in block],
+            ),
+        }
+    )
+    return _normalize_columns(df)
+
+
+# ---------- lectura de las últimas filas ----------
+
+# Caché de load_last_n: (n, tamaño, mtime_ns) → DataFrame
+_LAST_N_CACHE: "OrderedDict[Tuple[int, int, int], pd.DataFrame]" = OrderedDict()
+_LAST_N_CACHE_SIZE = 4
+# Las OrderedDict se reordenan al leer: todo acceso va bajo este cerrojo
+_LAST_N_CACHE_LOCK = threading.Lock()
+
+
 def load_last_n(n: int = 50) -> pd.DataFrame:
     """
     Devuelve las últimas n combinaciones guardadas.
+
+    Solo se parsean la cabecera y esas n filas (lectura hacia atrás desde el
+    final del CSV) y el resultado se cachea por (n, tamaño, mtime) del fichero.
+    Siempre con las columnas tipadas de COLUMNS, aunque el CSV sea antiguo.
     """
     _ensure_store_exists()
-    df = pd.read_csv(STORE_PATH)
-    if df.empty:
-        return df
-    return df.tail(n).copy()
\ No newline at end of file
+    n = max(0, int(n))
+    stat = STORE_PATH.stat()
+    key = (n, stat.st_size, stat.st_mtime_ns)
+
+    with _LAST_N_CACHE_LOCK:
+        cached = _LAST_N_CACHE.get(key)
+        if cached is not None:
+            _LAST_N_CACHE.move_to_end(key)
+            return cached.copy()
+
+    header, body = tail_lines(STORE_PATH, n)
+    if body:
+        df = _normalize_columns(pd.read_csv(io.BytesIO(header + body)))
+    else:
+        df = _normalize_columns(pd.DataFrame(columns=COLUMNS))
+
+    with _LAST_N_CACHE_LOCK:
+        _LAST_N_CACHE[key] = df
+        while len(_LAST_N_CACHE) > _LAST_N_CACHE_SIZE:
+            _LAST_N_CACHE.popitem(last=False)
+    return df.copy()
+
+
+def load_all() -> pd.DataFrame:
+    """Todas las combinaciones guardadas, con las columnas tipadas de COLUMNS."""
+    _ensure_store_exists()
+    return _normalize_columns(pd.read_csv(STORE_PATH))
+
+
+# ---------- índice de exclusión de combinaciones guardadas ----------
+#
+# - bitmap: 1 bit por quinteta posible (rango combinatorio, ~265 KB) → "¿hay
+#   alguna línea guardada con estos 5 números?" en O(1)
+# - keys: claves completas 5+2 (app.codec) ordenadas → comprobación exacta,
+#   solo para las candidatas cuyo bit está encendido
+# Se guarda junto al CSV con la firma (tamaño, mtime) del CSV que refleja;
+# si no coincide, se reconstruye leyendo el CSV. El backend SQLite
+# (app.combinations_db) usa las mismas funciones con su firma, su fichero y
+# su lector de líneas.
+# Lo usan los scripts de Streamlit y el hilo de history_refresher (vía el
+# libro de aciertos): nunca se modifica en sitio, cada cambio publica un
+# dict nuevo con una sola asignación, y los cambios van bajo el cerrojo.
+
+_SAVED_INDEX: Dict[str, Any] = {}
+_SAVED_INDEX_LOCK = threading.Lock()
+
+# Cada guardado añade un segmento index.seg-NNNNNN.npz (solo sus líneas)
+# en vez de reescribir el índice; al cargar se aplican en orden y, con más
+# de _MAX_INDEX_SEGMENTS, se compactan en una instantánea nueva.
+_MAX_INDEX_SEGMENTS = 32
+# Tamaño mínimo de "recent" (claves aún sin fundir en "keys")
+_MIN_RECENT_KEYS = 4096
+
+
+def store_signature() -> Tuple[int, int]:
+    """(tamaño, mtime) del CSV: cambia en cuanto se guarda algo."""
+    try:
+        stat = STORE_PATH.stat()
+    except OSError:
+        return (0, 0)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _split_values(col: pd.Series, width: int) -> np.ndarray:
+    """Columna "3-12-40-…" → array (n, width) de enteros."""
+    parts = col.astype(str).str.split("-", expand=True)
+    if parts.shape[1] != width:
+        return np.empty((0, width), dtype=np.int64)
+    return parts.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+
+def _lines_arrays(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Números (n, 5) y estrellas (n, 2) válidos de un DataFrame del store."""
+    if "n1" not in df.columns:
+        df = _normalize_columns(df)
+    df = df.dropna(subset=NUM_COLS + STAR_COLS)
+    return df[NUM_COLS].to_numpy(dtype=np.int64), df[STAR_COLS].to_numpy(dtype=np.int64)
+
+
+def _empty_saved_index(signature: Tuple[int, int], index_path: Path) -> Dict[str, Any]:
+    return dict(
+        bitmap=np.zeros((N_QUINTETS + 7) // 8, dtype=np.uint8),
+        keys=np.empty(0, dtype=np.uint64),
+        recent=np.empty(0, dtype=np.uint64),
+        signature=signature,
+        path=index_path,
+        seq=0,
+    )
+
+
+def _index_with(
+    saved_index: Dict[str, Any],
+    ranks: np.ndarray,
+    new_keys: np.ndarray,
+    signature: Tuple[int, int],
+    seq: int,
+) -> Dict[str, Any]:
+    """
+    Índice nuevo = saved_index + líneas (rangos de quinteta, claves 5+2).
+    Las claves van a "recent" (ordenado y pequeño) y solo se funden con
+    "keys" cuando recent pasa de 1/8 de keys: coste amortizado constante
+    por línea, no proporcional al tamaño del store.
+    """
+    bitmap = saved_index["bitmap"].copy()
+    if len(ranks):
+        np.bitwise_or.at(bitmap, ranks >> 3, (1 << (ranks & 7)).astype(np.uint8))
+    keys = saved_index["keys"]
+    recent = insert_sorted_keys(saved_index["recent"], new_keys)
+    if len(recent) > max(_MIN_RECENT_KEYS, len(keys) >> 3):
+        keys, recent = insert_sorted_keys(keys, recent), recent[:0]
+    return dict(saved_index, bitmap=bitmap, keys=keys, recent=recent, signature=signature, seq=seq)
+
+
+def _lines_keys(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Rangos de quinteta y claves 5+2 de las líneas válidas de df."""
+    nums, stars = _lines_arrays(df)
+    if len(nums) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64)
+    return quintet_rank(nums), encode_combos(nums, stars)
+
+
+def _index_segment_path(index_path: Path, seq: int) -> Path:
+    return index_path.with_name(f"{index_path.stem}.seg-{seq:06d}.npz")
+
+
+def _index_segment_paths(index_path: Path) -> Dict[int, Path]:
+    paths = {}
+    for path in index_path.parent.glob(f"{index_path.stem}.seg-*.npz"):
+        try:
+            paths[int(path.stem.rsplit("-", 1)[1])] = path
+        except ValueError:
+            continue
+    return paths
+
+
+def _persist_saved_index(saved_index: Dict[str, Any], index_path: Path = SAVED_INDEX_PATH) -> None:
+    """
+    Instantánea completa (recent ya fundido en keys). Antes se borran los
+    segmentos: si algo falla entre medias queda una instantánea atrasada
+    pero coherente, que load_saved_index detecta por la firma.
+    """
+    tmp_path = index_path.with_suffix(f".{os.getpid()}.tmp.npz")
+    try:
+        for path in _index_segment_paths(index_path).values():
+            path.unlink(missing_ok=True)
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                bitmap=saved_index["bitmap"],
+                keys=insert_sorted_keys(saved_index["keys"], saved_index["recent"]),
+                signature=np.array(saved_index["signature"], dtype=np.int64),
+                seq=np.int64(saved_index["seq"]),
+            )
+        tmp_path.replace(index_path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _persist_index_segment(
+    before: Dict[str, Any],
+    after: Dict[str, Any],
+    ranks: np.ndarray,
+    new_keys: np.ndarray,
+) -> None:
+    """
+    Guarda solo las líneas añadidas (before → after) como segmento: coste
+    proporcional a ellas. Si otro proceso ya ha escrito ese segmento no se
+    pisa; la cadena de firmas deja de cuadrar y el índice se reconstruye.
+    """
+    try:
+        with open(_index_segment_path(after["path"], after["seq"]), "xb") as f:
+            np.savez(
+                f,
+                ranks=ranks,
+                keys=new_keys,
+                prev_signature=np.array(before["signature"], dtype=np.int64),
+                signature=np.array(after["signature"], dtype=np.int64),
+            )
+    except OSError:
+        pass
+
+
+def _load_saved_index_file(signature: Tuple[int, int], index_path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Instantánea + segmentos encadenados por firma hasta llegar a
+    `signature` (None si la cadena no llega). Con más de
+    _MAX_INDEX_SEGMENTS segmentos se compacta en una instantánea nueva.
+    """
+    try:
+        with np.load(index_path) as data:
+            saved_index = dict(
+                _empty_saved_index(tuple(data["signature"].tolist()), index_path),
+                bitmap=data["bitmap"],
+                keys=data["keys"],
+                seq=int(data["seq"]) if "seq" in data.files else 0,
+            )
+    except (OSError, ValueError, KeyError):
+        return None
+
+    segments = _index_segment_paths(index_path)
+    while saved_index["signature"] != signature:
+        path = segments.get(saved_index["seq"] + 1)
+        if path is None:
+            return None
+        try:
+            with np.load(path) as seg:
+                if tuple(seg["prev_signature"].tolist()) != saved_index["signature"]:
+                    return None
+                saved_index = _index_with(
+                    saved_index,
+                    seg["ranks"],
+                    seg["keys"],
+                    tuple(seg["signature"].tolist()),
+                    saved_index["seq"] + 1,
+                )
+        except (OSError, ValueError, KeyError):
+            return None
+
+    if len(segments) > _MAX_INDEX_SEGMENTS:
+        _persist_saved_index(saved_index, index_path)
+    return saved_index
+
+
+def _read_store_lines() -> Optional[pd.DataFrame]:
+    """Columnas de números y estrellas de todo el CSV (None si no existe)."""
+    if not STORE_PATH.exists():
+        return None
+    usecols = ["numbers", "stars"] if _is_legacy_store() else NUM_COLS + STAR_COLS
+    return pd.read_csv(STORE_PATH, usecols=usecols)
+
+
+def load_saved_index(
+    signature: Optional[Tuple[int, int]] = None,
+    index_path: Path = SAVED_INDEX_PATH,
+    read_lines: Callable[[], Optional[pd.DataFrame]] = _read_store_lines,
+) -> Dict[str, Any]:
+    """
+    Devuelve {"bitmap", "keys", "recent", "signature", ...} del store
+    actual: de memoria, del fichero junto al CSV (instantánea + segmentos)
+    o, si ninguno está al día, recorriendo el CSV.
+    Por defecto es el índice del CSV; combinations_db pasa los suyos.
+    """
+    global _SAVED_INDEX
+    signature = store_signature() if signature is None else signature
+    with _SAVED_INDEX_LOCK:
+        saved_index = _SAVED_INDEX
+        if saved_index.get("signature") == signature and saved_index.get("path") == index_path:
+            return saved_index
+
+        saved_index = _load_saved_index_file(signature, index_path)
+        if saved_index is not None:
+            _SAVED_INDEX = saved_index
+            return saved_index
+
+        saved_index = _empty_saved_index(signature, index_path)
+        df = read_lines()
+        if df is not None:
+            ranks, keys = _lines_keys(df)
+            bitmap = saved_index["bitmap"]
+            np.bitwise_or.at(bitmap, ranks >> 3, (1 << (ranks & 7)).astype(np.uint8))
+            saved_index["keys"] = np.unique(keys)
+            _persist_saved_index(saved_index, index_path)
+        _SAVED_INDEX = saved_index
+        return saved_index
+
+
+def _add_to_saved_index(
+    saved_index: Dict[str, Any],
+    df_new: pd.DataFrame,
+    signature: Optional[Tuple[int, int]] = None,
+    index_path: Path = SAVED_INDEX_PATH,
+) -> None:
+    """
+    Tras escribir filas en el store: añade sus líneas al índice y las
+    guarda como un segmento nuevo (sin reescribir el índice entero).
+    """
+    global _SAVED_INDEX
+    signature = store_signature() if signature is None else signature
+    ranks, keys = _lines_keys(df_new)
+    after = _index_with(saved_index, ranks, keys, signature, saved_index["seq"] + 1)
+    with _SAVED_INDEX_LOCK:
+        _SAVED_INDEX = after
+        _persist_index_segment(saved_index, after, ranks, keys)
+
+
+def saved_lines_mask(
+    saved_index: Dict[str, Any],
+    nums: np.ndarray,
+    full_keys: np.ndarray,
+) -> np.ndarray:
+    """
+    True para cada candidata (nums (n, 5) ordenados + su clave completa)
+    que ya está guardada en el store. El bitmap descarta en O(1) casi todas;
+    solo las que comparten quinteta con algo guardado miran las claves.
+    """
+    bitmap = saved_index["bitmap"]
+    ranks = quintet_rank(nums)
+    maybe = ((bitmap[ranks >> 3] >> (ranks & 7).astype(np.uint8)) & 1).astype(bool)
+    out = np.zeros(len(full_keys), dtype=bool)
+    if maybe.any():
+        candidates = full_keys[maybe]
+        out[maybe] = in_sorted_keys(candidates, saved_index["keys"]) | in_sorted_keys(
+            candidates, saved_index["recent"]
+        )
+    return out
@@ -1,5 +1,7 @@
 # app/data_loader.py
+import hashlib
 from pathlib import Path
+
 import pandas as pd
 
 DATA_PATH = Path(__file__).resolve().parents[1] / "data" / "historico_euromillones.csv"
@@ -86,4 +88,31 @@ def load_raw_data() -> pd.DataFrame:
 
     df_raw = pd.read_csv(DATA_PATH)
     df_norm = _normalize_df(df_raw)
-    return df_norm
\ No newline at end of file
+    return df_norm
+
+
+def append_draws(df_hist: pd.DataFrame, df_new: pd.DataFrame) -> pd.DataFrame:
+    """
+    Histórico ya cargado + sorteos nuevos (evento del updater) → histórico
+    normalizado, sin volver a leer el CSV.
+    """
+    df_new = _normalize_df(df_new)
+    if df_new.empty:
+        return df_hist
+    df_new = df_new.astype(df_hist.dtypes.to_dict()) if not df_hist.empty else df_new
+    combined = pd.concat([df_hist, df_new], ignore_index=True)
+    return (
+        combined.drop_duplicates(keep="first")
+        .sort_values("date", kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def history_version(df: pd.DataFrame) -> str:
+    """
+    Huella corta del contenido del histórico (date, n1..n5, s1, s2).
+    Cambia en cuanto se añade o corrige un sorteo; sirve como clave de caché.
+    """
+    cols = [c for c in ["date", "n1", "n2", "n3", "n4", "n5", "s1", "s2"] if c in df.columns]
+    row_hashes = pd.util.hash_pandas_object(df[cols], index=False).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
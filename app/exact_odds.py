@@ -0,0 +1,188 @@
+# app/exact_odds.py
+from __future__ import annotations
+
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import combinations
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.codec import encode_numbers, encode_stars, popcount
+from app.feature_store import N_QUINTETS, quintets_in_rank_order
+from app.simulator import PRIZE_TABLE, _discard_process_pool, _process_pool, _to_shared
+
+# Todos los patrones (aciertos_numeros, aciertos_estrellas), de MEJOR a PEOR:
+# primero las categorías de premio en el orden oficial y luego el resto.
+# El orden es monótono en números y en estrellas, que es lo que permite
+# calcular el "mejor patrón del bloque" sin recorrer línea a línea.
+PATTERN_ORDER: List[Tuple[int, int]] = [
+    (5, 2), (5, 1), (5, 0), (4, 2), (4, 1), (3, 2), (4, 0), (2, 2),
+    (3, 1), (3, 0), (1, 2), (2, 1),
+    (2, 0), (1, 1), (0, 2), (1, 0), (0, 1), (0, 0),
+]
+
+# _TIER[1 + n, s] = rango del patrón (n, s): 18 = el mejor, 1 = 0+0.
+# La fila 0 (n = -1) representa "ninguna línea en ese grupo" → rango 0.
+_TIER = np.zeros((7, 3), dtype=np.uint8)
+for _rank, (_n, _s) in enumerate(reversed(PATTERN_ORDER), start=1):
+    _TIER[1 + _n, _s] = _rank
+
+STAR_PAIRS = np.array(list(combinations(range(1, 13), 2)))  # 66 parejas
+N_STAR_PAIRS = len(STAR_PAIRS)
+TOTAL_DRAWS = N_QUINTETS * N_STAR_PAIRS  # 139.838.160 sorteos posibles
+
+
+@lru_cache(maxsize=1)
+def quintet_masks() -> np.ndarray:
+    """Bitmasks de las 2.118.760 quintetas, en orden de rango."""
+    return encode_numbers(quintets_in_rank_order())
+
+
+def _best_tiers_counts(
+    q_masks: np.ndarray,
+    line_num_masks: np.ndarray,
+    line_star_masks: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Para un trozo de quintetas × las 66 parejas de estrellas, cuenta cuántos
+    sorteos tienen cada "mejor patrón del bloque" y cuántos tienen alguna
+    línea con ≥ 3 números.
+
+    Como el rango del patrón crece con los aciertos de números y de
+    estrellas, el mejor patrón de un sorteo (q, a-b) es el máximo de:
+      - rango(max aciertos en TODAS las líneas, 0 estrellas)
+      - rango(max aciertos en líneas con la estrella a o b, 1 estrella)
+      - rango(max aciertos en líneas con estrellas exactamente a-b, 2 estrellas)
+    """
+    hits = popcount(q_masks[:, None] & line_num_masks[None, :]).astype(np.int8)  # (C, L)
+    n = len(q_masks)
+
+    best_all = hits.max(axis=1)
+
+    # Máximo de aciertos en las líneas que contienen cada estrella (-1 si ninguna)
+    by_star = np.full((n, 13), -1, dtype=np.int8)
+    for s in range(1, 13):
+        has_s = (line_star_masks >> np.uint16(s - 1)) & np.uint16(1) == 1
+        if has_s.any():
+            by_star[:, s] = hits[:, has_s].max(axis=1)
+
+    # Máximo de aciertos en las líneas con exactamente esa pareja (-1 si ninguna)
+    by_pair = np.full((n, N_STAR_PAIRS), -1, dtype=np.int8)
+    pair_masks = encode_stars(STAR_PAIRS)
+    for p, mask in enumerate(pair_masks):
+        same = line_star_masks == mask
+        if same.any():
+            by_pair[:, p] = hits[:, same].max(axis=1)
+
+    one_star = np.maximum(by_star[:, STAR_PAIRS[:, 0]], by_star[:, STAR_PAIRS[:, 1]])
+    best = np.maximum(
+        np.maximum(_TIER[1 + best_all, 0][:, None], _TIER[1 + one_star, 1]),
+        _TIER[1 + by_pair, 2],
+    )
+
+    tier_counts = np.bincount(best.ravel(), minlength=len(PATTERN_ORDER) + 1)
+    ge3 = int((best_all >= 3).sum()) * N_STAR_PAIRS
+    return tier_counts, np.array([ge3])
+
+
+def _chunk_shared(
+    spec: Tuple[str, Tuple[int, ...], str],
+    start: int,
+    stop: int,
+    line_num_masks: np.ndarray,
+    line_star_masks: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Trabajo de un proceso: lee su rango de quintetas de memoria compartida."""
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        masks = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        result = _best_tiers_counts(masks[start:stop], line_num_masks, line_star_masks)
+        del masks
+        return result
+    finally:
+        shm.close()
+
+
+def block_exact_odds(
+    block_nums: np.ndarray | List[List[int]],
+    block_stars: np.ndarray | List[List[int]],
+    workers: int = 1,
+    chunk_size: int = 100_000,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Probabilidad EXACTA de cada "mejor patrón" de un bloque de líneas,
+    recorriendo los C(50,5) × C(12,2) ≈ 140 M sorteos posibles en trozos
+    vectorizados (en paralelo si workers > 1).
+
+    Devuelve:
+      - dist_df: aciertos_numeros, aciertos_estrellas, sorteos, prob, prob_%
+        (mejor patrón del bloque por sorteo)
+      - summary: total_draws, p_any_prize (el bloque gana algún premio),
+        p_ge3_nums (alguna línea acierta ≥ 3 números)
+    """
+    line_num_masks = encode_numbers(np.asarray(block_nums, dtype=int))
+    line_star_masks = encode_stars(np.asarray(block_stars, dtype=int))
+    if len(line_num_masks) == 0:
+        raise ValueError("El bloque no tiene líneas.")
+
+    masks = quintet_masks()
+    bounds = [(a, min(a + chunk_size, N_QUINTETS)) for a in range(0, N_QUINTETS, chunk_size)]
+    workers = max(1, int(workers))
+
+    if workers == 1:
+        parts = [
+            _best_tiers_counts(masks[a:b], line_num_masks, line_star_masks)
+            for a, b in bounds
+        ]
+    else:
+        # El mismo pool "spawn" reutilizable que el simulador
+        pool = _process_pool(workers)
+        shm, spec = _to_shared(masks)
+        try:
+            futures = [
+                pool.submit(_chunk_shared, spec, a, b, line_num_masks, line_star_masks)
+                for a, b in bounds
+            ]
+            parts = [f.result() for f in futures]
+        except BrokenProcessPool:
+            _discard_process_pool(workers, pool)
+            raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+    tier_counts = sum(p[0] for p in parts)
+    ge3 = int(sum(p[1] for p in parts)[0])
+
+    rows = []
+    for rank, (n, s) in enumerate(reversed(PATTERN_ORDER), start=1):
+        if tier_counts[rank]:
+            rows.append(
+                {
+                    "aciertos_numeros": n,
+                    "aciertos_estrellas": s,
+                    "sorteos": int(tier_counts[rank]),
+                }
+            )
+    dist = (
+        pd.DataFrame(rows)
+        .sort_values(["aciertos_numeros", "aciertos_estrellas"])
+        .reset_index(drop=True)
+    )
+    dist["prob"] = dist["sorteos"] / TOTAL_DRAWS
+    dist["prob_%"] = dist["prob"] * 100
+
+    mask_prize = PRIZE_TABLE[
+        dist["aciertos_numeros"].to_numpy(dtype=int),
+        dist["aciertos_estrellas"].to_numpy(dtype=int),
+    ]
+    summary = {
+        "total_draws": TOTAL_DRAWS,
+        "p_any_prize": float(dist.loc[mask_prize, "sorteos"].sum() / TOTAL_DRAWS),
+        "p_ge3_nums": ge3 / TOTAL_DRAWS,
+    }
+    return dist, summary
@@ -0,0 +1,141 @@
+# app/feature_store.py
+from __future__ import annotations
+
+import tempfile
+from functools import lru_cache
+from itertools import combinations
+from math import comb
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+# Tabla precalculada de rasgos de TODAS las quintetas posibles (5 de 50)
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+FEATURES_PATH = DATA_DIR / "quintet_features.npy"
+
+N_NUMBERS = 50
+N_QUINTETS = comb(N_NUMBERS, 5)  # 2.118.760
+
+# Columnas compactas (7 bytes por quinteta, ~15 MB en disco)
+FEATURES_DTYPE = np.dtype(
+    [
+        ("sum", np.uint16),        # suma de los 5 números
+        ("popularity", np.uint8),  # generator._popularity_score
+        ("max_run", np.uint8),     # racha máxima de consecutivos
+        ("decades", np.uint16),    # perfil de decenas codificado en base 6
+        ("le31", np.uint8),        # cuántos números son ≤ 31 ("fechas")
+    ]
+)
+
+# _BINOM[v, i] = C(v, i), para el rango combinatorio
+_BINOM = np.array(
+    [[comb(v, i) for i in range(6)] for v in range(N_NUMBERS + 1)],
+    dtype=np.int64,
+)
+
+
+# ---------- rango combinatorio ----------
+
+def quintet_rank(nums: Sequence[int] | np.ndarray) -> np.ndarray | int:
+    """
+    Rango combinatorio (orden colex, 0..N_QUINTETS-1) de una quinteta o de
+    un array (n, 5) de quintetas. No hace falta que vengan ordenadas.
+
+    rango = Σ C(c_i, i+1), con c_0 < ... < c_4 los números en base 0.
+    """
+    arr = np.sort(np.asarray(nums, dtype=np.int64), axis=-1) - 1
+    ranks = _BINOM[arr, np.arange(1, 6)].sum(axis=-1)
+    if ranks.ndim == 0:
+        return int(ranks)
+    return ranks
+
+
+def quintets_in_rank_order() -> np.ndarray:
+    """Array (N_QUINTETS, 5) con todas las quintetas ordenadas por rango."""
+    flat = np.fromiter(
+        (x for c in combinations(range(1, N_NUMBERS + 1), 5) for x in c),
+        dtype=np.int16,
+        count=N_QUINTETS * 5,
+    )
+    lex = flat.reshape(-1, 5)
+    out = np.empty_like(lex)
+    out[quintet_rank(lex)] = lex
+    return out
+
+
+# ---------- rasgos ----------
+
+def decade_counts(codes: np.ndarray | int) -> np.ndarray:
+    """Decodifica el perfil de decenas → cuántos números caen en 1–10, …, 41–50."""
+    codes = np.asarray(codes, dtype=np.int64)
+    return np.stack([(codes // 6**d) % 6 for d in range(5)], axis=-1)
+
+
+def _compute_features(quintets: np.ndarray) -> np.ndarray:
+    """Calcula los rasgos de un array (n, 5) de quintetas ordenadas."""
+    from app.generator import _popularity_scores
+
+    quintets = quintets.astype(np.int64)
+    out = np.empty(len(quintets), dtype=FEATURES_DTYPE)
+
+    out["sum"] = quintets.sum(axis=1)
+    out["popularity"] = _popularity_scores(quintets)
+    out["le31"] = (quintets <= 31).sum(axis=1)
+
+    consec = np.diff(quintets, axis=1) == 1
+    current_run = np.ones(len(quintets), dtype=np.int64)
+    max_run = np.ones(len(quintets), dtype=np.int64)
+    for i in range(consec.shape[1]):
+        current_run = np.where(consec[:, i], current_run + 1, 1)
+        max_run = np.maximum(max_run, current_run)
+    out["max_run"] = max_run
+
+    decades = (quintets - 1) // 10
+    out["decades"] = (6 ** decades).sum(axis=1)
+
+    return out
+
+
+def build_quintet_features(path: Path = FEATURES_PATH) -> Path:
+    """
+    Enumera las 2.118.760 quintetas en orden de rango y guarda sus rasgos
+    en un .npy (se abre luego con mmap). Tarda unos segundos.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    features = _compute_features(quintets_in_rank_order())
+
+    # Temporal único por llamada: dos sesiones (hilos o procesos) que
+    # construyen a la vez no escriben en el mismo fichero; gana el último
+    # replace, y los dos contenidos son iguales
+    tmp_file = tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f"{path.stem}.", suffix=".tmp.npy", delete=False
+    )
+    tmp_path = Path(tmp_file.name)
+    try:
+        with tmp_file:
+            np.save(tmp_file, features)
+        tmp_path.replace(path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return path
+
+
+@lru_cache(maxsize=1)
+def load_quintet_features() -> np.ndarray:
+    """
+    Devuelve la tabla de rasgos abierta con mmap (solo lectura).
+    Si no existe o está incompleta, la construye primero.
+    """
+    if FEATURES_PATH.exists():
+        features = np.load(FEATURES_PATH, mmap_mode="r")
+        if features.dtype == FEATURES_DTYPE and features.shape == (N_QUINTETS,):
+            return features
+
+    build_quintet_features()
+    return np.load(FEATURES_PATH, mmap_mode="r")
+
+
+def lookup_features(nums: Sequence[int] | np.ndarray) -> np.ndarray:
+    """Rasgos (registro estructurado) de una quinteta o de un array (n, 5)."""
+    return load_quintet_features()[quintet_rank(nums)]
@@ -0,0 +1,67 @@
+# app/file_io.py
+from __future__ import annotations
+
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+try:  # bloqueo de ficheros (solo POSIX); sin él se escribe sin bloqueo
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# Utilidades de ficheros compartidas por los CSV que solo crecen por el final
+# (combinations_store y el histórico de updater).
+
+# Bloque de lectura hacia atrás (las filas ocupan ~70 bytes)
+_TAIL_BLOCK_BYTES = 1 << 16
+
+
+@contextmanager
+def file_lock(lock_path: Path) -> Iterator[None]:
+    """Cerrojo exclusivo (flock) sobre lock_path mientras dura el bloque."""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def tail_lines(path: Path, n: int) -> Tuple[bytes, bytes]:
+    """
+    (cabecera, últimas n líneas) del fichero, leyendo bloques desde el final
+    hasta tener n saltos de línea completos. El coste depende de n, no del
+    tamaño del fichero. Con n <= 0 el cuerpo sale vacío.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        if n <= 0:
+            return header, b""
+        header_end = f.tell()
+        end = f.seek(0, os.SEEK_END)
+
+        chunks: List[bytes] = []
+        newlines = 0
+        pos = end
+        while pos > header_end and newlines <= n:
+            step = min(_TAIL_BLOCK_BYTES, pos - header_end)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b"\n")
+
+    body = b"".join(reversed(chunks)).rstrip(b"\n")
+    if not body:
+        return header, b""
+
+    lines = body.split(b"\n")
+    # Si no se ha llegado a la cabecera, la primera línea puede estar cortada
+    if pos > header_end:
+        lines = lines[1:]
+    return header, b"\n".join(lines[-n:]) + b"\n"
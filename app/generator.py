@@ -1,11 +1,26 @@
 # app/generator.py
 from __future__ import annotations
 
-from typing import List, Dict, Any, Tuple, Set
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple, Set, Callable
 
 import numpy as np
 import pandas as pd
 
+from app.combinations_store import saved_lines_mask
+from app.store_backend import get_store
+from app.codec import (
+    combo_key,
+    encode_combos,
+    encode_numbers,
+    encode_stars,
+    in_sorted_keys,
+    insert_sorted_keys,
+)
+from app.data_loader import history_version
+from app.feature_store import lookup_features
 from app.metrics import compute_main_number_freq, compute_star_freq
 
 # Inicio de la era de 12 estrellas
@@ -19,6 +34,12 @@ SUM_RANGE_BY_SERIE: Dict[str, Tuple[int, int]] = {
     "C": (100, 120),  # bajo
 }
 
+# Exponente de los pesos hot/cold
+WEIGHT_POWER = 1.5
+
+# Estrategias con pesos propios ("Game Theory" → "Game")
+STRATEGY_MODES = ["Estándar", "Momentum", "Rareza", "Experimental", "Game"]
+
 
 # ---------- utilidades de pesos ----------
 
@@ -72,48 +93,170 @@ def _freq_to_cold_weights(freq: pd.Series, power: float = 1.5) -> np.ndarray:
 
 def _build_seen_combos(
     df_hist: pd.DataFrame,
-) -> Tuple[Set[Tuple[int, ...]], Set[Tuple[int, ...]]]:
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Devuelve dos sets:
+    Devuelve dos arrays ordenados de claves (ver app.codec):
 
-    - seen_numbers: todas las quintetas de números (n1..n5) que han salido
-      en cualquier momento del histórico (2004 → hoy).
+    - seen_numbers: bitmasks de todas las quintetas de números (n1..n5) que
+      han salido en cualquier momento del histórico (2004 → hoy).
 
-    - seen_full_era12: todas las combinaciones completas (5 números + 2 estrellas)
-      que han salido en la era de 12 estrellas (desde 2016-09-27).
+    - seen_full_era12: claves de todas las combinaciones completas
+      (5 números + 2 estrellas) que han salido en la era de 12 estrellas
+      (desde 2016-09-27).
 
     Así:
       - nunca repetimos 5 números vistos en el histórico completo;
       - y evitamos repetir una combinación entera (números+estrellas) de la era 12.
     """
+    empty = np.empty(0, dtype=np.uint64)
+    df_valid = _valid_history(df_hist)
+    if df_valid.empty:
+        return empty, empty
+
+    num_masks, full_era12 = _encode_history_rows(df_valid)
+    return np.unique(num_masks), np.unique(full_era12)
+
+
+_HISTORY_COLS = ["n1", "n2", "n3", "n4", "n5", "s1", "s2"]
+
+
+def _valid_history(df_hist: pd.DataFrame) -> pd.DataFrame:
+    """Filas del histórico con fecha y los 7 valores (las que cuentan para el anti-clon)."""
     if df_hist.empty or "date" not in df_hist.columns:
-        return set(), set()
+        return df_hist.iloc[0:0]
+    return df_hist.dropna(subset=_HISTORY_COLS)
+
 
-    cols_nums = ["n1", "n2", "n3", "n4", "n5"]
-    cols_stars = ["s1", "s2"]
+def _encode_history_rows(df_rows: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Claves de unas filas del histórico: bitmasks de números de todas ellas
+    y claves completas solo de las de la era 12 (sin ordenar ni deduplicar).
+    """
+    values = df_rows[_HISTORY_COLS].to_numpy(dtype=int)
+    num_masks = encode_numbers(values[:, :5])
 
-    seen_numbers: Set[Tuple[int, ...]] = set()
-    seen_full_era12: Set[Tuple[int, ...]] = set()
+    # Para la parte de estrellas, solo contamos la era 12
+    era12 = (df_rows["date"] >= ERA_12_STARS_START).to_numpy()
+    full_era12 = combo_key(num_masks[era12], encode_stars(values[era12, 5:]))
+    return num_masks, full_era12
 
-    for _, row in df_hist.iterrows():
-        try:
-            nums = sorted(int(row[c]) for c in cols_nums)
-        except Exception:
-            continue
 
-        num_key = tuple(nums)
-        seen_numbers.add(num_key)
+# Índice anti-clon que se mantiene entre llamadas: las dos listas ordenadas
+# de claves y una huella (nº de filas, primera y última fila) del histórico
+# indexado, para saber si el que llega es el mismo o lo amplía.
+# Lo usan los scripts de Streamlit y el hilo de history_refresher (vía
+# _seen_index_append): nunca se modifica en sitio, cada cambio publica un
+# dict nuevo con una sola asignación, y los cambios van bajo el cerrojo.
+_SEEN_INDEX: Dict[str, Any] = {}
+_SEEN_INDEX_LOCK = threading.Lock()
 
-        # Para la parte de estrellas, solo contamos la era 12
-        if row["date"] >= ERA_12_STARS_START:
-            try:
-                stars = sorted(int(row[c]) for c in cols_stars)
-            except Exception:
-                continue
-            combo_key = tuple(nums + stars)
-            seen_full_era12.add(combo_key)
 
-    return seen_numbers, seen_full_era12
+def _row_fingerprint(df_valid: pd.DataFrame, i: int) -> Tuple[Any, ...]:
+    row = df_valid.iloc[i]
+    return (pd.Timestamp(row["date"]), *(int(row[c]) for c in _HISTORY_COLS))
+
+
+def _store_seen_index(
+    df_valid: pd.DataFrame,
+    numbers: np.ndarray,
+    full: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    global _SEEN_INDEX
+    numbers.setflags(write=False)
+    full.setflags(write=False)
+    _SEEN_INDEX = dict(
+        n_rows=len(df_valid),
+        first=_row_fingerprint(df_valid, 0),
+        last=_row_fingerprint(df_valid, -1),
+        numbers=numbers,
+        full=full,
+    )
+    return numbers, full
+
+
+def _seen_index(df_hist: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Igual que `_build_seen_combos`, pero mantenido entre llamadas:
+
+      - mismo histórico que el indexado → devuelve los arrays guardados
+        (solo se comparan nº de filas y primera/última fila);
+      - histórico que amplía el indexado (mismas filas + sorteos nuevos al
+        final) → codifica solo las filas nuevas y las inserta en su sitio;
+      - cualquier otro → se reconstruye.
+
+    Los arrays devueltos son de solo lectura.
+    """
+    df_valid = _valid_history(df_hist)
+    if df_valid.empty:
+        empty = np.empty(0, dtype=np.uint64)
+        return empty, empty
+
+    with _SEEN_INDEX_LOCK:
+        index = _SEEN_INDEX
+        n = index.get("n_rows", 0)
+        if n and len(df_valid) >= n and _matches_seen_index(index, df_valid.iloc[:n]):
+            if len(df_valid) == n:
+                return index["numbers"], index["full"]
+            return _extend_seen_index(index, df_valid.iloc[n:])
+
+        return _store_seen_index(df_valid, *_build_seen_combos(df_valid))
+
+
+def _matches_seen_index(index: Dict[str, Any], df_valid: pd.DataFrame) -> bool:
+    """True si el índice anti-clon `index` se construyó exactamente con df_valid."""
+    return (
+        bool(index)
+        and len(df_valid) == index["n_rows"]
+        and _row_fingerprint(df_valid, 0) == index["first"]
+        and _row_fingerprint(df_valid, -1) == index["last"]
+    )
+
+
+def _seen_index_append(df_before_tail: pd.DataFrame, df_new: pd.DataFrame) -> None:
+    """
+    Aviso del updater: al histórico, que terminaba en `df_before_tail` (sus
+    últimas filas), se le han añadido al final los sorteos `df_new`. Si el
+    índice terminaba en esa misma fila se amplía solo con los nuevos; si no,
+    se descarta y se reconstruirá al usarlo.
+    """
+    global _SEEN_INDEX
+    df_before_tail = _valid_history(df_before_tail)
+    with _SEEN_INDEX_LOCK:
+        index = _SEEN_INDEX
+        if (
+            index
+            and not df_before_tail.empty
+            and _row_fingerprint(df_before_tail, -1) == index["last"]
+        ):
+            _extend_seen_index(index, df_new)
+        else:
+            _SEEN_INDEX = {}
+
+
+def _extend_seen_index(index: Dict[str, Any], df_new: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Añade al índice anti-clon `index` los sorteos `df_new`, que van justo
+    después de los ya indexados, y publica el resultado como _SEEN_INDEX.
+    Coste proporcional a los sorteos nuevos. Se llama con _SEEN_INDEX_LOCK.
+    """
+    global _SEEN_INDEX
+    df_new = _valid_history(df_new)
+    if df_new.empty:
+        return index["numbers"], index["full"]
+
+    num_masks, full_era12 = _encode_history_rows(df_new)
+    numbers = insert_sorted_keys(index["numbers"], num_masks)
+    full = insert_sorted_keys(index["full"], full_era12)
+    numbers.setflags(write=False)
+    full.setflags(write=False)
+    _SEEN_INDEX = dict(
+        index,
+        n_rows=index["n_rows"] + len(df_new),
+        last=_row_fingerprint(df_new, -1),
+        numbers=numbers,
+        full=full,
+    )
+    return numbers, full
 
 
 # ---------- score de "popularidad visual" ----------
@@ -178,161 +321,618 @@ def _popularity_score(nums: List[int]) -> int:
     return score
 
 
-# ---------- sampling de una línea con constraints ----------
+def _popularity_scores(nums: np.ndarray) -> np.ndarray:
+    """
+    Versión vectorizada de `_popularity_score` para un array (n, 5) de
+    combinaciones ya ordenadas. Devuelve un array de n scores.
+    """
+    nums = np.asarray(nums)
+    score = np.zeros(len(nums), dtype=int)
+
+    # 1) "Fechas": números 1–31
+    count_le31 = (nums <= 31).sum(axis=1)
+    score += np.where(count_le31 == 5, 4, np.where(count_le31 == 4, 2, 0))
+
+    # 2) Consecutivos
+    consec = np.diff(nums, axis=1) == 1
+    current_run = np.ones(len(nums), dtype=int)
+    max_run = np.ones(len(nums), dtype=int)
+    for i in range(consec.shape[1]):
+        current_run = np.where(consec[:, i], current_run + 1, 1)
+        max_run = np.maximum(max_run, current_run)
+    score += np.select([max_run >= 4, max_run == 3, max_run == 2], [4, 2, 1], 0)
+
+    # 3) Decenas
+    decades = (nums - 1) // 10
+    max_same_decade = np.stack(
+        [(decades == d).sum(axis=1) for d in range(5)], axis=1
+    ).max(axis=1)
+    score += np.where(max_same_decade >= 4, 3, np.where(max_same_decade == 3, 1, 0))
+
+    # 4) Múltiplos de 5
+    mult5 = (nums % 5 == 0).sum(axis=1)
+    score += np.where(mult5 >= 4, 3, np.where(mult5 == 3, 1, 0))
+
+    return score
+
+
+# ---------- sampling por lotes con constraints ----------
+
+def _weighted_draws(
+    weights: np.ndarray,
+    k: int,
+    size: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    Muestrea `size` filas de `k` valores distintos (1..len(weights)) sin
+    reemplazo y según los pesos, todo en una sola operación NumPy.
+
+    Usa el truco Gumbel-top-k: ordenar log(w) + ruido Gumbel y quedarse con
+    los k mayores equivale a sacar bolas una a una proporcionalmente al peso
+    restante (lo mismo que hace np.random.choice(replace=False, p=w)).
+    """
+    with np.errstate(divide="ignore"):
+        log_w = np.log(np.asarray(weights, dtype=float))
+    keys = log_w[None, :] + rng.gumbel(size=(size, len(log_w)))
+    top = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+    return np.sort(top + 1, axis=1)
+
+
+def _sum_tables(weights: np.ndarray, k: int = 5) -> np.ndarray:
+    """
+    Tablas condicionadas por suma para muestrear k números sin reemplazo,
+    una por fila de `weights` (G, n).
+
+    tables[g, i, j, s] = suma de prod(w_g) de todos los subconjuntos de j
+    números tomados de {i+1, ..., n} cuya suma es s.
+    """
+    weights = np.asarray(weights, dtype=float)
+    n_groups, n = weights.shape
+    max_sum = sum(range(n - k + 1, n + 1))
+
+    tables = np.zeros((n_groups, n + 1, k + 1, max_sum + 1), dtype=float)
+    tables[:, n, 0, 0] = 1.0
+    for i in range(n - 1, -1, -1):
+        v = i + 1
+        tables[:, i] = tables[:, i + 1]
+        tables[:, i, 1:, v:] += (
+            weights[:, i, None, None] * tables[:, i + 1, :-1, : max_sum + 1 - v]
+        )
+    return tables
+
+
+@lru_cache(maxsize=64)
+def _sum_table(weights_bytes: bytes, k: int = 5) -> np.ndarray:
+    """Tabla de `_sum_tables` para un único vector de pesos (cacheada por sus bytes)."""
+    weights = np.frombuffer(weights_bytes, dtype=float)
+    return _sum_tables(weights[None, :], k)[0]
+
+
+def _sum_conditioned_draws(
+    weights: np.ndarray,
+    min_sum: int,
+    max_sum: int,
+    size: int,
+    rng: np.random.Generator,
+    k: int = 5,
+) -> np.ndarray:
+    """
+    Muestrea `size` filas de k números distintos cuya suma cae SIEMPRE en
+    [min_sum, max_sum], sin rechazo.
+
+    La distribución es la ponderada P(S) ∝ prod(w_i, i ∈ S) restringida al
+    intervalo de suma (ver `_grouped_sum_draws`).
+    """
+    weights = np.ascontiguousarray(weights, dtype=float)
+    table = _sum_table(weights.tobytes(), k)
+
+    lo = max(int(min_sum), 0)
+    hi = min(int(max_sum), table.shape[2] - 1)
+    if lo > hi or table[0, k, lo : hi + 1].sum() <= 0:
+        raise ValueError(f"No hay combinaciones con suma en [{min_sum}, {max_sum}].")
+
+    # Un solo grupo (pesos, intervalo): todas las filas comparten la CDF
+    return _grouped_sum_draws(
+        table[None],
+        weights[None, :],
+        np.array([[0, lo, hi]]),
+        np.zeros(size, dtype=np.intp),
+        rng,
+        k,
+    )
+
+
+def _sum_groups(
+    groups: np.ndarray,
+    min_sums: np.ndarray,
+    max_sums: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estructura de grupos para `_grouped_sum_draws`: las ternas distintas
+    (grupo de pesos, suma mínima, suma máxima) (U, 3) y el índice de la
+    terna de cada elemento. Conviene calcularla sobre pocos elementos (p. ej.
+    una por entrada del plan) y repetir el índice para las filas.
+    """
+    keys = np.stack([groups, min_sums, max_sums], axis=1)
+    uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return uniq, inverse.ravel()
+
+
+def _grouped_sum_draws(
+    tables: np.ndarray,
+    weights: np.ndarray,
+    sum_keys: np.ndarray,
+    key_of_row: np.ndarray,
+    rng: np.random.Generator,
+    k: int = 5,
+) -> np.ndarray:
+    """
+    Versión por grupos de `_sum_conditioned_draws`: la fila r usa la terna
+    sum_keys[key_of_row[r]] = (grupo, suma mínima, suma máxima), es decir,
+    los pesos weights[grupo] (tablas de `_sum_tables`) y ese intervalo de
+    suma (ver `_sum_groups`). Así se muestrean de una vez líneas con pesos
+    distintos (p. ej. todos los sorteos de un backtest).
+
+    Primero se elige la suma objetivo según su masa en la tabla y luego se
+    decide número a número si entra, con la probabilidad exacta que deja
+    completar esa suma. Coste acotado: n pasos vectorizados.
+    Los intervalos sin masa deben descartarse antes de llamar.
+    """
+    n = weights.shape[1]
+    size = len(key_of_row)
+    n_sums = tables.shape[3]
+
+    # Suma objetivo: CDF de cada terna, concatenadas con un desplazamiento
+    # entero para resolverlas con un solo searchsorted
+    sums = np.arange(n_sums)
+    mass = tables[sum_keys[:, 0], 0, k, :] * (
+        (sums >= sum_keys[:, 1:2]) & (sums <= sum_keys[:, 2:3])
+    )
+    cdf = np.cumsum(mass, axis=1)
+    cdf = cdf / cdf[:, -1:] + np.arange(len(sum_keys))[:, None]
+    pos = np.searchsorted(cdf.ravel(), key_of_row + rng.random(size), side="right")
+    remaining_sum = np.minimum(pos - key_of_row * n_sums, n_sums - 1)
+
+    # Tablas aplanadas: índice j * n_sums + s, un único take por fila y paso.
+    # Con un solo grupo (caso del generador) ni siquiera hace falta indexar
+    # por grupo
+    single = len(tables) == 1
+    flat = tables.reshape(len(tables), n + 1, (k + 1) * n_sums)
+    groups = sum_keys[key_of_row, 0]
+
+    remaining_k = np.full(size, k)
+    out = np.zeros((size, k + 1), dtype=int)  # columna extra: descarte
+    u = rng.random((n, size))
+    rows = np.arange(size)
+
+    for i in range(n):
+        v = i + 1
+        # Filas ya completas (k=0) o sin suma suficiente: nunca cogen v
+        ok = (remaining_k > 0) & (remaining_sum >= v)
+        cell_numer = np.maximum(remaining_k - 1, 0) * n_sums + np.maximum(remaining_sum - v, 0)
+        cell_denom = remaining_k * n_sums + remaining_sum
+        if single:
+            numer = flat[0, i + 1].take(cell_numer)
+            denom = flat[0, i].take(cell_denom)
+            w_v = weights[0, i]
+        else:
+            numer = flat[groups, i + 1, cell_numer]
+            denom = flat[groups, i, cell_denom]
+            w_v = weights[groups, i]
+        take = ok & (u[i] * denom < w_v * numer)
+        out[rows, np.where(take, k - remaining_k, k)] = v
+        remaining_k -= take
+        remaining_sum -= v * take
+
+    return out[:, :k]
+
 
-def _sample_line(
+# Candidatas por lote en `_sample_lines` (mínimo y máximo)
+_MIN_BATCH = 256
+_MAX_BATCH = 65536
+
+
+def _sample_lines(
     weights_main: np.ndarray,
     weights_stars: np.ndarray,
     serie: str,
-    seen_numbers: Set[Tuple[int, ...]],
-    seen_full_era12: Set[Tuple[int, ...]],
-    block_seen_full: Set[Tuple[int, ...]],
+    n_lines: int,
+    seen_number_keys: np.ndarray,
+    seen_full_keys: np.ndarray,
+    block_seen_full: Set[int] | None,
     mode_name: str | None = None,
-    max_tries: int = 500,
-) -> Tuple[List[int], List[int]]:
+    rng: np.random.Generator | None = None,
+    max_batches: int = 20,
+    saved_index: Dict[str, Any] | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Muestra una línea (5 números + 2 estrellas) respetando:
+    Muestrea `n_lines` líneas (5 números + 2 estrellas) respetando:
 
       - pesos de números y estrellas
       - rango de suma por serie
       - anti-clon sobre histórico y bloque
       - en modo "Game" (Game Theory): penaliza combinaciones "populares visualmente".
-    """
-    # Rango de suma por serie (A/B/C)
-    min_sum, max_sum = SUM_RANGE_BY_SERIE.get(serie, (100, 158))
+      - con saved_index (ver combinations_store.load_saved_index): nunca
+        repite una línea ya guardada en el store.
 
-    last_nums: List[int] | None = None
-    last_stars: List[int] | None = None
+    Los números se muestrean ya dentro del rango de suma de la serie (sin
+    rechazo); el resto de filtros se aplican como máscaras sobre lotes de
+    candidatas y de las supervivientes se queda con las primeras.
+    Devuelve dos arrays: números (n_lines, 5) y estrellas (n_lines, 2).
 
-    for _ in range(max_tries):
-        # 1) muestreamos números y estrellas según los pesos
-        nums_arr = np.random.choice(
-            np.arange(1, 51),
-            size=5,
-            replace=False,
-            p=weights_main,
-        )
-        nums = sorted(int(x) for x in nums_arr)
+    Si tras max_batches lotes no hay n_lines supervivientes, lanza ValueError.
 
-        stars_arr = np.random.choice(
-            np.arange(1, 13),
-            size=2,
-            replace=False,
-            p=weights_stars,
-        )
-        stars = sorted(int(x) for x in stars_arr)
+    Con block_seen_full=None no se deduplica: sirve para sacar de golpe las
+    líneas de muchos bloques distintos (simulador), que se deduplican luego
+    bloque a bloque en `_sample_blocks`.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    n_lines = int(n_lines)
+    if n_lines <= 0:
+        return np.empty((0, 5), dtype=int), np.empty((0, 2), dtype=int)
 
-        last_nums, last_stars = nums, stars
+    # Rango de suma por serie (A/B/C)
+    min_sum, max_sum = SUM_RANGE_BY_SERIE.get(serie, (100, 158))
+    max_batches += n_lines // _MAX_BATCH
 
-        suma = sum(nums)
+    acc_nums: List[np.ndarray] = []
+    acc_stars: List[np.ndarray] = []
+    n_acc = 0
+    accept_rate = 0.5  # a priori; luego, la observada en los lotes anteriores
 
-        # 2) rango de suma por serie
-        if not (min_sum <= suma <= max_sum):
-            continue
+    for _ in range(max_batches):
+        # Lote a la medida de lo que falta según la tasa de aceptación
+        # (casi todas las candidatas pasan los filtros salvo en Game)
+        need = n_lines - n_acc
+        batch_size = int(min(max(_MIN_BATCH, 1.1 * need / max(accept_rate, 0.05)), _MAX_BATCH))
 
-        # 3) penalización "Game Theory" (solo para modo Game)
+        # 1) números según los pesos, ya dentro del rango de suma de la serie
+        nums = _sum_conditioned_draws(weights_main, min_sum, max_sum, batch_size, rng)
+        stars = _weighted_draws(weights_stars, 2, batch_size, rng)
+
+        # 2) penalización "Game Theory" (solo para modo Game): score de
+        #    popularidad leído de la tabla precalculada por rango
         if mode_name == "Game":
-            pop_score = _popularity_score(nums)
-            # umbral: descartamos combinaciones demasiado "populares"
-            if pop_score >= 3:
-                continue
+            mask = lookup_features(nums)["popularity"] < 3
+            nums, stars = nums[mask], stars[mask]
+
+        num_keys = encode_numbers(nums)
+        full_keys = combo_key(num_keys, encode_stars(stars))
+
+        # 3) Nunca repetir quinteta de números ya vista en TODO el histórico
+        # 4) No repetir combinación completa de la era 12
+        mask = ~in_sorted_keys(num_keys, seen_number_keys) & ~in_sorted_keys(full_keys, seen_full_keys)
+
+        # 4b) Ni una línea que ya tengas guardada
+        if saved_index is not None:
+            mask &= ~saved_lines_mask(saved_index, nums, full_keys)
+
+        # 5) No repetir combinación dentro del mismo bloque (ni dentro del lote)
+        if block_seen_full is not None:
+            if block_seen_full:
+                block_keys = np.fromiter(block_seen_full, dtype=np.uint64)
+                mask &= ~np.isin(full_keys, block_keys)
+            _, first_idx = np.unique(full_keys, return_index=True)
+            first = np.zeros(len(full_keys), dtype=bool)
+            first[first_idx] = True
+            mask &= first
+
+        survivors = np.flatnonzero(mask)
+        accept_rate = len(survivors) / batch_size
+        idx = survivors[:need]
+        acc_nums.append(nums[idx])
+        acc_stars.append(stars[idx])
+        if block_seen_full is not None:
+            block_seen_full.update(int(k) for k in full_keys[idx])
+        n_acc += len(idx)
+        if n_acc >= n_lines:
+            break
+    else:
+        # Sin relleno con candidatas que no pasan los filtros: se repetirían
+        # líneas del histórico, del store o del propio bloque
+        raise ValueError(
+            f"Solo se han encontrado {n_acc} de {n_lines} líneas válidas para la "
+            f"serie {serie} tras {max_batches} lotes de candidatas."
+        )
 
-        num_key = tuple(nums)
-        combo_key = tuple(nums + stars)
+    return np.concatenate(acc_nums), np.concatenate(acc_stars)
 
-        # 4) Nunca repetir quinteta de números ya vista en TODO el histórico
-        if num_key in seen_numbers:
-            continue
 
-        # 5) No repetir combinación completa de la era 12
-        if combo_key in seen_full_era12:
-            continue
+# ---------- pesos por modo ----------
 
-        # 6) No repetir combinación dentro del mismo bloque
-        if combo_key in block_seen_full:
-            continue
+# Caché de pesos: (versión del histórico, recent_window, power) → pesos de
+# TODAS las estrategias, calculados juntos a partir de una sola tabla de
+# frecuencias recientes.
+_WEIGHTS_CACHE: "OrderedDict[Tuple[str, int, float], Dict[str, Tuple[np.ndarray, np.ndarray]]]" = OrderedDict()
+_WEIGHTS_CACHE_SIZE = 8
+# Las OrderedDict se reordenan al leer: todo acceso va bajo este cerrojo
+_WEIGHTS_CACHE_LOCK = threading.Lock()
 
-        block_seen_full.add(combo_key)
-        return nums, stars
 
-    # Fallback defensivo si no encontró nada que cumpla todo
-    if last_nums is None:
-        last_nums = sorted(
-            np.random.choice(np.arange(1, 51), size=5, replace=False)
-        )
-        last_stars = sorted(
-            np.random.choice(np.arange(1, 13), size=2, replace=False)
-        )
+def _recent_freqs(
+    df_hist: pd.DataFrame,
+    recent_window: int = 200,
+) -> Tuple[pd.Series, pd.Series]:
+    """Frecuencias de números y estrellas en los últimos `recent_window` sorteos."""
+    # Dataset reciente
+    df_sorted = df_hist.sort_values("date") if not df_hist.empty else df_hist
+    df_recent = (
+        df_sorted.tail(recent_window)
+        if len(df_sorted) > recent_window
+        else df_sorted
+    )
 
-    return last_nums, last_stars
+    if not df_recent.empty:
+        return compute_main_number_freq(df_recent), compute_star_freq(df_recent)
+    return (
+        pd.Series([0] * 50, index=range(1, 51)),
+        pd.Series([0] * 12, index=range(1, 13)),
+    )
 
 
-# ---------- pesos por modo ----------
+def _mode_weights(
+    df_hist: pd.DataFrame,
+    recent_window: int = 200,
+    power: float = WEIGHT_POWER,
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    {estrategia: (weights_main, weights_stars)} para todas las STRATEGY_MODES,
+    cacheado por versión del histórico. Los arrays son de solo lectura
+    porque se comparten entre llamadas.
+    """
+    key = (history_version(df_hist), int(recent_window), float(power))
+    with _WEIGHTS_CACHE_LOCK:
+        if key in _WEIGHTS_CACHE:
+            _WEIGHTS_CACHE.move_to_end(key)
+            return _WEIGHTS_CACHE[key]
+
+    freq_main, freq_stars = _recent_freqs(df_hist, recent_window)
+    weights = _all_weights_from_freq(freq_main, freq_stars, power)
+    for pair in weights.values():
+        for w in pair:
+            w.setflags(write=False)
+
+    with _WEIGHTS_CACHE_LOCK:
+        _WEIGHTS_CACHE[key] = weights
+        while len(_WEIGHTS_CACHE) > _WEIGHTS_CACHE_SIZE:
+            _WEIGHTS_CACHE.popitem(last=False)
+    return weights
+
 
 def _build_weights_for_mode(
     mode: str,
     df_hist: pd.DataFrame,
     recent_window: int = 200,
+    power: float = WEIGHT_POWER,
 ) -> Tuple[np.ndarray, np.ndarray]:
     """
     Devuelve (weights_main, weights_stars) según el modo.
     En Estándar => uniformes.
     En Momentum / Rareza / Experimental / Game Theory => usan frecuencias.
+    Sale de la caché de `_mode_weights` (no recalcula frecuencias).
     """
     # "Game Theory" → "Game"
     mode_name = mode.split()[0]  # "Estándar", "Momentum", "Rareza", "Experimental", "Game"
 
-    # Dataset reciente
-    df_sorted = df_hist.sort_values("date") if not df_hist.empty else df_hist
-    df_recent = (
-        df_sorted.tail(recent_window)
-        if len(df_sorted) > recent_window
-        else df_sorted
+    weights = _mode_weights(df_hist, recent_window, power)
+    if mode_name in weights:
+        return weights[mode_name]
+    return _uniform_weights(50), _uniform_weights(12)
+
+
+def _all_weights_from_freq(
+    freq_recent_main: pd.Series,
+    freq_recent_stars: pd.Series,
+    power: float = WEIGHT_POWER,
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Pesos de todas las estrategias de una vez: hot y cold se calculan una
+    sola vez y se reutilizan (Experimental los mezcla, Game usa los cold).
+    Es la única definición de los pesos por estrategia (generador,
+    simulador y backtest).
+    """
+    hot = (
+        _freq_to_hot_weights(freq_recent_main, power),
+        _freq_to_hot_weights(freq_recent_stars, power),
+    )
+    cold = (
+        _freq_to_cold_weights(freq_recent_main, power),
+        _freq_to_cold_weights(freq_recent_stars, power),
     )
+    mixed = tuple(_blend_weights(h, c) for h, c in zip(hot, cold))
+    return {
+        "Estándar": (_uniform_weights(50), _uniform_weights(12)),
+        "Momentum": hot,
+        "Rareza": cold,
+        "Experimental": mixed,
+        "Game": (cold[0].copy(), cold[1].copy()),
+    }
+
+
+def _blend_weights(w_hot: np.ndarray, w_cold: np.ndarray) -> np.ndarray:
+    """Mezcla 50/50 de pesos hot y cold (modo Experimental), normalizada."""
+    w = 0.5 * w_hot + 0.5 * w_cold
+    return w / w.sum()
 
-    if not df_recent.empty:
-        freq_recent_main = compute_main_number_freq(df_recent)
-        freq_recent_stars = compute_star_freq(df_recent)
-    else:
-        freq_recent_main = pd.Series([0] * 50, index=range(1, 51))
-        freq_recent_stars = pd.Series([0] * 12, index=range(1, 13))
 
-    if mode_name == "Estándar":
-        w_main = _uniform_weights(50)
-        w_stars = _uniform_weights(12)
+# ---------- interfaz pública ----------
 
-    elif mode_name == "Momentum":
-        w_main = _freq_to_hot_weights(freq_recent_main)
-        w_stars = _freq_to_hot_weights(freq_recent_stars)
+def _block_plan(
+    mode: str,
+    df_hist: pd.DataFrame,
+    lines_A: int,
+    lines_B: int,
+    lines_C: int,
+) -> List[Dict[str, Any]]:
+    """
+    Describe cómo se compone un bloque: una entrada por (serie, estrategia)
+    con el nº de líneas y los pesos a usar. Así los pesos se calculan una sola
+    vez aunque luego se generen muchos bloques (simulador).
+    """
+    return _plan_from_weights(
+        mode,
+        lambda m: _build_weights_for_mode(m, df_hist),
+        lines_A,
+        lines_B,
+        lines_C,
+    )
 
-    elif mode_name == "Rareza":
-        w_main = _freq_to_cold_weights(freq_recent_main)
-        w_stars = _freq_to_cold_weights(freq_recent_stars)
 
-    elif mode_name == "Experimental":
-        w_hot_main = _freq_to_hot_weights(freq_recent_main)
-        w_cold_main = _freq_to_cold_weights(freq_recent_main)
-        w_main = 0.5 * w_hot_main + 0.5 * w_cold_main
-        w_main = w_main / w_main.sum()
+def _plan_from_weights(
+    mode: str,
+    weights_for: Callable[[str], Tuple[np.ndarray, np.ndarray]],
+    lines_A: int,
+    lines_B: int,
+    lines_C: int,
+) -> List[Dict[str, Any]]:
+    """Como `_block_plan`, pero con los pesos de cada modo dados por `weights_for`."""
+    plan: List[Dict[str, Any]] = []
 
-        w_hot_stars = _freq_to_hot_weights(freq_recent_stars)
-        w_cold_stars = _freq_to_cold_weights(freq_recent_stars)
-        w_stars = 0.5 * w_hot_stars + 0.5 * w_cold_stars
-        w_stars = w_stars / w_stars.sum()
+    # MODO MIX ESTRATEGIAS: 1 línea por estrategia y serie
+    if mode.startswith("Mix"):
+        sub_modes = ["Estándar", "Momentum", "Rareza", "Experimental", "Game Theory"]
+        weights = {m: weights_for(m) for m in sub_modes}
+        for serie in ["A", "B", "C"]:
+            for sub_mode in sub_modes:
+                w_main, w_stars = weights[sub_mode]
+                plan.append(
+                    {
+                        "serie": serie,
+                        "n_lines": 1,
+                        "w_main": w_main,
+                        "w_stars": w_stars,
+                        "mode_name": sub_mode.split()[0],
+                        "sub_mode": sub_mode,
+                    }
+                )
+        return plan
+
+    # RESTO DE MODOS (comportamiento normal)
+    w_main, w_stars = weights_for(mode)
+    for serie, n_lines in [("A", lines_A), ("B", lines_B), ("C", lines_C)]:
+        plan.append(
+            {
+                "serie": serie,
+                "n_lines": int(n_lines),
+                "w_main": w_main,
+                "w_stars": w_stars,
+                "mode_name": mode.split()[0],
+            }
+        )
+    return plan
 
-    elif mode_name == "Game":
-        # Base "Rareza": preferimos números y estrellas fríos
-        w_main = _freq_to_cold_weights(freq_recent_main)
-        w_stars = _freq_to_cold_weights(freq_recent_stars)
 
-    else:
-        w_main = _uniform_weights(50)
-        w_stars = _uniform_weights(12)
+def _sample_block(
+    plan: List[Dict[str, Any]],
+    seen_number_keys: np.ndarray,
+    seen_full_keys: np.ndarray,
+    rng: np.random.Generator | None = None,
+    saved_index: Dict[str, Any] | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Genera un bloque según `plan` y lo devuelve como arrays:
+    números (n_lineas, 5) y estrellas (n_lineas, 2), en el orden del plan.
+    """
+    block_seen_full: Set[int] = set()
+    nums_parts: List[np.ndarray] = []
+    stars_parts: List[np.ndarray] = []
+
+    for item in plan:
+        nums, stars = _sample_lines(
+            weights_main=item["w_main"],
+            weights_stars=item["w_stars"],
+            serie=item["serie"],
+            n_lines=item["n_lines"],
+            seen_number_keys=seen_number_keys,
+            seen_full_keys=seen_full_keys,
+            block_seen_full=block_seen_full,
+            mode_name=item["mode_name"],
+            rng=rng,
+            saved_index=saved_index,
+        )
+        nums_parts.append(nums)
+        stars_parts.append(stars)
 
-    return w_main, w_stars
+    if not nums_parts:
+        return np.empty((0, 5), dtype=int), np.empty((0, 2), dtype=int)
+    return np.concatenate(nums_parts), np.concatenate(stars_parts)
 
 
-# ---------- interfaz pública ----------
+def _sample_blocks(
+    plan: List[Dict[str, Any]],
+    seen_number_keys: np.ndarray,
+    seen_full_keys: np.ndarray,
+    n_blocks: int,
+    rng: np.random.Generator | None = None,
+    max_dedup_passes: int = 20,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Genera `n_blocks` bloques independientes según `plan` de una sola vez.
+
+    Devuelve arrays (n_blocks, n_lineas, 5) y (n_blocks, n_lineas, 2). Las
+    líneas de cada estrategia/serie se muestrean todas juntas; después se
+    buscan combinaciones repetidas dentro de un mismo bloque y solo esas
+    se vuelven a muestrear. Si tras max_dedup_passes remuestreos sigue
+    habiendo repetidas, lanza ValueError.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    n_blocks = int(n_blocks)
+    n_lines = sum(item["n_lines"] for item in plan)
+    nums = np.empty((n_blocks, n_lines, 5), dtype=int)
+    stars = np.empty((n_blocks, n_lines, 2), dtype=int)
+    if n_blocks <= 0 or n_lines == 0:
+        return nums, stars
+
+    def fill(item: Dict[str, Any], count: int) -> Tuple[np.ndarray, np.ndarray]:
+        return _sample_lines(
+            weights_main=item["w_main"],
+            weights_stars=item["w_stars"],
+            serie=item["serie"],
+            n_lines=count,
+            seen_number_keys=seen_number_keys,
+            seen_full_keys=seen_full_keys,
+            block_seen_full=None,
+            mode_name=item["mode_name"],
+            rng=rng,
+        )
+
+    # Columna de inicio de cada entrada del plan dentro del bloque
+    starts = np.cumsum([0] + [item["n_lines"] for item in plan])
+    for item, start in zip(plan, starts):
+        if item["n_lines"] == 0:
+            continue
+        cols = slice(start, start + item["n_lines"])
+        item_nums, item_stars = fill(item, n_blocks * item["n_lines"])
+        nums[:, cols] = item_nums.reshape(n_blocks, item["n_lines"], 5)
+        stars[:, cols] = item_stars.reshape(n_blocks, item["n_lines"], 2)
+
+    # No repetir combinación dentro del mismo bloque
+    for attempt in range(max_dedup_passes + 1):
+        keys = encode_combos(nums, stars)
+        order = np.argsort(keys, axis=1, kind="stable")
+        sorted_keys = np.take_along_axis(keys, order, axis=1)
+        dup_sorted = np.zeros_like(sorted_keys, dtype=bool)
+        dup_sorted[:, 1:] = sorted_keys[:, 1:] == sorted_keys[:, :-1]
+        if not dup_sorted.any():
+            break
+        if attempt == max_dedup_passes:
+            raise ValueError(
+                f"Quedan {int(dup_sorted.sum())} líneas repetidas dentro de sus bloques "
+                f"tras {max_dedup_passes} remuestreos."
+            )
+        dup = np.zeros_like(dup_sorted)
+        np.put_along_axis(dup, order, dup_sorted, axis=1)
+
+        for item, start in zip(plan, starts):
+            rows, cols = np.nonzero(dup[:, start : start + item["n_lines"]])
+            if len(rows):
+                new_nums, new_stars = fill(item, len(rows))
+                nums[rows, start + cols] = new_nums
+                stars[rows, start + cols] = new_stars
+
+    return nums, stars
+
 
 def generate_block(
     mode: str,
@@ -340,6 +940,8 @@ def generate_block(
     lines_A: int,
     lines_B: int,
     lines_C: int,
+    rng: np.random.Generator | None = None,
+    exclude_saved: bool = True,
 ) -> List[Dict[str, Any]]:
     """
     Genera un bloque de combinaciones para las series A/B/C según el modo.
@@ -348,71 +950,36 @@ def generate_block(
       - no repite quintetas de números vistas en el histórico completo
       - no repite combinaciones completas de la era de 12 estrellas
       - respeta límites de suma por serie
+      - con exclude_saved=True, no repite líneas (5+2) ya guardadas en
+        el store de combinaciones (app.store_backend)
 
     En modo "Mix estrategias":
       - ignora lines_A/B/C
       - genera 5 líneas por serie (A, B, C), una por cada estrategia:
         Estándar, Momentum, Rareza, Experimental, Game Theory
     """
-
-    mode_name = mode.split()[0]  # "Estándar", "Momentum", "Rareza", "Experimental", "Game"
-
     # Histórico usado para anti-clon: números = todo, estrellas = era 12
-    seen_numbers, seen_full_era12 = _build_seen_combos(df_hist)
-    block_seen_full: set[tuple[int, ...]] = set()
-
-    # ------------------------------
-    # MODO MIX ESTRATEGIAS
-    # ------------------------------
-    if mode.startswith("Mix"):
-        sub_modes = ["Estándar", "Momentum", "Rareza", "Experimental", "Game Theory"]
-        block: List[Dict[str, Any]] = []
-
-        for serie in ["A", "B", "C"]:
-            for sub_mode in sub_modes:
-                w_main, w_stars = _build_weights_for_mode(sub_mode, df_hist)
-                nums, stars = _sample_line(
-                    weights_main=w_main,
-                    weights_stars=w_stars,
-                    serie=serie,
-                    seen_numbers=seen_numbers,
-                    seen_full_era12=seen_full_era12,
-                    block_seen_full=block_seen_full,
-                )
-                block.append(
-                    {
-                        "serie": serie,
-                        "nums": nums,
-                        "stars": stars,
-                        "sub_mode": sub_mode,  # opcional, por si luego quieres verlo
-                    }
-                )
+    seen_number_keys, seen_full_keys = _seen_index(df_hist)
 
-        return block
+    saved_index = get_store().load_saved_index() if exclude_saved else None
 
-    # ------------------------------
-    # RESTO DE MODOS (comportamiento normal)
-    # ------------------------------
-    w_main, w_stars = _build_weights_for_mode(mode, df_hist)
+    plan = _block_plan(mode, df_hist, lines_A, lines_B, lines_C)
+    nums_arr, stars_arr = _sample_block(
+        plan, seen_number_keys, seen_full_keys, rng, saved_index=saved_index
+    )
 
     block: List[Dict[str, Any]] = []
-
-    for serie, n_lines in [("A", lines_A), ("B", lines_B), ("C", lines_C)]:
-        for _ in range(int(n_lines)):
-            nums, stars = _sample_line(
-                weights_main=w_main,
-                weights_stars=w_stars,
-                serie=serie,
-                seen_numbers=seen_numbers,
-                seen_full_era12=seen_full_era12,
-                block_seen_full=block_seen_full,
-            )
-            block.append(
-                {
-                    "serie": serie,
-                    "nums": nums,
-                    "stars": stars,
-                }
-            )
-
-    return block
\ No newline at end of file
+    i = 0
+    for item in plan:
+        for _ in range(item["n_lines"]):
+            row: Dict[str, Any] = {
+                "serie": item["serie"],
+                "nums": [int(x) for x in nums_arr[i]],
+                "stars": [int(x) for x in stars_arr[i]],
+            }
+            if "sub_mode" in item:
+                row["sub_mode"] = item["sub_mode"]  # opcional, por si luego quieres verlo
+            block.append(row)
+            i += 1
+
+    return block
@@ -0,0 +1,99 @@
+# app/history_refresher.py
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from app.updater import ApiRateLimited, update_historico_from_api
+
+# Actualización del histórico en segundo plano: un hilo daemon consulta la
+# API cada REFRESH_INTERVAL segundos (o cuando se le pide con
+# request_refresh) y la app nunca espera a la red. Los sorteos nuevos llegan
+# al resto de la app por el evento on_history_change de app.updater.
+
+# Segundos entre consultas automáticas a la API
+REFRESH_INTERVAL = 6 * 3600
+
+# Espera tras un 429 sin Retry-After
+DEFAULT_RATE_LIMIT_WAIT = 60.0
+
+
+def _refresh_loop(refresher: Dict[str, Any]) -> None:
+    wake: threading.Event = refresher["wake"]
+    stop: threading.Event = refresher["stop"]
+    fetch: Callable[[], int] = refresher["fetch"]
+
+    while not stop.is_set():
+        # Si la API ha pedido esperar (429), ni siquiera un aviso manual
+        # adelanta la siguiente consulta
+        blocked = refresher["blocked_until"] - time.time()
+        if blocked > 0:
+            stop.wait(blocked)
+            continue
+
+        refresher["running"] = True
+        try:
+            added = fetch()
+            refresher.update(last_added=added, last_error=None)
+        except ApiRateLimited as e:
+            wait = e.retry_after if e.retry_after is not None else DEFAULT_RATE_LIMIT_WAIT
+            refresher.update(blocked_until=time.time() + wait, last_error=str(e))
+        except Exception as e:  # noqa: BLE001 - el hilo no debe morir por un fallo de red
+            refresher["last_error"] = f"{type(e).__name__}: {e}"
+        finally:
+            refresher.update(running=False, last_check=datetime.now())
+
+        wake.wait(refresher["interval"])
+        wake.clear()
+
+
+def start_refresher(
+    interval: float = REFRESH_INTERVAL,
+    fetch: Optional[Callable[[], int]] = None,
+) -> Dict[str, Any]:
+    """
+    Arranca el hilo de actualización y devuelve su estado (un dict que el
+    hilo va actualizando):
+      - running: True mientras hay una consulta en curso
+      - last_check: datetime de la última consulta terminada (o None)
+      - last_added: sorteos añadidos en esa consulta
+      - last_error: texto del último error (None si fue bien)
+      - blocked_until: time.time() hasta el que la API ha pedido esperar
+
+    La primera consulta se hace nada más arrancar. fetch se puede inyectar
+    (por defecto, update_historico_from_api).
+    """
+    refresher: Dict[str, Any] = {
+        "interval": float(interval),
+        "fetch": fetch or update_historico_from_api,
+        "wake": threading.Event(),
+        "stop": threading.Event(),
+        "running": False,
+        "last_check": None,
+        "last_added": None,
+        "last_error": None,
+        "blocked_until": 0.0,
+    }
+    refresher["thread"] = threading.Thread(
+        target=_refresh_loop, args=(refresher,), name="history-refresher", daemon=True
+    )
+    refresher["thread"].start()
+    return refresher
+
+
+def request_refresh(refresher: Dict[str, Any]) -> bool:
+    """
+    Pide una consulta inmediata sin esperar a que termine.
+    Devuelve False si la API ha pedido esperar (429) y la petición se aplaza.
+    """
+    refresher["wake"].set()
+    return time.time() >= refresher["blocked_until"]
+
+
+def stop_refresher(refresher: Dict[str, Any], timeout: Optional[float] = None) -> None:
+    """Detiene el hilo (termina la consulta en curso, si la hay)."""
+    refresher["stop"].set()
+    refresher["wake"].set()
+    refresher["thread"].join(timeout)
@@ -0,0 +1,506 @@
+# app/hit_ledger.py
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.codec import popcount
+from app.combinations_store import DATA_DIR, NUM_COLS, STAR_COLS
+from app.hit_report import (
+    _MAX_CELLS,
+    _N_PATTERNS,
+    _PRIZE_MIN_TIER,
+    _TIER_FLAT,
+    _draw_masks,
+    _report_frames,
+)
+from app.simulator import _PRIZE_FLAT
+from app.store_backend import STORE_BACKEND, get_store
+
+# Libro de aciertos persistente de las combinaciones guardadas contra el
+# histórico. Se amplía por los bordes en vez de recalcularse:
+#   - sorteos nuevos (update_historico_from_api) → todas las líneas × esos sorteos
+#   - filas nuevas del store (save_block)        → esas líneas × todos los sorteos
+# El store es el del backend activo (app.store_backend); cambiar de backend
+# reconstruye el libro.
+# Por línea guarda las veces de cada patrón (n, s), el mejor resultado y el
+# patrón contra el último sorteo; y un asiento (línea, sorteo, aciertos) por
+# cada acierto con premio.
+#
+# En disco: una instantánea completa (LEDGER_PATH) y, detrás, un segmento
+# pequeño por cada ampliación con sus datos de entrada (filas o sorteos
+# nuevos), que se vuelven a puntuar al cargar. Guardar cuesta lo que se
+# añade, no el tamaño del libro; cada _MAX_SEGMENTS segmentos se reescribe
+# la instantánea (coste O(líneas)) y se borran.
+LEDGER_PATH = DATA_DIR / "hit_ledger.npz"
+_MAX_SEGMENTS = 32
+
+# Libro en memoria. Lo usan los scripts de Streamlit y el hilo de
+# history_refresher (ledger_append_draws): nunca se modifica en sitio, cada
+# cambio publica un dict nuevo con una sola asignación, y leer-añadir-guardar
+# va bajo el cerrojo (reentrante: sync_ledger puede llamar a rebuild_ledger).
+_LEDGER: Dict[str, Any] = {}
+_LEDGER_LOCK = threading.RLock()
+
+_LEDGER_FIELDS = {
+    # por línea
+    "ids": np.int64,
+    "mode_codes": np.int32,
+    "num_masks": np.uint64,
+    "star_masks": np.uint16,
+    "counts": np.int32,        # (L, 18) veces de cada patrón n * 3 + s
+    "best_tier": np.uint8,     # rango del mejor patrón (exact_odds.PATTERN_ORDER)
+    "best_draw": np.int32,     # primer sorteo con ese patrón (-1 si ninguno)
+    "last_pattern": np.uint8,  # patrón contra el último sorteo
+    "timestamps": "<U32",      # timestamp y serie de la fila del store
+    "series": "<U8",
+    # por sorteo
+    "draw_dates": "datetime64[ns]",
+    "draw_nums": np.uint64,
+    "draw_stars": np.uint16,
+    # asientos con premio
+    "entry_line": np.int32,
+    "entry_draw": np.int32,
+    "entry_pattern": np.uint8,
+}
+
+
+def _empty_ledger() -> Dict[str, Any]:
+    ledger: Dict[str, Any] = {k: np.empty(0, dtype=t) for k, t in _LEDGER_FIELDS.items()}
+    ledger["counts"] = np.empty((0, _N_PATTERNS), dtype=np.int32)
+    ledger["mode_names"] = np.empty(0, dtype="<U64")
+    ledger["backend"] = np.array(STORE_BACKEND)
+    ledger["seq"] = np.int64(0)       # último segmento aplicado
+    ledger["base_seq"] = np.int64(0)  # segmento incluido en la instantánea
+    return ledger
+
+
+# ---------- persistencia: instantánea + segmentos ----------
+
+# Columnas del store que necesita _add_lines (lo que guarda un segmento "lines")
+_LINE_INPUTS = ("id", "mode", "serie", "timestamp", "num_mask", "star_mask")
+
+def _segment_path(seq: int) -> Path:
+    return LEDGER_PATH.with_name(f"{LEDGER_PATH.stem}.seg-{seq:06d}.npz")
+
+
+def _segment_paths() -> Dict[int, Path]:
+    paths = {}
+    for path in LEDGER_PATH.parent.glob(f"{LEDGER_PATH.stem}.seg-*.npz"):
+        try:
+            paths[int(path.stem.rsplit("-", 1)[1])] = path
+        except ValueError:
+            continue
+    return paths
+
+
+def _persist_ledger(ledger: Dict[str, Any]) -> None:
+    """
+    Instantánea completa del libro. Antes se borran los segmentos: si algo
+    falla entre medias queda una instantánea atrasada pero coherente, que
+    sync_ledger pone al día.
+    """
+    ledger["base_seq"] = ledger["seq"]
+    tmp_path = LEDGER_PATH.with_suffix(".tmp.npz")
+    try:
+        for path in _segment_paths().values():
+            path.unlink(missing_ok=True)
+        LEDGER_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **ledger)
+        tmp_path.replace(LEDGER_PATH)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _persist_delta(before: Dict[str, Any], after: Dict[str, Any], kind: str, **arrays: np.ndarray) -> None:
+    """
+    Guarda la ampliación before → after como segmento `kind` ("lines" o
+    "draws") con sus datos de entrada, o compacta si ya hay demasiados.
+    Si otro proceso ya ha escrito ese segmento no se pisa: el libro en
+    memoria es correcto y el del disco lo completará sync_ledger.
+    """
+    seq = int(before["seq"]) + 1
+    after["seq"] = np.int64(seq)
+    if seq - int(after["base_seq"]) > _MAX_SEGMENTS:
+        _persist_ledger(after)
+        return
+
+    try:
+        with open(_segment_path(seq), "xb") as f:
+            np.savez(
+                f,
+                kind=np.array(kind),
+                prev_lines=np.int64(len(before["ids"])),
+                prev_draws=np.int64(len(before["draw_dates"])),
+                **arrays,
+            )
+    except OSError:
+        pass
+
+
+def _lines_segment(combos_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Datos de entrada de _add_lines tal y como se guardan en un segmento."""
+    return {
+        "id": combos_df["id"].to_numpy(dtype=np.int64),
+        "mode": combos_df["mode"].astype(str).to_numpy(dtype="<U64"),
+        "serie": combos_df["serie"].astype(str).to_numpy(dtype="<U8"),
+        "timestamp": combos_df["timestamp"].astype(str).to_numpy(dtype="<U32"),
+        "num_mask": combos_df["num_mask"].to_numpy(dtype=np.uint64),
+        "star_mask": combos_df["star_mask"].to_numpy(dtype=np.uint16),
+    }
+
+
+def _draws_segment(dates: np.ndarray, draw_nums: np.ndarray, draw_stars: np.ndarray) -> Dict[str, np.ndarray]:
+    """Datos de entrada de _add_draws tal y como se guardan en un segmento."""
+    return {
+        "dates": dates.astype("datetime64[ns]"),
+        "draw_nums": draw_nums,
+        "draw_stars": draw_stars,
+    }
+
+
+def _load_ledger_file() -> Optional[Dict[str, Any]]:
+    """Instantánea + segmentos posteriores (None si faltan o no encajan)."""
+    try:
+        with np.load(LEDGER_PATH) as data:
+            ledger = {
+                k: data[k]
+                for k in [*_LEDGER_FIELDS, "mode_names", "backend", "seq", "base_seq"]
+            }
+    except (OSError, ValueError, KeyError):
+        return None
+    if str(ledger["backend"]) != STORE_BACKEND:
+        return None
+    if ledger["counts"].shape != (len(ledger["ids"]), _N_PATTERNS):
+        return None
+
+    segments = _segment_paths()
+    seq = int(ledger["base_seq"])
+    while seq + 1 in segments:
+        seq += 1
+        try:
+            with np.load(segments[seq]) as seg:
+                if (
+                    int(seg["prev_lines"]) != len(ledger["ids"])
+                    or int(seg["prev_draws"]) != len(ledger["draw_dates"])
+                ):
+                    return None
+                if str(seg["kind"]) == "lines":
+                    lines = pd.DataFrame({k: seg[k] for k in _LINE_INPUTS})
+                    ledger = _add_lines(ledger, lines)
+                else:
+                    ledger = _add_draws(ledger, seg["dates"], seg["draw_nums"], seg["draw_stars"])
+        except (OSError, ValueError, KeyError):
+            return None
+        ledger["seq"] = np.int64(seq)
+    return ledger
+
+
+# ---------- puntuación ----------
+
+def _score(
+    line_nums: np.ndarray,
+    line_stars: np.ndarray,
+    draw_nums: np.ndarray,
+    draw_stars: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Tuple[np.ndarray, ...]]:
+    """
+    Líneas × sorteos por trozos. Devuelve por línea: veces de cada patrón
+    (L, 18), mejor rango, primer sorteo con él, patrón contra el último
+    sorteo; y los asientos con premio (línea, sorteo, patrón), con índices
+    relativos a los arrays de entrada.
+    """
+    n_lines, n_draws = len(line_nums), len(draw_nums)
+    counts = np.zeros((n_lines, _N_PATTERNS), dtype=np.int32)
+    best_tier = np.zeros(n_lines, dtype=np.uint8)
+    best_draw = np.full(n_lines, -1, dtype=np.int32)
+    last_pattern = np.zeros(n_lines, dtype=np.uint8)
+    entries = []
+    if n_lines == 0 or n_draws == 0:
+        empty = (np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.uint8))
+        return counts, best_tier, best_draw, last_pattern, empty
+
+    chunk = max(1, _MAX_CELLS // n_draws)
+    for a in range(0, n_lines, chunk):
+        b = min(a + chunk, n_lines)
+        pattern = popcount(line_nums[a:b, None] & draw_nums[None, :]).astype(np.uint8, copy=False)
+        pattern *= np.uint8(3)
+        pattern += popcount(line_stars[a:b, None] & draw_stars[None, :]).astype(np.uint8, copy=False)
+        tiers = _TIER_FLAT[pattern]
+
+        rows = np.arange(b - a, dtype=np.int32)[:, None] * _N_PATTERNS
+        counts[a:b] = np.bincount(
+            (rows + pattern).ravel(), minlength=(b - a) * _N_PATTERNS
+        ).reshape(b - a, _N_PATTERNS)
+
+        where = tiers.argmax(axis=1)
+        best_draw[a:b] = where
+        best_tier[a:b] = tiers[np.arange(b - a), where]
+        last_pattern[a:b] = pattern[:, -1]
+
+        line_idx, draw_idx = np.nonzero(tiers >= _PRIZE_MIN_TIER)
+        entries.append((line_idx + a, draw_idx, pattern[line_idx, draw_idx]))
+
+    entry_line, entry_draw, entry_pattern = (np.concatenate(x) for x in zip(*entries))
+    return (
+        counts,
+        best_tier,
+        best_draw,
+        last_pattern,
+        (entry_line.astype(np.int32), entry_draw.astype(np.int32), entry_pattern),
+    )
+
+
+def _add_lines(ledger: Dict[str, Any], combos_df: pd.DataFrame) -> Dict[str, Any]:
+    """Añade filas del store (columnas tipadas) puntuándolas contra todos los sorteos."""
+    if combos_df.empty:
+        return ledger
+    line_nums = combos_df["num_mask"].to_numpy(dtype=np.uint64)
+    line_stars = combos_df["star_mask"].to_numpy(dtype=np.uint16)
+    counts, best_tier, best_draw, last_pattern, (e_line, e_draw, e_pattern) = _score(
+        line_nums, line_stars, ledger["draw_nums"], ledger["draw_stars"]
+    )
+
+    mode_names = list(ledger["mode_names"])
+    for name in combos_df["mode"].astype(str).unique():
+        if name not in mode_names:
+            mode_names.append(name)
+    lookup = {name: i for i, name in enumerate(mode_names)}
+    mode_codes = combos_df["mode"].astype(str).map(lookup).to_numpy(dtype=np.int32)
+
+    offset = len(ledger["ids"])
+    out = dict(ledger)
+    out.update(
+        ids=np.concatenate([ledger["ids"], combos_df["id"].to_numpy(dtype=np.int64)]),
+        mode_codes=np.concatenate([ledger["mode_codes"], mode_codes]),
+        mode_names=np.array(mode_names, dtype="<U64"),
+        num_masks=np.concatenate([ledger["num_masks"], line_nums]),
+        star_masks=np.concatenate([ledger["star_masks"], line_stars]),
+        counts=np.concatenate([ledger["counts"], counts]),
+        best_tier=np.concatenate([ledger["best_tier"], best_tier]),
+        best_draw=np.concatenate([ledger["best_draw"], best_draw]),
+        last_pattern=np.concatenate([ledger["last_pattern"], last_pattern]),
+        timestamps=np.concatenate(
+            [ledger["timestamps"], combos_df["timestamp"].astype(str).to_numpy(dtype="<U32")]
+        ),
+        series=np.concatenate(
+            [ledger["series"], combos_df["serie"].astype(str).to_numpy(dtype="<U8")]
+        ),
+        entry_line=np.concatenate([ledger["entry_line"], e_line + offset]),
+        entry_draw=np.concatenate([ledger["entry_draw"], e_draw]),
+        entry_pattern=np.concatenate([ledger["entry_pattern"], e_pattern]),
+    )
+    return out
+
+
+def _add_draws(
+    ledger: Dict[str, Any],
+    dates: np.ndarray,
+    draw_nums: np.ndarray,
+    draw_stars: np.ndarray,
+) -> Dict[str, Any]:
+    """Añade sorteos (posteriores a los del libro) puntuando todas las líneas."""
+    if len(dates) == 0:
+        return ledger
+    counts, best_tier, best_draw, last_pattern, (e_line, e_draw, e_pattern) = _score(
+        ledger["num_masks"], ledger["star_masks"], draw_nums, draw_stars
+    )
+
+    offset = len(ledger["draw_dates"])
+    improved = best_tier > ledger["best_tier"]  # estricto: se queda la primera vez
+    out = dict(ledger)
+    out.update(
+        draw_dates=np.concatenate([ledger["draw_dates"], dates.astype("datetime64[ns]")]),
+        draw_nums=np.concatenate([ledger["draw_nums"], draw_nums]),
+        draw_stars=np.concatenate([ledger["draw_stars"], draw_stars]),
+        counts=ledger["counts"] + counts,
+        best_tier=np.where(improved, best_tier, ledger["best_tier"]),
+        best_draw=np.where(improved, best_draw + offset, ledger["best_draw"]).astype(np.int32),
+        last_pattern=last_pattern if len(last_pattern) else ledger["last_pattern"],
+        entry_line=np.concatenate([ledger["entry_line"], e_line]),
+        entry_draw=np.concatenate([ledger["entry_draw"], e_draw + offset]),
+        entry_pattern=np.concatenate([ledger["entry_pattern"], e_pattern]),
+    )
+    return out
+
+
+# ---------- sincronización ----------
+
+def rebuild_ledger(df_hist: pd.DataFrame) -> Dict[str, Any]:
+    """Reconstruye el libro desde cero: todo el store × todo el histórico."""
+    global _LEDGER
+    with _LEDGER_LOCK:
+        ledger = _add_draws(_empty_ledger(), *_draw_masks(df_hist, None, None))
+        ledger = _add_lines(ledger, get_store().load_all())
+        _persist_ledger(ledger)
+        _LEDGER = ledger
+        return ledger
+
+
+def sync_ledger(df_hist: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Devuelve el libro al día con el store y el histórico, añadiendo solo las
+    filas guardadas y los sorteos que falten. Si el libro no cuadra (store
+    reescrito, sorteo corregido, fichero ausente), se reconstruye.
+    """
+    with _LEDGER_LOCK:
+        return _sync_ledger(df_hist)
+
+
+def _sync_ledger(df_hist: pd.DataFrame) -> Dict[str, Any]:
+    global _LEDGER
+    ledger = _LEDGER if _LEDGER else _load_ledger_file()
+    if ledger is None:
+        return rebuild_ledger(df_hist)
+
+    dates, draw_nums, draw_stars = _draw_masks(df_hist, None, None)
+    n_known = len(ledger["draw_dates"])
+    if n_known > len(dates) or not (
+        np.array_equal(ledger["draw_dates"], dates[:n_known].astype("datetime64[ns]"))
+        and np.array_equal(ledger["draw_nums"], draw_nums[:n_known])
+        and np.array_equal(ledger["draw_stars"], draw_stars[:n_known])
+    ):
+        return rebuild_ledger(df_hist)
+
+    store = get_store()
+    last_id = int(ledger["ids"][-1]) if len(ledger["ids"]) else 0
+    store_last_id = store.last_id()
+    if store_last_id < last_id:
+        return rebuild_ledger(df_hist)
+
+    if n_known < len(dates):
+        before = ledger
+        new_draws = (dates[n_known:], draw_nums[n_known:], draw_stars[n_known:])
+        ledger = _add_draws(ledger, *new_draws)
+        _persist_delta(before, ledger, "draws", **_draws_segment(*new_draws))
+    if store_last_id > last_id:
+        df_new = store.load_last_n(store_last_id - last_id)
+        df_new = df_new[df_new["id"] > last_id]
+        before = ledger
+        ledger = _add_lines(ledger, df_new)
+        _persist_delta(before, ledger, "lines", **_lines_segment(df_new))
+
+    _LEDGER = ledger
+    return ledger
+
+
+def ledger_append_draws(df_new: pd.DataFrame) -> None:
+    """
+    Tras añadir sorteos al histórico: los apunta en el libro (si existe).
+    Los sorteos que no sean posteriores al último del libro se dejan para
+    sync_ledger, que reconstruirá si hace falta.
+    """
+    with _LEDGER_LOCK:
+        _append_draws(df_new)
+
+
+def _append_draws(df_new: pd.DataFrame) -> None:
+    global _LEDGER
+    ledger = _LEDGER if _LEDGER else _load_ledger_file()
+    if ledger is None:
+        return
+
+    dates, draw_nums, draw_stars = _draw_masks(df_new, None, None)
+    if len(ledger["draw_dates"]):
+        newer = dates.astype("datetime64[ns]") > ledger["draw_dates"][-1]
+        dates, draw_nums, draw_stars = dates[newer], draw_nums[newer], draw_stars[newer]
+    if len(dates) == 0:
+        return
+
+    before = ledger
+    ledger = _add_draws(ledger, dates, draw_nums, draw_stars)
+    _persist_delta(before, ledger, "draws", **_draws_segment(dates, draw_nums, draw_stars))
+    _LEDGER = ledger
+
+
+# ---------- lecturas agregadas ----------
+
+def _masks_to_columns(num_masks: np.ndarray, star_masks: np.ndarray) -> Dict[str, np.ndarray]:
+    """Bitmasks (L,) → columnas n1..n5, s1, s2 (valores ordenados)."""
+    num_bits = (num_masks[:, None] >> np.arange(50, dtype=np.uint64)) & np.uint64(1)
+    star_bits = (star_masks.astype(np.uint64)[:, None] >> np.arange(12, dtype=np.uint64)) & np.uint64(1)
+    nums = np.nonzero(num_bits)[1].reshape(-1, 5) + 1
+    stars = np.nonzero(star_bits)[1].reshape(-1, 2) + 1
+    out = {c: nums[:, i].astype(np.int8) for i, c in enumerate(NUM_COLS)}
+    out.update({c: stars[:, i].astype(np.int8) for i, c in enumerate(STAR_COLS)})
+    return out
+
+
+def ledger_last_draw(ledger: Dict[str, Any], ids: np.ndarray) -> pd.DataFrame:
+    """
+    Aciertos contra el último sorteo del libro para las líneas con esos ids:
+    id, aciertos_numeros, aciertos_estrellas (las que no estén, fuera).
+    """
+    pos = np.searchsorted(ledger["ids"], ids)
+    pos = np.minimum(pos, max(len(ledger["ids"]) - 1, 0))
+    found = (
+        ledger["ids"][pos] == ids if len(ledger["ids"]) else np.zeros(len(ids), dtype=bool)
+    )
+    pattern = ledger["last_pattern"][pos[found]].astype(np.int64)
+    return pd.DataFrame(
+        {
+            "id": np.asarray(ids)[found],
+            "aciertos_numeros": pattern // 3,
+            "aciertos_estrellas": pattern % 3,
+        }
+    )
+
+
+def ledger_report(
+    ledger: Dict[str, Any],
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, Dict[str, Any]]:
+    """
+    El informe de hit_report.lifetime_hit_report (todo el histórico) leído
+    de los agregados del libro, sin recorrer ninguna matriz.
+    """
+    mode_names = pd.Index(ledger["mode_names"].tolist())
+    mode_codes = ledger["mode_codes"].astype(np.int64)
+    counts = ledger["counts"].astype(np.int64)
+    by_mode = np.zeros((max(1, len(mode_names)), _N_PATTERNS), dtype=np.int64)
+    np.add.at(by_mode, mode_codes, counts)
+
+    dates = ledger["draw_dates"]
+    best_draw = ledger["best_draw"]
+    best_dates = np.full(len(best_draw), np.datetime64("NaT", "ns"))
+    has_best = best_draw >= 0
+    best_dates[has_best] = dates[best_draw[has_best]]
+
+    # Mismas columnas que lifetime_hit_report
+    lines_df = pd.DataFrame(
+        {
+            "id": ledger["ids"],
+            "timestamp": ledger["timestamps"].astype(object),
+            "mode": mode_names[mode_codes] if len(mode_codes) else [],
+            "serie": ledger["series"].astype(object),
+            **_masks_to_columns(ledger["num_masks"], ledger["star_masks"]),
+        }
+    )
+    return _report_frames(
+        lines_df,
+        mode_codes,
+        mode_names,
+        ledger["best_tier"].astype(np.int64),
+        best_dates,
+        counts[:, _PRIZE_FLAT].sum(axis=1),
+        by_mode,
+        dates,
+    )
+
+
+def ledger_entries(ledger: Dict[str, Any], min_numbers: int = 0) -> pd.DataFrame:
+    """Asientos con premio: id, date, aciertos_numeros, aciertos_estrellas."""
+    pattern = ledger["entry_pattern"].astype(np.int64)
+    keep = pattern // 3 >= min_numbers
+    return pd.DataFrame(
+        {
+            "id": ledger["ids"][ledger["entry_line"][keep]],
+            "date": ledger["draw_dates"][ledger["entry_draw"][keep]],
+            "aciertos_numeros": pattern[keep] // 3,
+            "aciertos_estrellas": pattern[keep] % 3,
+        }
+    ).sort_values(["date", "id"], ignore_index=True)
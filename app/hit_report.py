@@ -0,0 +1,209 @@
+# app/hit_report.py
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.codec import encode_numbers, encode_stars, popcount
+from app.combinations_store import NUM_COLS, STAR_COLS, _normalize_columns
+from app.exact_odds import _TIER
+from app.simulator import _PRIZE_FLAT
+
+# Informe de "toda la vida": cada combinación guardada contra cada sorteo del
+# histórico (o de un rango de fechas), en matrices líneas × sorteos de
+# popcount(máscara_línea & máscara_sorteo), por trozos.
+
+# Celdas (líneas × sorteos) por trozo: acota la memoria de las matrices
+_MAX_CELLS = 4_000_000
+
+# Patrón (n, s) como índice plano n * 3 + s (el mismo que _PRIZE_FLAT)
+_N_PATTERNS = 18
+_TIER_FLAT = _TIER[1:].ravel()  # rango del patrón: 18 = 5+2, 1 = 0+0
+_PATTERN_BY_TIER = np.zeros(_N_PATTERNS + 1, dtype=np.int64)
+_PATTERN_BY_TIER[_TIER_FLAT] = np.arange(_N_PATTERNS)
+
+# Las categorías con premio son las primeras de PATTERN_ORDER, así que
+# "hay premio" es simplemente rango >= el de la peor categoría premiada
+_PRIZE_MIN_TIER = int(_TIER_FLAT[_PRIZE_FLAT].min())
+assert ((_TIER_FLAT >= _PRIZE_MIN_TIER) == _PRIZE_FLAT).all()
+
+
+def _draw_masks(
+    df_hist: pd.DataFrame,
+    start: Optional[pd.Timestamp],
+    end: Optional[pd.Timestamp],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fechas y bitmasks (números, estrellas) de los sorteos del rango, por fecha."""
+    cols = NUM_COLS + STAR_COLS
+    if df_hist.empty or "date" not in df_hist.columns:
+        return np.empty(0, dtype="datetime64[ns]"), np.empty(0, np.uint64), np.empty(0, np.uint16)
+
+    draws = df_hist.dropna(subset=["date", *cols])
+    if start is not None:
+        draws = draws[draws["date"] >= pd.Timestamp(start)]
+    if end is not None:
+        draws = draws[draws["date"] <= pd.Timestamp(end)]
+    draws = draws.sort_values("date")
+
+    values = draws[cols].to_numpy(dtype=np.int64)
+    return (
+        draws["date"].to_numpy(),
+        encode_numbers(values[:, :5]) if len(values) else np.empty(0, np.uint64),
+        encode_stars(values[:, 5:]) if len(values) else np.empty(0, np.uint16),
+    )
+
+
+def _score_chunk(
+    line_nums: np.ndarray,
+    line_stars: np.ndarray,
+    draw_nums: np.ndarray,
+    draw_stars: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Un trozo de líneas × todos los sorteos. Devuelve por línea el mejor
+    rango de patrón, el sorteo donde se da por primera vez y los sorteos
+    con premio; y las veces de cada rango (0..18) en todo el trozo.
+    """
+    hits_n = popcount(line_nums[:, None] & draw_nums[None, :]).astype(np.uint8, copy=False)
+    hits_s = popcount(line_stars[:, None] & draw_stars[None, :]).astype(np.uint8, copy=False)
+    hits_n *= np.uint8(3)
+    hits_n += hits_s
+    tiers = _TIER_FLAT[hits_n]  # (c, D)
+
+    best_draw = tiers.argmax(axis=1)
+    best_tier = tiers[np.arange(len(tiers)), best_draw]
+    prizes = np.count_nonzero(tiers >= _PRIZE_MIN_TIER, axis=1)
+    counts = np.bincount(tiers.ravel(), minlength=_N_PATTERNS + 1)
+    return best_tier, best_draw, prizes, counts
+
+
+def lifetime_hit_report(
+    combos_df: pd.DataFrame,
+    df_hist: pd.DataFrame,
+    start: Optional[pd.Timestamp] = None,
+    end: Optional[pd.Timestamp] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, Dict[str, Any]]:
+    """
+    Puntúa todas las combinaciones guardadas (combinations_store) contra
+    todos los sorteos del histórico entre start y end (ambos incluidos).
+
+    Devuelve:
+      - lines_df: cada línea con su mejor resultado (mejor_numeros,
+        mejor_estrellas, fecha_mejor) y sorteos_con_premio
+      - tiers_df: aciertos_numeros, aciertos_estrellas, premio, veces
+        (pares línea × sorteo con ese patrón)
+      - modes_df: por modo, líneas, comparaciones, con_premio, p_premio y
+        el mejor resultado
+      - summary: lines, draws, first_draw, last_draw, comparisons, prize_hits
+    """
+    combos_df = _normalize_columns(combos_df)
+    dates, draw_nums, draw_stars = _draw_masks(df_hist, start, end)
+    n_lines, n_draws = len(combos_df), len(dates)
+
+    mode_codes, mode_names = pd.factorize(combos_df["mode"].astype(str))
+    n_modes = max(1, len(mode_names))
+
+    best_tier = np.zeros(n_lines, dtype=np.int64)
+    best_draw = np.zeros(n_lines, dtype=np.int64)
+    prizes = np.zeros(n_lines, dtype=np.int64)
+    tiers_by_mode = np.zeros((n_modes, _N_PATTERNS + 1), dtype=np.int64)
+
+    if n_lines and n_draws:
+        line_nums = combos_df["num_mask"].to_numpy(dtype=np.uint64)
+        line_stars = combos_df["star_mask"].to_numpy(dtype=np.uint16)
+        chunk = max(1, _MAX_CELLS // n_draws)
+
+        # Trozos dentro de un mismo modo: el recuento por modo sale de un
+        # solo bincount por trozo
+        order = np.argsort(mode_codes, kind="stable")
+        bounds = np.searchsorted(mode_codes[order], np.arange(n_modes + 1))
+        for m in range(n_modes):
+            for a in range(bounds[m], bounds[m + 1], chunk):
+                rows = order[a : min(a + chunk, bounds[m + 1])]
+                tier, where, won, counts = _score_chunk(
+                    line_nums[rows], line_stars[rows], draw_nums, draw_stars
+                )
+                best_tier[rows] = tier
+                best_draw[rows] = where
+                prizes[rows] = won
+                tiers_by_mode[m] += counts
+
+    by_mode = tiers_by_mode[:, _TIER_FLAT]  # (n_modes, 18) por patrón n * 3 + s
+    best_dates = dates[best_draw] if n_draws else np.full(n_lines, np.datetime64("NaT", "ns"))
+    lines_df = combos_df[["id", "timestamp", "mode", "serie", *NUM_COLS, *STAR_COLS]]
+    return _report_frames(
+        lines_df, mode_codes, mode_names, best_tier, best_dates, prizes, by_mode, dates
+    )
+
+
+def _report_frames(
+    lines_df: pd.DataFrame,
+    mode_codes: np.ndarray,
+    mode_names: pd.Index,
+    best_tier: np.ndarray,
+    best_dates: np.ndarray,
+    prizes: np.ndarray,
+    by_mode: np.ndarray,
+    dates: np.ndarray,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, Dict[str, Any]]:
+    """
+    Tablas del informe a partir de los agregados: mejor rango, fecha y
+    sorteos con premio de cada línea y veces de cada patrón por modo
+    (n_modes, 18). Lo comparten el cálculo directo y app.hit_ledger.
+    """
+    n_lines, n_draws = len(lines_df), len(dates)
+    n_modes = max(1, len(mode_names))
+
+    # --- por línea ---
+    best_pattern = _PATTERN_BY_TIER[best_tier]
+    lines_df = lines_df.copy()
+    lines_df["mejor_numeros"] = best_pattern // 3
+    lines_df["mejor_estrellas"] = best_pattern % 3
+    lines_df["fecha_mejor"] = pd.to_datetime(best_dates)
+    lines_df["sorteos_con_premio"] = prizes
+
+    # --- por patrón ---
+    totals = by_mode.sum(axis=0)
+    patterns = np.arange(_N_PATTERNS)
+    tiers_df = pd.DataFrame(
+        {
+            "aciertos_numeros": patterns // 3,
+            "aciertos_estrellas": patterns % 3,
+            "premio": _PRIZE_FLAT,
+            "veces": totals,
+        }
+    ).sort_values(["aciertos_numeros", "aciertos_estrellas"], ascending=False)
+    tiers_df = tiers_df.reset_index(drop=True)
+
+    # --- por modo ---
+    n_per_mode = np.bincount(mode_codes, minlength=n_modes) if n_lines else np.zeros(n_modes, int)
+    mode_prizes = by_mode[:, _PRIZE_FLAT].sum(axis=1)
+    mode_best = np.zeros(n_modes, dtype=np.int64)
+    if n_lines:
+        np.maximum.at(mode_best, mode_codes, best_tier)
+    mode_best_pattern = _PATTERN_BY_TIER[mode_best]
+    modes_df = pd.DataFrame(
+        {
+            "mode": list(mode_names) if len(mode_names) else ["—"],
+            "lineas": n_per_mode,
+            "comparaciones": n_per_mode * n_draws,
+            "con_premio": mode_prizes,
+            "mejor": [f"{p // 3}+{p % 3}" for p in mode_best_pattern],
+        }
+    )
+    modes_df["p_premio"] = modes_df["con_premio"] / modes_df["comparaciones"].where(
+        modes_df["comparaciones"] > 0
+    )
+    modes_df = modes_df[modes_df["lineas"] > 0].reset_index(drop=True)
+
+    summary = {
+        "lines": n_lines,
+        "draws": n_draws,
+        "first_draw": pd.Timestamp(dates[0]) if n_draws else None,
+        "last_draw": pd.Timestamp(dates[-1]) if n_draws else None,
+        "comparisons": n_lines * n_draws,
+        "prize_hits": int(totals[_PRIZE_FLAT].sum()),
+    }
+    return lines_df, tiers_df, modes_df, summary
@@ -0,0 +1,87 @@
+# app/result_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import zipfile
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+
+# Caché en disco de resultados de simulación (matrices de recuentos 6×3),
+# compartida entre sesiones del navegador y reinicios de la app.
+CACHE_DIR = Path(__file__).resolve().parents[1] / "data" / "cache"
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def cache_key(kind: str, params: Dict[str, Any], history: str) -> str:
+    """
+    Nombre de fichero estable para (tipo de simulación, parámetros, huella
+    del histórico). Cualquier cambio en uno de los tres da otra clave.
+    """
+    payload = json.dumps(
+        {"kind": kind, "params": params, "history": history},
+        sort_keys=True,
+        default=str,
+    )
+    return f"{kind}-{hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]}"
+
+
+def _path(key: str) -> Path:
+    return CACHE_DIR / f"{key}.npz"
+
+
+def load_counts(key: str) -> np.ndarray | None:
+    """
+    Devuelve los recuentos guardados para `key` o None si no están (o el
+    fichero está corrupto). Un acierto renueva su fecha para el LRU.
+    """
+    path = _path(key)
+    try:
+        with np.load(path) as data:
+            counts = data["counts"]
+        os.utime(path)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+    return counts
+
+
+def save_counts(key: str, counts: np.ndarray, max_bytes: int = CACHE_MAX_BYTES) -> None:
+    """Guarda los recuentos (escritura atómica) y recorta la caché a max_bytes."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _path(key)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, counts=np.asarray(counts))
+        tmp_path.replace(path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        return
+    _evict(max_bytes)
+
+
+def _evict(max_bytes: int) -> None:
+    """Borra los ficheros usados hace más tiempo hasta quedar en max_bytes."""
+    entries = []
+    for path in CACHE_DIR.glob("*.npz"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def clear_cache() -> None:
+    """Vacía la caché de resultados."""
+    for path in CACHE_DIR.glob("*.npz"):
+        path.unlink(missing_ok=True)
@@ -1,11 +1,22 @@
 # app/simulator.py
 from __future__ import annotations
 
-from typing import Tuple, Dict, Any
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Tuple, Dict, Any, List, Callable, Iterator, Optional
+
 import numpy as np
 import pandas as pd
 
-from app.generator import generate_block
+from app.codec import encode_numbers, encode_stars, popcount
+from app.data_loader import history_version
+from app.generator import ERA_12_STARS_START, _block_plan, _sample_blocks, _seen_index
+from app.result_cache import cache_key, load_counts, save_counts
 
 # Patrones que en Euromillones dan premio (aprox)
 PRIZE_PATTERNS = {
@@ -16,14 +27,78 @@ PRIZE_PATTERNS = {
     (1, 2),
 }
 
+# Tabla booleana 6×3: PRIZE_TABLE[aciertos_numeros, aciertos_estrellas]
+PRIZE_TABLE = np.zeros((6, 3), dtype=bool)
+for _n, _s in PRIZE_PATTERNS:
+    PRIZE_TABLE[_n, _s] = True
+
+DIST_COLUMNS = ["aciertos_numeros", "aciertos_estrellas", "veces", "prob", "prob_%"]
+
+_PRIZE_FLAT = PRIZE_TABLE.ravel()
+
+# z para intervalos de confianza del 95 %
+Z_95 = 1.96
+
+# Formas de elegir los sorteos de referencia (ver _reference_indices)
+REF_SAMPLING = ["random", "stratified", "era", "exhaustive"]
+
+# Inicio de cada era por nº de estrellas (9 → 11 → 12)
+ERA_STARTS = [pd.Timestamp("2011-05-10"), ERA_12_STARS_START]
+
+# Acumulador por modo: los 18 recuentos 6×3 aplanados y 5 estadísticos por
+# bloque generado: (n_bloques, Σx_ge3, Σx²_ge3, Σx_premio, Σx²_premio),
+# con x = fracción de (línea, sorteo) del bloque que cumple la condición.
+_ACC_SIZE = 18 + 5
+
+# Celdas (bloques × líneas × sorteos) que se puntúan de una vez
+_MAX_CELLS = 4_000_000
+
+
+def _ci_half_width(p: float, n: float, z: float = Z_95) -> float:
+    """
+    Semiancho del intervalo de Wilson para una proporción p sobre n líneas.
+    A diferencia del normal, no es 0 cuando p = 0 (aún no se ha visto nada).
+    Trata las líneas como independientes (aproximación).
+    """
+    if n <= 0:
+        return 1.0
+    return z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+
+
+def _block_ci(p: float, total: float, n: float, s: float, ss: float) -> Tuple[float, float]:
+    """
+    (semiancho IC 95 %, tamaño muestral efectivo en líneas) a partir de la
+    varianza entre bloques de x (fracción de aciertos de cada bloque).
+    Sin varianza medible (pocos bloques, todo 0) se cae a Wilson.
+    """
+    var_p = (ss - s * s / n) / (n - 1) / n if n >= 2 else 0.0
+    if var_p <= 0:
+        return _ci_half_width(p, total), total
+    return Z_95 * np.sqrt(var_p), p * (1 - p) / var_p
+
 
-def _summary_from_dist(dist: pd.DataFrame) -> Dict[str, Any]:
-    """A partir de la distribución de aciertos calcula métricas agregadas."""
+def _summary_from_dist(
+    dist: pd.DataFrame,
+    stats: np.ndarray | None = None,
+) -> Dict[str, Any]:
+    """
+    A partir de la distribución de aciertos calcula métricas agregadas,
+    con el semiancho de su IC 95 % (claves *_ci).
+
+    Con `stats` (estadísticos por bloque del acumulador) el IC sale de la
+    varianza real entre bloques, que recoge el efecto de estratificar,
+    emparejar o puntuar contra todo el histórico; "effective_lines" es el
+    nº de líneas independientes que darían la misma precisión en P(premio).
+    """
     if dist.empty:
         return {
             "total_lines": 0,
             "p_ge3_nums": 0.0,
             "p_any_prize": 0.0,
+            "p_ge3_nums_ci": 1.0,
+            "p_any_prize_ci": 1.0,
+            "blocks": 0,
+            "effective_lines": 0.0,
         }
 
     total = float(dist["veces"].sum())
@@ -33,19 +108,313 @@ def _summary_from_dist(dist: pd.DataFrame) -> Dict[str, Any]:
     p_ge3_nums = dist.loc[mask_ge3, "veces"].sum() / total
 
     # P(al menos un premio) según tabla de patrones
-    mask_prize = dist.apply(
-        lambda r: (int(r["aciertos_numeros"]), int(r["aciertos_estrellas"])) in PRIZE_PATTERNS,
-        axis=1,
-    )
+    mask_prize = PRIZE_TABLE[
+        dist["aciertos_numeros"].to_numpy(dtype=int),
+        dist["aciertos_estrellas"].to_numpy(dtype=int),
+    ]
     p_any_prize = dist.loc[mask_prize, "veces"].sum() / total
 
+    if stats is None:
+        ci_ge3 = _ci_half_width(p_ge3_nums, total)
+        ci_prize, ess = _ci_half_width(p_any_prize, total), total
+        blocks = 0
+    else:
+        blocks, s_ge3, ss_ge3, s_prize, ss_prize = stats
+        ci_ge3, _ = _block_ci(p_ge3_nums, total, blocks, s_ge3, ss_ge3)
+        ci_prize, ess = _block_ci(p_any_prize, total, blocks, s_prize, ss_prize)
+
     return {
         "total_lines": int(total),
         "p_ge3_nums": float(p_ge3_nums),
         "p_any_prize": float(p_any_prize),
+        "p_ge3_nums_ci": float(ci_ge3),
+        "p_any_prize_ci": float(ci_prize),
+        "blocks": int(blocks),
+        "effective_lines": float(ess),
     }
 
 
+def _dist_from_counts(counts: np.ndarray) -> pd.DataFrame:
+    """Matriz 6×3 de recuentos → DataFrame de distribución (solo patrones vistos)."""
+    hits_nums, hits_stars = np.nonzero(counts)
+    dist = pd.DataFrame(
+        {
+            "aciertos_numeros": hits_nums,
+            "aciertos_estrellas": hits_stars,
+            "veces": counts[hits_nums, hits_stars].astype(np.int64),
+        }
+    )
+    total_lines = float(counts.sum())
+    dist["prob"] = dist["veces"] / total_lines if total_lines else 0.0
+    dist["prob_%"] = dist["prob"] * 100
+    return dist
+
+
+def _simulate_counts(
+    plan: List[Dict[str, Any]],
+    draw_num_masks: np.ndarray,
+    draw_star_masks: np.ndarray,
+    seen_number_keys: np.ndarray,
+    seen_full_keys: np.ndarray,
+    ref_idx: np.ndarray,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    Núcleo de la simulación: un bloque por fila de ref_idx (n_bloques, R),
+    puntuado contra sus R sorteos de referencia. Devuelve el acumulador
+    de tamaño _ACC_SIZE (recuentos 6×3 + estadísticos por bloque).
+    """
+    # Bloques A/B/C de todos los trials: (n_trials, n_lineas, 5) y (…, 2)
+    nums, stars = _sample_blocks(plan, seen_number_keys, seen_full_keys, len(ref_idx), rng)
+    num_masks = encode_numbers(nums)
+    star_masks = encode_stars(stars)
+
+    acc = np.zeros(_ACC_SIZE, dtype=float)
+    if num_masks.size == 0:
+        return acc
+
+    # Por trozos de bloques para acotar la memoria (n_bloques × líneas × R)
+    step = max(1, _MAX_CELLS // (num_masks.shape[1] * ref_idx.shape[1]))
+    for a in range(0, len(ref_idx), step):
+        idx = ref_idx[a : a + step]
+        hits_nums = popcount(num_masks[a : a + step, :, None] & draw_num_masks[idx][:, None, :])
+        hits_stars = popcount(star_masks[a : a + step, :, None] & draw_star_masks[idx][:, None, :])
+        codes = hits_nums.astype(np.intp) * 3 + hits_stars
+
+        x_ge3 = (hits_nums >= 3).mean(axis=(1, 2))
+        x_prize = _PRIZE_FLAT[codes].mean(axis=(1, 2))
+        acc[:18] += np.bincount(codes.ravel(), minlength=18)
+        acc[18:] += [
+            len(idx),
+            x_ge3.sum(),
+            (x_ge3 * x_ge3).sum(),
+            x_prize.sum(),
+            (x_prize * x_prize).sum(),
+        ]
+    return acc
+
+
+def _draw_eras(df_hist: pd.DataFrame) -> np.ndarray:
+    """Era (0, 1, 2) de cada sorteo, en el orden de _history_arrays."""
+    dates = df_hist.sort_values("date")["date"]
+    return np.searchsorted(np.array(ERA_STARTS, dtype="datetime64[ns]"), dates.to_numpy(), side="right")
+
+
+def _reference_indices(
+    sampling: str,
+    n_blocks: int,
+    eras: np.ndarray,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    Sorteos de referencia de cada bloque: array (n_blocks, R).
+
+      - random:      1 sorteo al azar por bloque (con reemplazo)
+      - stratified:  1 por bloque, recorriendo permutaciones del histórico
+                     → todos los sorteos se usan lo mismo (±1)
+      - era:         1 por bloque, con el nº de bloques de cada era
+                     proporcional a su tamaño y los sorteos sin repetir
+      - exhaustive:  TODOS los sorteos del histórico para cada bloque
+    """
+    n_draws = len(eras)
+    if sampling == "random":
+        return rng.integers(0, n_draws, size=(n_blocks, 1))
+
+    if sampling == "stratified":
+        reps = -(-n_blocks // n_draws)
+        order = np.concatenate([rng.permutation(n_draws) for _ in range(reps)])
+        return order[:n_blocks, None]
+
+    if sampling == "era":
+        sizes = np.bincount(eras, minlength=len(ERA_STARTS) + 1)
+        quota = n_blocks * sizes / n_draws
+        alloc = np.floor(quota).astype(int)
+        # Reparto de los restos: mayores restos primero
+        extra = n_blocks - alloc.sum()
+        alloc[np.argsort(alloc - quota)[:extra]] += 1
+        parts = []
+        for era, count in enumerate(alloc):
+            members = np.flatnonzero(eras == era)
+            if count == 0 or len(members) == 0:
+                continue
+            reps = -(-count // len(members))
+            picks = np.concatenate([rng.permutation(members) for _ in range(reps)])
+            parts.append(picks[:count])
+        return rng.permutation(np.concatenate(parts))[:, None]
+
+    if sampling == "exhaustive":
+        return np.broadcast_to(np.arange(n_draws), (n_blocks, n_draws))
+
+    raise ValueError(f"Muestreo de referencia desconocido: {sampling!r}")
+
+
+def _history_arrays(df_hist: pd.DataFrame) -> List[np.ndarray]:
+    """
+    Estructuras del histórico que comparten todos los trials y modos:
+    bitmasks de los sorteos (números, estrellas) y claves del anti-clon.
+    """
+    df_sorted = df_hist.sort_values("date")
+    draws = df_sorted[["n1", "n2", "n3", "n4", "n5", "s1", "s2"]].to_numpy(dtype=int)
+    seen_number_keys, seen_full_keys = _seen_index(df_hist)
+    return [
+        encode_numbers(draws[:, :5]),
+        encode_stars(draws[:, 5:]),
+        seen_number_keys,
+        seen_full_keys,
+    ]
+
+
+# ---------- ejecución en varios procesos ----------
+
+def _to_shared(arr: np.ndarray) -> Tuple[shared_memory.SharedMemory, Tuple[str, Tuple[int, ...], str]]:
+    """Copia un array a memoria compartida y devuelve (bloque, spec para adjuntarlo)."""
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def _simulate_chunk_shared(
+    plan: List[Dict[str, Any]],
+    specs: List[Tuple[str, Tuple[int, ...], str]],
+    ref_idx: np.ndarray,
+    seed_seq: np.random.SeedSequence,
+) -> np.ndarray:
+    """Trabajo de un proceso: se adjunta a los arrays compartidos y simula su parte."""
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        arrays = [
+            np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            for shm, (_, shape, dtype) in zip(blocks, specs)
+        ]
+        counts = _simulate_counts(plan, *arrays, ref_idx, np.random.default_rng(seed_seq))
+        del arrays
+        return counts
+    finally:
+        for shm in blocks:
+            shm.close()
+
+
+# Pools de procesos vivos mientras dure el proceso: {nº de procesos: pool}.
+# Arrancar procesos "spawn" (importar numpy/pandas en cada uno) cuesta más
+# que una simulación normal, así que se arrancan una vez y se reutilizan
+# entre llamadas y sesiones. Los procesos se arrancan con "spawn": la app
+# tiene hilos vivos (history_refresher) y un fork copiaría sus cerrojos en
+# el estado en que estén.
+_PROCESS_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_PROCESS_POOLS_LOCK = threading.Lock()
+
+# Por debajo de estos trials por proceso repartir cuesta más que simular
+MIN_TRIALS_PER_WORKER = 2000
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool compartido de `workers` procesos (se crea la primera vez)."""
+    with _PROCESS_POOLS_LOCK:
+        pool = _PROCESS_POOLS.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _PROCESS_POOLS[workers] = pool
+        return pool
+
+
+def _discard_process_pool(workers: int, pool: ProcessPoolExecutor) -> None:
+    """Quita un pool roto (un proceso murió) para que el siguiente uso cree otro."""
+    with _PROCESS_POOLS_LOCK:
+        if _PROCESS_POOLS.get(workers) is pool:
+            del _PROCESS_POOLS[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _parallel_workers(workers: int, n_trials: int) -> int:
+    """Procesos que compensa usar: como mucho uno por MIN_TRIALS_PER_WORKER trials."""
+    return max(1, min(int(workers), int(n_trials) // MIN_TRIALS_PER_WORKER))
+
+
+# (pool de procesos, specs de los arrays del histórico en memoria compartida)
+WorkerPool = Tuple[ProcessPoolExecutor, List[Tuple[str, Tuple[int, ...], str]]]
+
+
+@contextmanager
+def _worker_pool(arrays: List[np.ndarray], workers: int) -> Iterator[Optional[WorkerPool]]:
+    """
+    Pool compartido de `workers` procesos (ver _process_pool) con los arrays
+    del histórico copiados una vez a memoria compartida para esta
+    simulación. Con workers == 1 no usa nada (None).
+    """
+    if workers <= 1:
+        yield None
+        return
+
+    blocks = []
+    try:
+        specs = []
+        for arr in arrays:
+            shm, spec = _to_shared(arr)
+            blocks.append(shm)
+            specs.append(spec)
+
+        pool = _process_pool(workers)
+        try:
+            yield pool, specs
+        except BrokenProcessPool:
+            _discard_process_pool(workers, pool)
+            raise
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def _run_counts(
+    plans: List[List[Dict[str, Any]]],
+    arrays: List[np.ndarray],
+    ref_idx: np.ndarray,
+    seed_seqs: List[np.random.SeedSequence],
+    workers: int = 1,
+    pool: Optional[WorkerPool] = None,
+) -> List[np.ndarray]:
+    """
+    Ejecuta uno o varios planes (modos) contra los mismos sorteos de
+    referencia (filas de ref_idx) y devuelve un acumulador por plan.
+    Con workers > 1 reparte los trials de cada plan entre
+    procesos; cada trozo usa su propio stream (SeedSequence.spawn) y se
+    adjunta al histórico por memoria compartida en lugar de recibirlo
+    serializado. Los recuentos se suman en orden fijo → reproducibles.
+
+    `pool` (ver `_worker_pool`) permite reutilizar procesos y memoria
+    compartida entre llamadas; sin él se crean solo para esta.
+    """
+    chunks = np.array_split(ref_idx, workers)
+    streams = [seq.spawn(workers) for seq in seed_seqs]
+
+    if workers == 1:
+        return [
+            _simulate_counts(plan, *arrays, ref_idx, np.random.default_rng(s[0]))
+            for plan, s in zip(plans, streams)
+        ]
+
+    if pool is None:
+        with _worker_pool(arrays, workers) as own_pool:
+            return _run_counts(plans, arrays, ref_idx, seed_seqs, workers, own_pool)
+
+    executor, specs = pool
+    futures = [
+        [
+            executor.submit(_simulate_chunk_shared, plan, specs, chunk, stream)
+            for chunk, stream in zip(chunks, plan_streams)
+        ]
+        for plan, plan_streams in zip(plans, streams)
+    ]
+    return [sum(f.result() for f in plan_futures) for plan_futures in futures]
+
+
+def _empty_result() -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    empty = pd.DataFrame(columns=DIST_COLUMNS)
+    return empty, _summary_from_dist(empty)
+
+
 def simulate_strategy(
     mode: str,
     df_hist: pd.DataFrame,
@@ -53,73 +422,264 @@ def simulate_strategy(
     lines_A: int = 5,
     lines_B: int = 5,
     lines_C: int = 5,
+    seed: int | None = None,
+    workers: int = 1,
+    target_half_width: float | None = None,
+    progress: Callable[[Dict[str, Any]], None] | None = None,
+    batch_trials: int = 250,
+    sampling: str = "random",
 ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
     """
     Simula muchos sorteos hipotéticos con un modo dado.
 
+    Todo va en arrays: se generan los bloques de golpe, se eligen los
+    sorteos de referencia con una sola llamada y los aciertos salen de
+    popcount sobre matrices (trials × líneas).
+
+    Con workers > 1 los trials se reparten entre varios procesos (un pool
+    que se reutiliza entre llamadas; como mucho un proceso por
+    MIN_TRIALS_PER_WORKER trials). Para un mismo (seed, workers, n_trials)
+    el resultado es idéntico bit a bit.
+
+    `sampling` elige cómo se asignan sorteos de referencia a cada bloque
+    (ver REF_SAMPLING y `_reference_indices`); n_trials es siempre el nº
+    de bloques generados y summary["effective_lines"] dice cuánta
+    precisión han dado.
+
+    Con target_half_width o progress se simula por lotes (ver
+    `iter_simulation`): n_trials pasa a ser el máximo, se para en cuanto
+    los IC 95 % de P(≥3) y P(premio) bajan del semiancho pedido y
+    `progress` recibe cada estimación parcial. Ese camino no usa caché.
+
     Devuelve:
       - dist_df: distribución de (aciertos_numeros, aciertos_estrellas)
       - summary: métricas agregadas (P(≥3 números), P(al menos premio), etc.)
     """
-    if df_hist.empty:
-        empty = pd.DataFrame(
-            columns=["aciertos_numeros", "aciertos_estrellas", "veces", "prob", "prob_%"]
-        )
-        return empty, _summary_from_dist(empty)
-
-    df_sorted = df_hist.sort_values("date")
-    draws = df_sorted[["n1", "n2", "n3", "n4", "n5", "s1", "s2"]].to_numpy()
-    n_draws = len(draws)
-
-    results = []
-
-    for _ in range(int(n_trials)):
-        # Elegimos un sorteo real al azar como "oficial"
-        idx = np.random.randint(0, n_draws)
-        row = draws[idx]
-        nums_draw = set(row[:5])
-        stars_draw = set(row[5:])
-
-        # Generamos un bloque A/B/C con el modo elegido
-        block = generate_block(
-            mode=mode,
-            df_hist=df_hist,
+    if target_half_width is not None or progress is not None:
+        partial: Dict[str, Any] = {}
+        for partial in iter_simulation(
+            mode,
+            df_hist,
+            max_trials=n_trials,
             lines_A=lines_A,
             lines_B=lines_B,
             lines_C=lines_C,
-        )
+            seed=seed,
+            workers=workers,
+            batch_trials=batch_trials,
+            target_half_width=target_half_width,
+            sampling=sampling,
+        ):
+            if progress is not None:
+                progress(partial)
+        if not partial:
+            return _empty_result()
+        return partial["dist"], partial["summary"]
+
+    results = compare_strategies(
+        [mode], df_hist, n_trials, lines_A, lines_B, lines_C, seed, workers, sampling
+    )
+    return results[mode]
+
+
+def iter_simulation(
+    mode: str,
+    df_hist: pd.DataFrame,
+    max_trials: int = 5000,
+    lines_A: int = 5,
+    lines_B: int = 5,
+    lines_C: int = 5,
+    seed: int | None = None,
+    workers: int = 1,
+    batch_trials: int = 250,
+    target_half_width: float | None = None,
+    sampling: str = "random",
+) -> Iterator[Dict[str, Any]]:
+    """
+    Simulación por lotes de `batch_trials` trials. Tras cada lote produce
+    un dict con la estimación acumulada:
 
-        for line in block:
-            nums = set(line["nums"])
-            stars = set(line["stars"])
-            hits_nums = len(nums & nums_draw)
-            hits_stars = len(stars & stars_draw)
-            results.append(
-                {
-                    "aciertos_numeros": hits_nums,
-                    "aciertos_estrellas": hits_stars,
-                }
+      - trials, max_trials
+      - dist, summary (incluye los semianchos IC 95 % *_ci)
+      - converged: True si ambos semianchos ≤ target_half_width
+
+    Se detiene al converger o al llegar a max_trials. Para una misma
+    (seed, batch_trials, workers) la secuencia es reproducible.
+    """
+    max_trials = int(max_trials)
+    batch_trials = max(1, int(batch_trials))
+    if df_hist.empty or max_trials <= 0:
+        return
+
+    arrays = _history_arrays(df_hist)
+    plan = _block_plan(mode, df_hist, lines_A, lines_B, lines_C)
+    if sum(item["n_lines"] for item in plan) == 0:
+        return
+
+    eras = _draw_eras(df_hist)
+    seq_ref, seq_mode = np.random.SeedSequence(seed).spawn(2)
+    rng_ref = np.random.default_rng(seq_ref)
+    acc = np.zeros(_ACC_SIZE, dtype=float)
+    done = 0
+
+    # Procesos y memoria compartida una sola vez para todos los lotes
+    workers = _parallel_workers(workers, min(batch_trials, max_trials))
+    with _worker_pool(arrays, workers) as pool:
+        while done < max_trials:
+            size = min(batch_trials, max_trials - done)
+            ref_idx = _reference_indices(sampling, size, eras, rng_ref)
+            batch_workers = max(1, min(workers, size))
+            (batch_acc,) = _run_counts(
+                [plan], arrays, ref_idx, seq_mode.spawn(1), batch_workers, pool
             )
+            acc += batch_acc
+            done += size
 
-    if not results:
-        empty = pd.DataFrame(
-            columns=["aciertos_numeros", "aciertos_estrellas", "veces", "prob", "prob_%"]
-        )
-        return empty, _summary_from_dist(empty)
+            dist = _dist_from_counts(acc[:18].reshape(6, 3).astype(np.int64))
+            summary = _summary_from_dist(dist, acc[18:])
+            converged = target_half_width is not None and (
+                max(summary["p_ge3_nums_ci"], summary["p_any_prize_ci"]) <= target_half_width
+            )
+            yield {
+                "trials": done,
+                "max_trials": max_trials,
+                "dist": dist,
+                "summary": summary,
+                "converged": converged,
+            }
+            if converged:
+                return
 
-    df_res = pd.DataFrame(results)
 
-    dist = (
-        df_res.groupby(["aciertos_numeros", "aciertos_estrellas"])
-        .size()
-        .reset_index(name="veces")
-        .sort_values(["aciertos_numeros", "aciertos_estrellas"])
-        .reset_index(drop=True)
+def _compare(
+    modes: List[str],
+    df_hist: pd.DataFrame,
+    n_trials: int,
+    lines_A: int,
+    lines_B: int,
+    lines_C: int,
+    seed: int | None,
+    workers: int,
+    sampling: str = "random",
+) -> np.ndarray:
+    """Acumulador de cada modo: array (len(modes), _ACC_SIZE)."""
+    n_trials = int(n_trials)
+    workers = _parallel_workers(workers, n_trials)
+    if df_hist.empty or n_trials <= 0:
+        return np.zeros((len(modes), _ACC_SIZE), dtype=float)
+
+    # Histórico (sorteos + anti-clon) preparado una sola vez para todos los modos
+    arrays = _history_arrays(df_hist)
+
+    # Números aleatorios comunes: los mismos sorteos de referencia para todos
+    seq_ref, *seq_modes = np.random.SeedSequence(seed).spawn(len(modes) + 1)
+    ref_idx = _reference_indices(
+        sampling, n_trials, _draw_eras(df_hist), np.random.default_rng(seq_ref)
     )
 
-    total_lines = float(df_res.shape[0])
-    dist["prob"] = dist["veces"] / total_lines
-    dist["prob_%"] = dist["prob"] * 100
+    plans = [_block_plan(m, df_hist, lines_A, lines_B, lines_C) for m in modes]
+    return np.stack(_run_counts(plans, arrays, ref_idx, seq_modes, workers))
+
+
+def _results_from_counts(
+    modes: List[str],
+    all_acc: np.ndarray,
+) -> Dict[str, Tuple[pd.DataFrame, Dict[str, Any]]]:
+    results = {}
+    for mode, acc in zip(modes, all_acc):
+        counts = acc[:18].reshape(6, 3).astype(np.int64)
+        if counts.sum() == 0:
+            results[mode] = _empty_result()
+            continue
+        dist = _dist_from_counts(counts)
+        results[mode] = (dist, _summary_from_dist(dist, acc[18:]))
+    return results
+
+
+def _copy_results(
+    results: Dict[str, Tuple[pd.DataFrame, Dict[str, Any]]],
+) -> Dict[str, Tuple[pd.DataFrame, Dict[str, Any]]]:
+    """Copia de {modo: (dist_df, summary)} para no entregar los objetos cacheados."""
+    return {mode: (dist.copy(), dict(summary)) for mode, (dist, summary) in results.items()}
+
+
+# Caché en memoria de comparaciones: (parámetros, versión del histórico) → resultado
+_COMPARE_CACHE: "OrderedDict[Tuple[Any, ...], Dict[str, Tuple[pd.DataFrame, Dict[str, Any]]]]" = OrderedDict()
+_COMPARE_CACHE_SIZE = 32
+# Las OrderedDict se reordenan al leer: todo acceso va bajo este cerrojo
+_COMPARE_CACHE_LOCK = threading.Lock()
+
+
+def compare_strategies(
+    modes: List[str],
+    df_hist: pd.DataFrame,
+    n_trials: int = 1000,
+    lines_A: int = 5,
+    lines_B: int = 5,
+    lines_C: int = 5,
+    seed: int | None = None,
+    workers: int = 1,
+    sampling: str = "random",
+) -> Dict[str, Tuple[pd.DataFrame, Dict[str, Any]]]:
+    """
+    Simula varios modos a la vez y devuelve {modo: (dist_df, summary)}.
+
+    - El histórico (bitmasks y anti-clon) se prepara una sola vez.
+    - Todos los modos se evalúan contra los MISMOS sorteos de referencia
+      (números aleatorios comunes), lo que reduce la varianza de la
+      comparación entre ellos.
+    - Con semilla fija el resultado se cachea por parámetros + versión del
+      histórico, así que un rerun de Streamlit por otro widget no repite la
+      simulación; se guarda además en disco (app.result_cache), para que
+      sobreviva a reinicios y se comparta entre sesiones. Sin semilla
+      (aleatoria) cada llamada simula de nuevo.
+    - Devuelve copias: modificar el resultado no altera la caché.
+    """
+    params = {
+        "modes": list(modes),
+        "n_trials": int(n_trials),
+        "lines_A": int(lines_A),
+        "lines_B": int(lines_B),
+        "lines_C": int(lines_C),
+        "seed": seed,
+        "workers": int(workers),
+        "sampling": sampling,
+    }
+    version = history_version(df_hist)
+    key = (
+        tuple(modes),
+        int(n_trials),
+        int(lines_A),
+        int(lines_B),
+        int(lines_C),
+        seed,
+        int(workers),
+        sampling,
+        version,
+    )
+    # Sin semilla el resultado no es reproducible: ni caché en memoria ni en disco
+    if seed is None:
+        all_acc = _compare(
+            list(modes), df_hist, n_trials, lines_A, lines_B, lines_C, seed, workers, sampling
+        )
+        return _results_from_counts(list(modes), all_acc)
+
+    with _COMPARE_CACHE_LOCK:
+        if key in _COMPARE_CACHE:
+            _COMPARE_CACHE.move_to_end(key)
+            return _copy_results(_COMPARE_CACHE[key])
+
+    disk_key = cache_key("mc", params, version)
+    all_acc = load_counts(disk_key)
+    if all_acc is None or all_acc.shape != (len(modes), _ACC_SIZE):
+        all_acc = _compare(
+            list(modes), df_hist, n_trials, lines_A, lines_B, lines_C, seed, workers, sampling
+        )
+        save_counts(disk_key, all_acc)
 
-    summary = _summary_from_dist(dist)
-    return dist, summary
\ No newline at end of file
+    results = _results_from_counts(list(modes), all_acc)
+    with _COMPARE_CACHE_LOCK:
+        _COMPARE_CACHE[key] = results
+        while len(_COMPARE_CACHE) > _COMPARE_CACHE_SIZE:
+            _COMPARE_CACHE.popitem(last=False)
+    return _copy_results(results)
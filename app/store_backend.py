@@ -0,0 +1,38 @@
+# app/store_backend.py
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from types import ModuleType
+from typing import Optional
+
+# Backend del store de combinaciones guardadas. Los dos módulos tienen la
+# misma API (save_block, load_last_n, load_all, last_id, store_signature,
+# load_saved_index):
+#   - "csv":    app.combinations_store (por defecto)
+#   - "sqlite": app.combinations_db (migrar antes con
+#               scripts/migrate_combinations_db.py)
+# Se elige con la variable de entorno EUROMILLONES_STORE.
+BACKENDS = ("csv", "sqlite")
+STORE_BACKEND = os.environ.get("EUROMILLONES_STORE", "csv").strip().lower()
+
+
+def get_store(backend: Optional[str] = None) -> ModuleType:
+    """Módulo del backend indicado (por defecto, STORE_BACKEND)."""
+    backend = STORE_BACKEND if backend is None else backend
+    if backend == "csv":
+        from app import combinations_store
+
+        return combinations_store
+    if backend == "sqlite":
+        from app import combinations_db
+
+        return combinations_db
+    raise ValueError(f"Backend de combinaciones desconocido: {backend!r} (usa {BACKENDS})")
+
+
+def store_path(backend: Optional[str] = None) -> Path:
+    """Fichero donde guarda el backend (para mostrarlo en la app)."""
+    backend = STORE_BACKEND if backend is None else backend
+    store = get_store(backend)
+    return store.DB_PATH if backend == "sqlite" else store.STORE_PATH
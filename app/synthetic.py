@@ -0,0 +1,155 @@
+# app/synthetic.py
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.codec import encode_numbers, encode_stars, popcount
+from app.data_loader import history_version
+from app.exact_odds import N_STAR_PAIRS, STAR_PAIRS, quintet_masks
+from app.feature_store import N_QUINTETS
+from app.generator import _block_plan, _sample_blocks
+from app.result_cache import cache_key, load_counts, save_counts
+from app.simulator import (
+    _ACC_SIZE,
+    _PRIZE_FLAT,
+    _dist_from_counts,
+    _empty_result,
+    _history_arrays,
+    _summary_from_dist,
+)
+
+_STAR_PAIR_MASKS = encode_stars(STAR_PAIRS)
+
+
+def _score_synthetic(
+    block_num_masks: np.ndarray,
+    block_star_masks: np.ndarray,
+    n_draws: int,
+    rng: np.random.Generator,
+    chunk_size: int,
+    progress: Callable[[Dict[str, Any]], None] | None,
+) -> np.ndarray:
+    """
+    Genera n_draws sorteos uniformes por trozos y puntúa cada uno contra un
+    bloque (en rotación). Memoria constante: solo se guarda el acumulador.
+    """
+    masks = quintet_masks()
+    n_blocks = len(block_num_masks)
+    acc = np.zeros(_ACC_SIZE, dtype=float)
+    done = 0
+
+    while done < n_draws:
+        size = min(chunk_size, n_draws - done)
+        # Sorteo uniforme = quinteta por rango uniforme + pareja de estrellas
+        draw_nums = masks[rng.integers(0, N_QUINTETS, size=size)]
+        draw_stars = _STAR_PAIR_MASKS[rng.integers(0, N_STAR_PAIRS, size=size)]
+        block_idx = (done + np.arange(size)) % n_blocks
+
+        hits_nums = popcount(block_num_masks[block_idx] & draw_nums[:, None])
+        hits_stars = popcount(block_star_masks[block_idx] & draw_stars[:, None])
+        codes = hits_nums.astype(np.intp) * 3 + hits_stars
+
+        x_ge3 = (hits_nums >= 3).mean(axis=1)
+        x_prize = _PRIZE_FLAT[codes].mean(axis=1)
+        acc[:18] += np.bincount(codes.ravel(), minlength=18)
+        acc[18:] += [
+            size,
+            x_ge3.sum(),
+            (x_ge3 * x_ge3).sum(),
+            x_prize.sum(),
+            (x_prize * x_prize).sum(),
+        ]
+        done += size
+
+        if progress is not None:
+            progress({"draws": done, "max_draws": n_draws})
+
+    return acc
+
+
+def simulate_synthetic(
+    mode: str,
+    df_hist: pd.DataFrame,
+    n_draws: int = 10_000_000,
+    lines_A: int = 5,
+    lines_B: int = 5,
+    lines_C: int = 5,
+    n_blocks: int = 1000,
+    seed: int | None = None,
+    chunk_size: int = 250_000,
+    progress: Callable[[Dict[str, Any]], None] | None = None,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Simulación contra sorteos SINTÉTICOS uniformes en lugar de los reales.
+
+    - Se generan de antemano `n_blocks` bloques del modo (con el anti-clon
+      del histórico, como siempre).
+    - Se sacan `n_draws` sorteos oficiales uniformes por trozos de
+      `chunk_size`: rango de quinteta uniforme → bitmask precalculada y
+      pareja de estrellas uniforme entre las 66.
+    - Cada sorteo se puntúa contra un bloque (en rotación) con popcount y
+      los aciertos se agregan con bincount: la memoria no crece con n_draws.
+
+    Devuelve (dist_df, summary) como simulate_strategy, con "synthetic_draws"
+    y "blocks" en summary. El IC trata cada sorteo como independiente
+    (los bloques se reutilizan, así que es algo optimista).
+    Con semilla fija el resultado se guarda en la caché de disco.
+    """
+    n_draws = int(n_draws)
+    n_blocks = max(1, min(int(n_blocks), max(n_draws, 1)))
+    if n_draws <= 0:
+        return _empty_result()
+
+    disk_key = None
+    if seed is not None:
+        params = {
+            "mode": mode,
+            "n_draws": n_draws,
+            "lines_A": int(lines_A),
+            "lines_B": int(lines_B),
+            "lines_C": int(lines_C),
+            "n_blocks": n_blocks,
+            "seed": seed,
+            "chunk_size": int(chunk_size),
+        }
+        disk_key = cache_key("synthetic", params, history_version(df_hist))
+        cached = load_counts(disk_key)
+        if cached is not None and cached.shape == (_ACC_SIZE,):
+            return _synthetic_result(cached, n_draws, n_blocks)
+
+    seq_blocks, seq_draws = np.random.SeedSequence(seed).spawn(2)
+
+    plan = _block_plan(mode, df_hist, lines_A, lines_B, lines_C)
+    if sum(item["n_lines"] for item in plan) == 0:
+        return _empty_result()
+    _, _, seen_number_keys, seen_full_keys = _history_arrays(df_hist)
+    nums, stars = _sample_blocks(
+        plan, seen_number_keys, seen_full_keys, n_blocks, np.random.default_rng(seq_blocks)
+    )
+
+    acc = _score_synthetic(
+        encode_numbers(nums),
+        encode_stars(stars),
+        n_draws,
+        np.random.default_rng(seq_draws),
+        max(1, int(chunk_size)),
+        progress,
+    )
+    if disk_key:
+        save_counts(disk_key, acc)
+    return _synthetic_result(acc, n_draws, n_blocks)
+
+
+def _synthetic_result(
+    acc: np.ndarray,
+    n_draws: int,
+    n_blocks: int,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    dist = _dist_from_counts(acc[:18].reshape(6, 3).astype(np.int64))
+    summary = _summary_from_dist(dist, acc[18:])
+    summary["synthetic_draws"] = n_draws
+    summary["blocks"] = n_blocks
+    return dist, summary
@@ -1,14 +1,52 @@
 # app/updater.py
+import email.utils
+import hashlib
+import io
+import json
+import os
+import time
+import warnings
 from pathlib import Path
-from datetime import date
-from typing import Optional
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
 
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+
+from app.file_io import file_lock, tail_lines
+from app.generator import _seen_index_append
+from app.hit_ledger import ledger_append_draws
 
 DATA_PATH = Path(__file__).resolve().parents[1] / "data" / "historico_euromillones.csv"
+HISTORY_LOCK_PATH = DATA_PATH.with_suffix(".lock")
+
+# Cabecera del esquema estándar: solo un CSV así se amplía añadiendo filas
+HISTORY_COLUMNS = ["date", "n1", "n2", "n3", "n4", "n5", "s1", "s2"]
 API_URL = "https://euromillions.api.pedromealha.dev/v1/draws"
 
+# Respuestas de la API con su ETag / Last-Modified (peticiones condicionales)
+API_CACHE_DIR = DATA_PATH.parent / "cache" / "api"
+
+# Reintentos ante 429 / 5xx / errores de red: espera Retry-After si la API lo
+# manda y, si no, BACKOFF_BASE * 2^intento (como mucho MAX_BACKOFF segundos)
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+MAX_BACKOFF = 30.0
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+REQUEST_TIMEOUT = 10
+
+
+class ApiRateLimited(RuntimeError):
+    """La API sigue devolviendo 429 tras los reintentos (retry_after en segundos, si lo dio)."""
+
+    def __init__(self, retry_after: Optional[float] = None):
+        self.retry_after = retry_after
+        super().__init__(
+            "La API externa ha devuelto 429 (Too Many Requests)"
+            + (f"; reintentar en {retry_after:.0f} s" if retry_after is not None else "")
+        )
+
 
 # ------------ Utilidades de normalización ------------
 
@@ -93,27 +131,246 @@ def _load_local_normalized() -> pd.DataFrame:
     return _normalize_local_df(df_raw)
 
 
-def _get_last_local_date() -> Optional[date]:
-    df_local = _load_local_normalized()
-    if df_local.empty:
+def _is_standard_history() -> bool:
+    """True si el CSV existe y su cabecera es exactamente date,n1..n5,s1,s2."""
+    try:
+        with open(DATA_PATH, "r", encoding="utf-8") as f:
+            return f.readline().strip().split(",") == HISTORY_COLUMNS
+    except OSError:
+        return False
+
+
+def _load_local_tail(n: int = 5) -> pd.DataFrame:
+    """
+    Últimas n filas del CSV local, normalizadas. En un CSV estándar se leen
+    desde el final del fichero (sin parsear el resto); si no, se carga entero.
+    """
+    if not DATA_PATH.exists():
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    if not _is_standard_history():
+        return _load_local_normalized().tail(n)
+
+    header, body = tail_lines(DATA_PATH, n)
+    if not body:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    return _normalize_local_df(pd.read_csv(io.BytesIO(header + body)))
+
+
+def _get_last_local_date(df_tail: Optional[pd.DataFrame] = None) -> Optional[date]:
+    df_tail = _load_local_tail() if df_tail is None else df_tail
+    if df_tail.empty:
         return None
-    return df_local["date"].max().date()
+    return df_tail["date"].max().date()
+
+
+def _append_history_rows(df_new: pd.DataFrame) -> None:
+    """
+    Añade filas al final del CSV estándar con una sola escritura + fsync.
+    Si la escritura falla a medias, el fichero se trunca a su tamaño previo.
+    """
+    payload = df_new[HISTORY_COLUMNS].to_csv(
+        index=False, header=False, date_format="%Y-%m-%d"
+    ).encode("utf-8")
+
+    with open(DATA_PATH, "ab+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                payload = b"\n" + payload
+        try:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(size)
+            raise
+
+
+def _rewrite_history(df_new: pd.DataFrame) -> None:
+    """
+    CSV ausente o en otro formato: se reescribe entero (y de forma atómica)
+    en el esquema estándar, que a partir de ahí ya admite añadir filas.
+    """
+    combined = pd.concat([_load_local_normalized(), df_new], ignore_index=True)
+    combined = (
+        combined.drop_duplicates(subset=HISTORY_COLUMNS, keep="first")
+        .sort_values("date")
+        .reset_index(drop=True)
+    )
+
+    DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = DATA_PATH.with_suffix(".tmp.csv")
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        combined.to_csv(f, index=False, date_format="%Y-%m-%d")
+        f.flush()
+        os.fsync(f.fileno())
+    tmp_path.replace(DATA_PATH)
+
+
+# ------------ Eventos de cambio del histórico ------------
+
+_HISTORY_LISTENERS: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def on_history_change(listener: Callable[[Dict[str, Any]], None]) -> Callable[[Dict[str, Any]], None]:
+    """
+    Suscribe listener(event) a los sorteos que se añadan al histórico, para
+    que cada caché se amplíe en vez de recalcularse. event:
+      - added: sorteos añadidos (date, n1..n5, s1, s2), en orden de fecha
+      - previous_tail: últimas filas del histórico antes de añadirlos
+    """
+    if listener not in _HISTORY_LISTENERS:
+        _HISTORY_LISTENERS.append(listener)
+    return listener
+
+
+def _emit_history_change(event: Dict[str, Any]) -> None:
+    # El CSV ya está escrito: un listener que falle no deshace la
+    # actualización (las cachés derivadas se resincronizan al usarse)
+    for listener in list(_HISTORY_LISTENERS):
+        try:
+            listener(event)
+        except Exception as exc:  # noqa: BLE001
+            warnings.warn(f"Listener del histórico {listener!r} ha fallado: {exc}")
+
+
+# El índice anti-clon y el libro de aciertos solo añaden los sorteos nuevos
+on_history_change(lambda event: _seen_index_append(event["previous_tail"], event["added"]))
+on_history_change(lambda event: ledger_append_draws(event["added"]))
 
 
 # ------------ API externa ------------
 
-def _fetch_all_draws_from_api() -> pd.DataFrame:
+_SESSION: Optional[requests.Session] = None
+
+
+def _get_session() -> requests.Session:
+    """Sesión HTTP compartida (keep-alive y pool de conexiones)."""
+    global _SESSION
+    if _SESSION is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Accept"] = "application/json"
+        _SESSION = session
+    return _SESSION
+
+
+def _retry_after_seconds(resp: requests.Response) -> Optional[float]:
+    """Cabecera Retry-After en segundos (admite segundos o fecha HTTP)."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _backoff_seconds(attempt: int, retry_after: Optional[float]) -> float:
+    if retry_after is not None:
+        return retry_after
+    return min(MAX_BACKOFF, BACKOFF_BASE * 2**attempt)
+
+
+def _cache_path(url: str, params: Optional[Dict[str, Any]]) -> Path:
+    key = json.dumps([url, sorted((params or {}).items())])
+    return API_CACHE_DIR / f"{hashlib.sha1(key.encode()).hexdigest()[:20]}.json"
+
+
+def _load_cached(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store_cached(path: Path, entry: Dict[str, Any]) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        tmp_path.replace(path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _get_json(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    session: Optional[requests.Session] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Any:
     """
-    Descarga todos los sorteos desde la API externa y devuelve
-    un DataFrame YA normalizado a:
-    date, n1..n5, s1, s2
+    GET que devuelve el JSON de la respuesta:
+      - condicional (If-None-Match / If-Modified-Since) si hay una respuesta
+        guardada con ETag o Last-Modified; un 304 devuelve la guardada
+      - reintenta 429 / 5xx / errores de red con backoff exponencial,
+        respetando Retry-After; si la espera pedida pasa de MAX_BACKOFF o se
+        acaban los reintentos con 429, lanza ApiRateLimited
     """
-    resp = requests.get(API_URL, timeout=10)
-    resp.raise_for_status()
-    data = resp.json()
+    session = session or _get_session()
+    path = _cache_path(url, params)
+    cached = _load_cached(path)
+
+    headers = {}
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            resp = session.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+            sleep(_backoff_seconds(attempt, None))
+            continue
+
+        if resp.status_code == 304 and cached is not None:
+            return cached["body"]
+
+        if resp.status_code in _RETRY_STATUS:
+            retry_after = _retry_after_seconds(resp)
+            too_long = retry_after is not None and retry_after > MAX_BACKOFF
+            if attempt == MAX_RETRIES or too_long:
+                if resp.status_code == 429:
+                    raise ApiRateLimited(retry_after)
+                resp.raise_for_status()
+            sleep(_backoff_seconds(attempt, retry_after))
+            continue
+
+        resp.raise_for_status()
+        body = resp.json()
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if etag or last_modified:
+            _store_cached(path, {"etag": etag, "last_modified": last_modified, "body": body})
+        return body
+
+    raise RuntimeError("No se pudo contactar con la API externa")  # pragma: no cover
 
+
+def _draws_frame(data: Any) -> pd.DataFrame:
+    """
+    JSON de la API (lista de sorteos) → DataFrame YA normalizado a:
+    date, n1..n5, s1, s2
+    """
     rows = []
-    for d in data:
+    for d in data or []:
         date_str = d.get("date") or d.get("draw_date")
         if not date_str:
             continue
@@ -157,41 +414,93 @@ def _fetch_all_draws_from_api() -> pd.DataFrame:
     return df[["date", "n1", "n2", "n3", "n4", "n5", "s1", "s2"]]
 
 
+def _fetch_all_draws_from_api(
+    api_url: str = API_URL,
+    session: Optional[requests.Session] = None,
+) -> pd.DataFrame:
+    """Descarga todos los sorteos desde la API externa (date, n1..n5, s1, s2)."""
+    return _draws_frame(_get_json(api_url, session=session))
+
+
+def _honours_year_filter(df_year: pd.DataFrame, year: int) -> bool:
+    """
+    Comprobación explícita del filtro ?year=AAAA: la respuesta lo respeta
+    si todos sus sorteos son de ese año (o no trae ninguno). Una API que no
+    conoce el parámetro lo ignora y devuelve su lista sin filtrar, con
+    sorteos de otros años; eso NO se toma por el histórico completo: solo
+    se usan de ella los sorteos de los años pedidos.
+    """
+    return df_year.empty or bool((df_year["date"].dt.year == year).all())
+
+
+def _fetch_draws_since(
+    last_local: Optional[date],
+    api_url: str = API_URL,
+    session: Optional[requests.Session] = None,
+) -> pd.DataFrame:
+    """
+    Sorteos desde el año del último sorteo local, pidiendo solo esos años
+    (?year=AAAA). Si la API no aplica el filtro (ver _honours_year_filter),
+    se recorta aquí su respuesta a esos años y no se piden más.
+    """
+    if last_local is None:
+        return _fetch_all_draws_from_api(api_url, session)
+
+    frames = []
+    for year in range(last_local.year, date.today().year + 1):
+        df_year = _draws_frame(_get_json(api_url, params={"year": year}, session=session))
+        if not _honours_year_filter(df_year, year):
+            recent = df_year["date"].dt.year >= last_local.year
+            return df_year[recent].reset_index(drop=True)
+        frames.append(df_year)
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=["date", "n1", "n2", "n3", "n4", "n5", "s1", "s2"])
+    return pd.concat(frames, ignore_index=True).sort_values("date").reset_index(drop=True)
+
+
 # ------------ Función principal ------------
 
-def update_historico_from_api() -> int:
+def update_historico_from_api(
+    api_url: str = API_URL,
+    session: Optional[requests.Session] = None,
+) -> int:
     """
     Actualiza el CSV de histórico con los sorteos nuevos obtenidos desde la API.
     Trabaja siempre con el esquema: date, n1..n5, s1, s2.
+    Solo pide a la API los años desde el último sorteo local (ver
+    _fetch_draws_since); api_url y session se pueden inyectar (p. ej. un
+    servidor HTTP local).
+
+    Del CSV local solo se leen las últimas filas y los sorteos nuevos se
+    añaden al final (bajo cerrojo, una escritura + fsync); después se avisa
+    a los suscritos con on_history_change.
     Devuelve el número de sorteos añadidos.
     """
-    df_api = _fetch_all_draws_from_api()
+    df_api = _fetch_draws_since(_get_last_local_date(), api_url, session)
     if df_api.empty:
         return 0
 
-    df_local = _load_local_normalized()
-    last_local = _get_last_local_date()
-
-    if last_local is not None:
-        df_new = df_api[df_api["date"].dt.date > last_local].copy()
-    else:
-        df_new = df_api.copy()
-
-    if df_new.empty:
-        return 0
-
-    combined = pd.concat([df_local, df_new], ignore_index=True)
-
-    combined = (
-        combined.drop_duplicates(
-            subset=["date", "n1", "n2", "n3", "n4", "n5", "s1", "s2"],
-            keep="first",
+    with file_lock(HISTORY_LOCK_PATH):
+        # Se vuelve a mirar la cola ya con el cerrojo: otro proceso puede
+        # haber añadido sorteos mientras se consultaba la API
+        df_tail = _load_local_tail()
+        last_local = _get_last_local_date(df_tail)
+
+        df_new = df_api if last_local is None else df_api[df_api["date"].dt.date > last_local]
+        df_new = (
+            df_new.drop_duplicates(subset=HISTORY_COLUMNS, keep="first")
+            .sort_values("date")
+            .reset_index(drop=True)
         )
-        .sort_values("date")
-        .reset_index(drop=True)
-    )
+        if df_new.empty:
+            return 0
 
-    # Guardamos SIEMPRE en el esquema estándar: date,n1..n5,s1,s2
-    combined.to_csv(DATA_PATH, index=False)
+        if _is_standard_history():
+            _append_history_rows(df_new)
+        else:
+            _rewrite_history(df_new)
 
-    return len(df_new)
\ No newline at end of file
+    _emit_history_change({"added": df_new, "previous_tail": df_tail})
+    return len(df_new)
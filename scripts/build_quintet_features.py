@@ -0,0 +1,11 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.feature_store import N_QUINTETS, build_quintet_features
+
+t0 = time.time()
+out = build_quintet_features()
+print("Guardado:", out, "quintetas:", N_QUINTETS, f"({time.time() - t0:.1f} s)")
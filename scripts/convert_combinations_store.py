@@ -0,0 +1,14 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.combinations_store import STORE_PATH, convert_store
+
+t0 = time.time()
+converted = convert_store()
+if converted:
+    print(f"{STORE_PATH.name}: {converted} combinaciones convertidas ({time.time() - t0:.1f} s)")
+else:
+    print(f"{STORE_PATH.name}: ya está en el formato tipado (o no existe)")
@@ -0,0 +1,16 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.combinations_db import DB_PATH, count_lines, migrate_from_csv
+from app.combinations_store import STORE_PATH
+
+t0 = time.time()
+added = migrate_from_csv()
+print(
+    f"{STORE_PATH.name} → {DB_PATH.name}: {added} combinaciones añadidas, "
+    f"{count_lines()} en total ({time.time() - t0:.1f} s)"
+)
+print("Para usarla en la app: EUROMILLONES_STORE=sqlite streamlit run app.py")
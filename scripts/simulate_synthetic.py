@@ -0,0 +1,37 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.data_loader import load_raw_data
+from app.synthetic import simulate_synthetic
+
+parser = argparse.ArgumentParser(
+    description="Simula un modo contra sorteos sintéticos uniformes (sin Streamlit)."
+)
+parser.add_argument("--mode", default="Estándar")
+parser.add_argument("--draws", type=int, default=10_000_000)
+parser.add_argument("--lines", type=int, nargs=3, default=[5, 5, 5], metavar=("A", "B", "C"))
+parser.add_argument("--blocks", type=int, default=1000)
+parser.add_argument("--seed", type=int, default=None)
+args = parser.parse_args()
+
+t0 = time.time()
+dist, summary = simulate_synthetic(
+    args.mode,
+    load_raw_data(),
+    n_draws=args.draws,
+    lines_A=args.lines[0],
+    lines_B=args.lines[1],
+    lines_C=args.lines[2],
+    n_blocks=args.blocks,
+    seed=args.seed,
+    progress=lambda p: print(f"\r{p['draws']:,} / {p['max_draws']:,}", end="", file=sys.stderr),
+)
+print(file=sys.stderr)
+print(dist.to_string(index=False))
+for key, value in summary.items():
+    print(f"{key}: {value}")
+print(f"({time.time() - t0:.1f} s)")
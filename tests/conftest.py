@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# Los tests importan el paquete app desde la raíz del repositorio
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,86 @@
+# tests/test_combinations_store.py
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from app import combinations_store as cs
+from app.codec import encode_combos
+
+
+def _lines(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    nums = np.sort(np.stack([rng.choice(50, 5, replace=False) + 1 for _ in range(n)]), axis=1)
+    stars = np.sort(np.stack([rng.choice(12, 2, replace=False) + 1 for _ in range(n)]), axis=1)
+    return pd.DataFrame(np.hstack([nums, stars]), columns=cs.NUM_COLS + cs.STAR_COLS)
+
+
+def _all_keys(saved_index):
+    return np.union1d(saved_index["keys"], saved_index["recent"])
+
+
+def test_saves_append_segments_and_load_replays_them(tmp_path, monkeypatch):
+    monkeypatch.setattr(cs, "_SAVED_INDEX", {})
+    index_path = tmp_path / "store.index.npz"
+    rng = np.random.default_rng(0)
+    first = _lines(rng, 20)
+    saved = cs.load_saved_index((1, 1), index_path, lambda: first)
+    snapshot = index_path.stat().st_mtime_ns
+
+    blocks = [first]
+    for sig in range(2, 7):
+        block = _lines(rng, 15)
+        blocks.append(block)
+        cs._add_to_saved_index(saved, block, (sig, sig), index_path)
+        saved = cs._SAVED_INDEX
+
+    # Cada guardado es un segmento; la instantánea no se reescribe
+    assert sorted(cs._index_segment_paths(index_path)) == [1, 2, 3, 4, 5]
+    assert index_path.stat().st_mtime_ns == snapshot
+
+    # Otro proceso (sin índice en memoria) llega al mismo índice sin leer el store
+    monkeypatch.setattr(cs, "_SAVED_INDEX", {})
+    loaded = cs.load_saved_index((6, 6), index_path, lambda: None)
+    assert np.array_equal(_all_keys(loaded), _all_keys(saved))
+    assert np.array_equal(loaded["bitmap"], saved["bitmap"])
+
+    everything = pd.concat(blocks, ignore_index=True)
+    nums = everything[cs.NUM_COLS].to_numpy()
+    keys = encode_combos(nums, everything[cs.STAR_COLS].to_numpy())
+    assert cs.saved_lines_mask(loaded, nums, keys).all()
+
+
+def test_broken_segment_chain_rebuilds_from_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(cs, "_SAVED_INDEX", {})
+    index_path = tmp_path / "store.index.npz"
+    rng = np.random.default_rng(1)
+    first, second = _lines(rng, 10), _lines(rng, 10)
+    saved = cs.load_saved_index((1, 1), index_path, lambda: first)
+    cs._add_to_saved_index(saved, second, (2, 2), index_path)
+    cs._index_segment_paths(index_path)[1].unlink()
+
+    monkeypatch.setattr(cs, "_SAVED_INDEX", {})
+    both = pd.concat([first, second], ignore_index=True)
+    loaded = cs.load_saved_index((2, 2), index_path, lambda: both)
+    expected = encode_combos(both[cs.NUM_COLS].to_numpy(), both[cs.STAR_COLS].to_numpy())
+    assert np.array_equal(_all_keys(loaded), np.unique(expected))
+
+
+def test_many_segments_are_compacted_on_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(cs, "_SAVED_INDEX", {})
+    index_path = tmp_path / "store.index.npz"
+    rng = np.random.default_rng(2)
+    saved = cs.load_saved_index((0, 0), index_path, lambda: _lines(rng, 5))
+    n_saves = cs._MAX_INDEX_SEGMENTS + 1
+    for sig in range(1, n_saves + 1):
+        cs._add_to_saved_index(saved, _lines(rng, 3), (sig, sig), index_path)
+        saved = cs._SAVED_INDEX
+
+    monkeypatch.setattr(cs, "_SAVED_INDEX", {})
+    loaded = cs.load_saved_index((n_saves, n_saves), index_path, lambda: None)
+    assert cs._index_segment_paths(index_path) == {}
+    assert np.array_equal(_all_keys(loaded), _all_keys(saved))
+
+    # La instantánea compactada se carga sola
+    monkeypatch.setattr(cs, "_SAVED_INDEX", {})
+    again = cs.load_saved_index((n_saves, n_saves), index_path, lambda: None)
+    assert np.array_equal(_all_keys(again), _all_keys(saved))
@@ -0,0 +1,52 @@
+# tests/test_generator.py
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app import generator
+
+
+def _plan(n_lines: int):
+    return [
+        {
+            "n_lines": n_lines,
+            "w_main": np.ones(50),
+            "w_stars": np.ones(12),
+            "serie": "A",
+            "mode_name": "Estándar",
+        }
+    ]
+
+
+def _no_seen():
+    return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64)
+
+
+def test_sample_blocks_raises_when_duplicates_survive(monkeypatch):
+    # Siempre la misma línea: cada bloque de 3 tiene repetidas pase lo que pase
+    def same_line(n_lines, **kwargs):
+        return np.tile([1, 2, 3, 4, 5], (n_lines, 1)), np.tile([1, 2], (n_lines, 1))
+
+    monkeypatch.setattr(generator, "_sample_lines", same_line)
+    with pytest.raises(ValueError, match="repetidas"):
+        generator._sample_blocks(_plan(3), *_no_seen(), n_blocks=4, max_dedup_passes=3)
+
+
+def test_sample_blocks_resamples_duplicates(monkeypatch):
+    # La primera tanda trae repetidas; las siguientes son todas distintas
+    calls = []
+
+    def lines(n_lines, **kwargs):
+        calls.append(n_lines)
+        if len(calls) == 1:
+            return np.tile([1, 2, 3, 4, 5], (n_lines, 1)), np.tile([1, 2], (n_lines, 1))
+        nums = 10 + np.arange(n_lines)[:, None] + np.arange(5)
+        return nums, np.tile([3, 4], (n_lines, 1))
+
+    monkeypatch.setattr(generator, "_sample_lines", lines)
+    nums, stars = generator._sample_blocks(_plan(2), *_no_seen(), n_blocks=3)
+
+    keys = generator.encode_combos(nums, stars)
+    assert all(len(set(row)) == row.size for row in keys)
+    assert calls == [6, 3]
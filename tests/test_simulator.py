@@ -0,0 +1,64 @@
+# tests/test_simulator.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+import pytest
+
+from app import result_cache, simulator
+from app.data_loader import load_raw_data
+
+PARAMS = dict(n_trials=200, lines_A=2, lines_B=2, lines_C=1)
+
+
+@pytest.fixture(scope="module")
+def df_hist():
+    df = load_raw_data()
+    if df.empty:
+        pytest.skip("sin histórico en data/")
+    return df
+
+
+@pytest.fixture
+def spies(tmp_path, monkeypatch):
+    """Caché en disco en tmp_path, caché en memoria vacía y registro de llamadas."""
+    monkeypatch.setattr(result_cache, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(simulator, "_COMPARE_CACHE", OrderedDict())
+    calls = {"compare": 0, "loads": []}
+    real_compare, real_load = simulator._compare, simulator.load_counts
+
+    def compare(*args: Any) -> np.ndarray:
+        calls["compare"] += 1
+        return real_compare(*args)
+
+    def load(key: str) -> np.ndarray | None:
+        counts = real_load(key)
+        calls["loads"].append(counts is not None)
+        return counts
+
+    monkeypatch.setattr(simulator, "_compare", compare)
+    monkeypatch.setattr(simulator, "load_counts", load)
+    return calls
+
+
+def test_second_call_with_same_seed_is_served_from_load_counts(df_hist, spies):
+    dist_1, summary_1 = simulator.simulate_strategy("Estándar", df_hist, seed=7, **PARAMS)
+    # Como otra sesión / otro proceso: sin la caché en memoria
+    simulator._COMPARE_CACHE.clear()
+    dist_2, summary_2 = simulator.simulate_strategy("Estándar", df_hist, seed=7, **PARAMS)
+
+    assert spies["compare"] == 1
+    assert spies["loads"] == [False, True]
+    assert dist_1.equals(dist_2)
+    assert summary_1 == summary_2
+
+
+def test_without_seed_disk_cache_is_not_used(df_hist, spies):
+    for _ in range(2):
+        simulator.simulate_strategy("Estándar", df_hist, seed=None, **PARAMS)
+
+    assert spies["compare"] == 2
+    assert spies["loads"] == []
+    assert list(result_cache.CACHE_DIR.glob("*.npz")) == []
@@ -0,0 +1,174 @@
+# tests/test_updater.py
+from __future__ import annotations
+
+import json
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from app import updater
+
+# Respuesta del stub: (status, cabeceras, cuerpo JSON o None)
+Reply = Tuple[int, Dict[str, str], Any]
+
+
+# ---------- servidor HTTP de prueba ----------
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802 - nombre fijado por http.server
+        url = urlparse(self.path)
+        request = {"query": parse_qs(url.query), "headers": dict(self.headers)}
+        self.server.requests.append(request)
+        status, headers, body = self.server.reply(request)
+
+        payload = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """
+    Servidor HTTP local que contesta con api.reply(request) y apunta las
+    peticiones en api.requests. La caché de respuestas va a tmp_path.
+    """
+    monkeypatch.setattr(updater, "API_CACHE_DIR", tmp_path / "api")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.requests = []
+    server.reply = lambda request: (200, {}, [])
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1/draws"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def session():
+    with requests.Session() as s:
+        yield s
+
+
+def _draw(day: str, first: int = 1) -> Dict[str, Any]:
+    return {"date": day, "numbers": list(range(first, first + 5)), "stars": [1, 2]}
+
+
+def _scripted(replies: List[Reply]) -> Callable[[Dict[str, Any]], Reply]:
+    """Contesta por orden con replies (la última se repite)."""
+    def reply(request: Dict[str, Any]) -> Reply:
+        return replies.pop(0) if len(replies) > 1 else replies[0]
+    return reply
+
+
+# ---------- filtro por año en _fetch_draws_since ----------
+
+THIS_YEAR = date.today().year
+DRAWS_BY_YEAR = {
+    year: [_draw(f"{year}-01-03"), _draw(f"{year}-06-13", first=10)]
+    for year in range(THIS_YEAR - 2, THIS_YEAR + 1)
+}
+ALL_DRAWS = [d for year in sorted(DRAWS_BY_YEAR) for d in DRAWS_BY_YEAR[year]]
+
+
+def test_fetch_draws_since_requests_only_years_from_last_local(api, session):
+    api.reply = lambda request: (200, {}, DRAWS_BY_YEAR[int(request["query"]["year"][0])])
+
+    df = updater._fetch_draws_since(date(THIS_YEAR - 1, 2, 1), api.url, session)
+
+    assert [r["query"]["year"] for r in api.requests] == [[str(THIS_YEAR - 1)], [str(THIS_YEAR)]]
+    assert sorted(set(df["date"].dt.year)) == [THIS_YEAR - 1, THIS_YEAR]
+    assert df["date"].is_monotonic_increasing
+
+
+def test_fetch_draws_since_trims_response_when_filter_is_ignored(api, session):
+    api.reply = lambda request: (200, {}, ALL_DRAWS)
+
+    df = updater._fetch_draws_since(date(THIS_YEAR - 1, 2, 1), api.url, session)
+
+    assert len(api.requests) == 1
+    assert sorted(set(df["date"].dt.year)) == [THIS_YEAR - 1, THIS_YEAR]
+
+
+def test_honours_year_filter():
+    df = updater._draws_frame(DRAWS_BY_YEAR[THIS_YEAR])
+    assert updater._honours_year_filter(df, THIS_YEAR)
+    assert not updater._honours_year_filter(df, THIS_YEAR - 1)
+    assert updater._honours_year_filter(updater._draws_frame([]), THIS_YEAR)
+
+
+# ---------- peticiones condicionales ----------
+
+def test_revalidation_with_etag_and_last_modified_returns_cached_body_on_304(api, session):
+    validators = {"ETag": '"v1"', "Last-Modified": "Tue, 13 Oct 2026 20:00:00 GMT"}
+    api.reply = _scripted([(200, validators, ALL_DRAWS), (304, {}, None)])
+
+    first = updater._get_json(api.url, session=session)
+    second = updater._get_json(api.url, session=session)
+
+    assert first == second == ALL_DRAWS
+    headers = api.requests[1]["headers"]
+    assert headers["If-None-Match"] == '"v1"'
+    assert headers["If-Modified-Since"] == validators["Last-Modified"]
+    assert "If-None-Match" not in api.requests[0]["headers"]
+
+
+# ---------- 429 y 5xx ----------
+
+def test_rate_limit_with_long_retry_after_raises_without_waiting(api, session):
+    api.reply = lambda request: (429, {"Retry-After": "120"}, None)
+    sleeps: List[float] = []
+
+    with pytest.raises(updater.ApiRateLimited) as exc:
+        updater._get_json(api.url, session=session, sleep=sleeps.append)
+
+    assert exc.value.retry_after == 120
+    assert len(api.requests) == 1
+    assert sleeps == []
+
+
+def test_rate_limit_retries_then_raises(api, session):
+    api.reply = lambda request: (429, {"Retry-After": "2"}, None)
+    sleeps: List[float] = []
+
+    with pytest.raises(updater.ApiRateLimited) as exc:
+        updater._get_json(api.url, session=session, sleep=sleeps.append)
+
+    assert exc.value.retry_after == 2
+    assert len(api.requests) == updater.MAX_RETRIES + 1
+    assert sleeps == [2.0] * updater.MAX_RETRIES
+
+
+def test_server_errors_back_off_exponentially(api, session):
+    api.reply = _scripted([(503, {}, None), (503, {}, None), (200, {}, ALL_DRAWS)])
+    sleeps: List[float] = []
+
+    body = updater._get_json(api.url, session=session, sleep=sleeps.append)
+
+    assert body == ALL_DRAWS
+    assert sleeps == [updater.BACKOFF_BASE, updater.BACKOFF_BASE * 2]
+
+
+def test_server_errors_exhausted_raise_http_error(api, session):
+    api.reply = lambda request: (502, {}, None)
+    sleeps: List[float] = []
+
+    with pytest.raises(requests.HTTPError):
+        updater._get_json(api.url, session=session, sleep=sleeps.append)
+
+    assert sleeps == [min(updater.MAX_BACKOFF, updater.BACKOFF_BASE * 2**i) for i in range(updater.MAX_RETRIES)]